@@ -0,0 +1,98 @@
+"""
+Content-addressed storage for uploaded patient form files.
+
+Uploads arrive hashed by the handlers in dashboard.uploadhandlers. Forms whose
+files are byte-identical share one StoredBlob: the file is written once and each
+form's uploaded_file points at the same stored name. The blob's ref_count
+counts those forms; the PatientForm post_delete handler releases it, and the
+file is removed with its last reference.
+
+A form whose content matches an already analyzed form is flagged through
+duplicate_of and takes over its analysis instead of being queued again.
+"""
+import hashlib
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import PatientForm, StoredBlob
+
+
+def content_hash_of(uploaded_file, chunk_size=64 * 1024):
+    """Return the SHA-256 hex digest of uploaded_file, reusing the one computed during upload"""
+    content_hash = getattr(uploaded_file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks(chunk_size):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def store_upload(form, uploaded_file):
+    """Attach uploaded_file to an unsaved form, sharing the stored file of identical earlier uploads.
+
+    Call inside the transaction that saves the form, so the blob reference is
+    rolled back with it if the save fails. Returns True when the form still
+    needs analysis and False when it was copied from an identical analyzed form.
+    """
+    content_hash = content_hash_of(uploaded_file)
+    form.content_hash = content_hash
+    form.original_filename = os.path.basename(uploaded_file.name)
+    form.uploaded_file = acquire_blob(form, uploaded_file).file_name
+
+    original = PatientForm.objects.filter(content_hash=content_hash).order_by('uploaded_at', 'id').first()
+    if original is None:
+        return True
+    form.duplicate_of = original
+    if not original.processed:
+        return True
+    form.ai_decision = original.ai_decision
+    form.ai_feedback = f"Identical to form #{original.pk}. {original.ai_feedback or ''}".strip()
+    form.extracted_patient_name = original.extracted_patient_name
+    form.processed = True
+    return False
+
+
+def bulk_create_uploads(forms):
+    """Insert unsaved forms prepared by store_upload and return them in the same order.
+
+    store_upload only compares against forms already in the database, so
+    identical files within one batch are matched here: later copies are flagged
+    as duplicates of the first one and inserted after it, in a second INSERT
+    that only happens when the batch holds copies.
+    """
+    firsts = {}
+    originals = []
+    copies = []
+    for form in forms:
+        if form.duplicate_of_id is None and form.content_hash in firsts:
+            copies.append(form)
+        else:
+            firsts.setdefault(form.content_hash, form)
+            originals.append(form)
+    PatientForm.objects.bulk_create(originals)
+    for form in copies:
+        form.duplicate_of = firsts[form.content_hash]
+    PatientForm.objects.bulk_create(copies)
+    return forms
+
+
+def acquire_blob(form, uploaded_file):
+    """Take a reference to the blob holding form's content, writing uploaded_file to storage if it is new"""
+    content_hash = form.content_hash
+    if StoredBlob.objects.filter(content_hash=content_hash).update(ref_count=F('ref_count') + 1):
+        return StoredBlob.objects.get(content_hash=content_hash)
+
+    field = PatientForm._meta.get_field('uploaded_file')
+    name = field.storage.save(field.generate_filename(form, uploaded_file.name), uploaded_file)
+    try:
+        with transaction.atomic():
+            return StoredBlob.objects.create(
+                content_hash=content_hash, file_name=name, size=uploaded_file.size, ref_count=1
+            )
+    except IntegrityError:
+        # A concurrent upload stored the same content first; share its file instead
+        field.storage.delete(name)
+        return acquire_blob(form, uploaded_file)
@@ -0,0 +1,123 @@
+"""
+Resumable chunked uploads.
+
+A client starts an UploadSession, appends the file in chunks at explicit byte
+offsets, and completes the session once every byte has arrived. Chunks are
+streamed from the request straight into a file under settings.CHUNKED_UPLOAD_DIR,
+so worker memory stays bounded whatever the file size, and a client that lost
+its connection asks for the session's offset and resends only what is missing.
+Each chunk lands in a file of its own first and is appended to the session's
+file only by the request that wins the offset, so a retried chunk racing the
+original cannot overwrite bytes already counted as received.
+On completion the assembled file is handed to dashboard.blobs like any other
+upload.
+"""
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+
+# Largest chunk accepted by one append request
+MAX_CHUNK_SIZE = 5 * 1024 * 1024
+# Chunk size suggested to clients
+CHUNK_SIZE = 1024 * 1024
+# Bytes copied from the request to disk at a time
+COPY_BUFFER_SIZE = 64 * 1024
+# Sessions untouched for this long are abandoned and may be cleaned up
+SESSION_TTL = timedelta(days=1)
+
+
+class OffsetMismatch(Exception):
+    """The chunk does not start where the session's received data ends"""
+
+    def __init__(self, expected):
+        super().__init__(f'Expected a chunk at offset {expected}')
+        self.expected = expected
+
+
+class AssembledFile(File):
+    """The completed upload, moved rather than copied into place by FileSystemStorage"""
+
+    def __init__(self, session):
+        super().__init__(open(session_path(session), 'rb'), name=session.file_name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def session_path(session):
+    """Return the path of the file session's chunks are written to"""
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.pk}.part')
+
+
+def start_session(user, file_name, size, patient_name=''):
+    """Create an upload session and its empty file"""
+    session = UploadSession.objects.create(user=user, file_name=file_name, size=size, patient_name=patient_name)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(session_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session, stream, offset, length):
+    """Copy length bytes from stream into session's file at offset and return the new offset.
+
+    Raises OffsetMismatch when offset is not where the received data ends, and
+    ValueError when the chunk would run past the declared size or ends early.
+    """
+    if offset != session.received_bytes:
+        raise OffsetMismatch(session.received_bytes)
+    if offset + length > session.size:
+        raise ValueError('Chunk runs past the end of the file')
+
+    # Stream the chunk into a file of its own, so a losing request never touches the session's file
+    chunk_path = os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.pk}.{uuid.uuid4().hex}.chunk')
+    try:
+        written = 0
+        with open(chunk_path, 'wb') as chunk:
+            while written < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not data:
+                    break
+                chunk.write(data)
+                written += len(data)
+        if written < length:
+            raise ValueError('Chunk ended before its declared length')
+
+        with transaction.atomic():
+            # Only the request that started from the recorded offset may advance it; the row
+            # stays locked until the chunk is in place, and a failed append rolls the claim back
+            if not UploadSession.objects.filter(pk=session.pk, received_bytes=offset).update(
+                received_bytes=offset + written, updated_at=timezone.now()
+            ):
+                session.refresh_from_db(fields=['received_bytes'])
+                raise OffsetMismatch(session.received_bytes)
+            with open(session_path(session), 'r+b') as part, open(chunk_path, 'rb') as chunk:
+                part.seek(offset)
+                # Anything past the offset is left over from an interrupted append
+                part.truncate()
+                shutil.copyfileobj(chunk, part, COPY_BUFFER_SIZE)
+    finally:
+        os.remove(chunk_path)
+    session.received_bytes = offset + written
+    return session.received_bytes
+
+
+def discard_session_file(session):
+    """Remove session's part file if it is still there"""
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def expired_sessions(now=None):
+    """Return the unfinished sessions nobody has appended to within SESSION_TTL"""
+    cutoff = (now or timezone.now()) - SESSION_TTL
+    return UploadSession.objects.filter(patient_form__isnull=True, updated_at__lt=cutoff)
@@ -0,0 +1,135 @@
+"""
+Server-Sent Events feed of new messages and patient form status changes.
+
+The stream is an async generator served through ttsh/asgi.py, so an open
+connection costs a coroutine rather than a worker. It polls two cheap indexed
+queries, for messages by id and for the FormStatusEvent log by id, and pushes
+whatever is new.
+
+Every event id is a cursor covering both sources: "<message id>.<status event
+id>". A client that reconnects sends it back as Last-Event-ID, which EventSource
+does by itself, and the stream resumes after that point, so nothing is missed or
+sent twice.
+Streams end after MAX_STREAM_SECONDS and EventSource reconnects, so no
+connection lives forever. Under WSGI, which cannot hold a stream open cheaply,
+each connection sends one batch and ends. The client then reconnects after the
+retry delay, which turns the feed into polling.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.db.models import Exists, Max, OuterRef, Q
+
+from .models import FormStatusEvent, PatientForm
+from .status_events import latest_event_id
+
+POLL_INTERVAL = 2
+HEARTBEAT_INTERVAL = 15
+MAX_STREAM_SECONDS = 300
+RETRY_MILLISECONDS = 3000
+# Most events of each kind sent per poll; the rest follow on the next poll
+BATCH_LIMIT = 100
+
+TOPICS = ('messages', 'status')
+
+
+def encode_event_id(cursor):
+    """Encode a (message_id, status_event_id) cursor as an event id"""
+    return '.'.join(str(part) for part in cursor)
+
+
+def decode_event_id(event_id):
+    """Decode an event id produced by encode_event_id, returning None if it is malformed"""
+    try:
+        message_id, status_event_id = (int(part) for part in event_id.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return message_id, status_event_id
+
+
+def current_cursor():
+    """Return a cursor pointing just past the newest message and status event"""
+    from messaging.models import Message
+    last_message_id = Message.objects.aggregate(last=Max('id'))['last'] or 0
+    return last_message_id, latest_event_id()
+
+
+def visible_status_events(user, events):
+    """Limit status events to the forms user may see, as database_view and can_view_form_file do"""
+    role = getattr(getattr(user, 'profile', None), 'role', None)
+    if role is None or role == 'administrator':
+        return events
+    if role == 'screening_physician':
+        # Physicians see the pending queue: forms entering it while still pending, and every
+        # move out of it, so their list can drop forms decided elsewhere
+        return events.filter(Q(to_status='pending', form__status='pending') | Q(from_status='pending'))
+    return events.filter(form__uploaded_by=user)
+
+
+def fetch_events(user, cursor, topics=TOPICS, conversation_id=None):
+    """Return the events after cursor as (event type, event id, data) tuples, oldest first"""
+    from messaging.models import Conversation, Message
+    from messaging.services import message_payload
+    message_id, status_event_id = cursor
+    events = []
+
+    if 'messages' in topics:
+        # Checking membership per message keeps the walk in id order; joining the
+        # user's conversations would merge their id ranges through a sort
+        membership = Conversation.participants.through.objects.filter(
+            conversation_id=OuterRef('conversation_id'), user_id=user.id
+        )
+        messages = Message.objects.filter(Exists(membership), id__gt=message_id)
+        if conversation_id:
+            messages = messages.filter(conversation_id=conversation_id)
+        for message in messages.select_related('sender', 'physician_decision').order_by('id')[:BATCH_LIMIT]:
+            message_id = message.id
+            events.append(('message', (message_id, status_event_id), message_payload(message, user)))
+
+    if 'status' in topics:
+        status_events = visible_status_events(user, FormStatusEvent.objects.filter(id__gt=status_event_id))
+        status_events = status_events.select_related('form').only(
+            'id', 'to_status', 'created_at', 'form__id', 'form__status', 'form__ai_decision', 'form__processed'
+        )
+        for event in status_events.order_by('id')[:BATCH_LIMIT]:
+            status_event_id = event.id
+            events.append(('status', (message_id, status_event_id), {
+                'form_id': event.form.id,
+                'status': event.to_status,
+                'status_display': dict(PatientForm.STATUS_CHOICES).get(event.to_status, event.to_status),
+                'ai_decision': event.form.ai_decision,
+                'processed': event.form.processed,
+                'changed_at': event.created_at.isoformat(),
+            }))
+
+    # Each event's id covers everything sent before it, so resuming from any of them is safe
+    return [(event_type, encode_event_id(event_cursor), data) for event_type, event_cursor, data in events], \
+        (message_id, status_event_id)
+
+
+def format_event(event_type, event_id, data):
+    """Serialize one event in the text/event-stream format"""
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(user, cursor, topics=TOPICS, conversation_id=None, max_seconds=MAX_STREAM_SECONDS):
+    """Yield SSE frames for user's new events until max_seconds have passed"""
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    fetch = sync_to_async(fetch_events)
+    started = last_sent = time.monotonic()
+    while True:
+        events, cursor = await fetch(user, cursor, topics, conversation_id)
+        for event in events:
+            yield format_event(*event)
+        now = time.monotonic()
+        if events:
+            last_sent = now
+        elif now - last_sent >= HEARTBEAT_INTERVAL:
+            # Comment lines keep proxies from closing an idle connection
+            yield ": keep-alive\n\n"
+            last_sent = now
+        if now - started >= max_seconds:
+            return
+        await asyncio.sleep(POLL_INTERVAL)
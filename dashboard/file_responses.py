@@ -0,0 +1,132 @@
+"""
+Streaming delivery of stored files with HTTP conditional and Range support.
+
+Browsers' PDF viewers fetch large documents in byte ranges, and revalidate
+cached copies with If-None-Match / If-Modified-Since; answering those from the
+ETag and Last-Modified alone means a repeat view costs a 304 instead of the
+whole file. Only single ranges are served partially; multi-range requests get
+the full file, which RFC 9110 allows.
+
+Under ASGI, Django drains a synchronous response iterator into memory before
+sending any of it, so there the body is an async generator that reads each
+chunk in a worker thread and the file still streams from disk.
+"""
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def parse_range_header(header, size):
+    """Return the (start, end) inclusive byte range requested by a Range header, or None to send the whole file.
+
+    Raises UnsatisfiableRange when the range lies outside a file of the given size.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise UnsatisfiableRange
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise UnsatisfiableRange
+    if start > end:
+        return None
+    return start, end
+
+
+def read_range(file, start, end, chunk_size=CHUNK_SIZE):
+    """Yield the bytes from start to end inclusive of an open file in chunks, then close it"""
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+async def aread_range(file, start, end, chunk_size=CHUNK_SIZE):
+    """Async counterpart of read_range, doing the blocking reads in worker threads"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        await sync_to_async(file.seek, thread_sensitive=False)(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+
+def stored_file_response(request, field_file, etag=None, last_modified=None, filename=None, cache_control=None):
+    """Stream field_file to the client, answering conditional and single Range requests"""
+    last_modified_timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_timestamp)
+    if response is not None:
+        return add_file_headers(response, etag, last_modified, cache_control)
+
+    size = field_file.size
+    filename = filename or os.path.basename(field_file.name)
+    byte_range = None
+    # If-Range asks for the range only while the file still matches the given validator
+    if_range = request.headers.get('If-Range')
+    if not if_range or (etag and etag in parse_etags(if_range)):
+        try:
+            byte_range = parse_range_header(request.headers.get('Range'), size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return add_file_headers(response, etag, last_modified, cache_control)
+
+    is_asgi = isinstance(request, ASGIRequest)
+    if byte_range is None and not is_asgi:
+        response = FileResponse(field_file.open('rb'), filename=filename)
+    else:
+        start, end = byte_range or (0, size - 1)
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        chunks = (aread_range if is_asgi else read_range)(field_file.open('rb'), start, end)
+        response = StreamingHttpResponse(chunks, status=206 if byte_range else 200, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+    return add_file_headers(response, etag, last_modified, cache_control)
+
+
+def add_file_headers(response, etag, last_modified, cache_control=None):
+    """Set the validator and caching headers shared by every file response"""
+    response['Accept-Ranges'] = 'bytes'
+    # Patient files may only be cached by the browser, and by default must be revalidated on each view
+    response['Cache-Control'] = cache_control or 'private, no-cache'
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
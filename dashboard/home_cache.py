@@ -0,0 +1,53 @@
+"""
+Versioned per-user cache for the dashboard home page context.
+
+Every cached payload is keyed by a global version number. Writes that can change
+what the dashboard shows (PatientForm saves/deletes, new messages and read
+receipts) call bump_context_version(), which makes all previously cached payloads
+unreachable; they then expire on their own. Writes made inside a transaction use
+bump_context_version_on_commit(), so no request can rebuild and cache a context
+from data that is not committed yet, and a rollback invalidates nothing.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+VERSION_KEY = 'dashboard:home:version'
+CONTEXT_TIMEOUT = 10 * 60  # Upper bound on how long an unchanged payload is served
+
+
+def get_context_version():
+    """Return the current dashboard context version, initialising it if needed"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from a timestamp so an evicted version never reuses old payload keys
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_context_version():
+    """Invalidate every cached dashboard context"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def bump_context_version_on_commit():
+    """Invalidate every cached dashboard context once the current transaction commits, or now outside one"""
+    transaction.on_commit(bump_context_version)
+
+
+def get_home_context(user, build_context):
+    """Return the cached dashboard context for user, building it with build_context(user) on a miss"""
+    role = getattr(getattr(user, 'profile', None), 'role', 'none')
+    # The date is part of the key because "forms processed today" rolls over at midnight
+    key = f'dashboard:home:{get_context_version()}:{user.pk}:{role}:{timezone.localdate().isoformat()}'
+    context = cache.get(key)
+    if context is None:
+        context = build_context(user)
+        cache.set(key, context, CONTEXT_TIMEOUT)
+    return context
@@ -0,0 +1,45 @@
+"""
+Hot query shapes of the dashboard, checked by check_query_plans (see dashboard.query_plans).
+
+Each function builds the query the way its view does, with placeholder values.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FormStatusEvent, Job, PatientForm
+from .pagination import PAGE_SIZE
+from .query_plans import register
+
+
+@register('database.page', allow_index_scan=True)
+def database_page():
+    """A keyset page of the database view without a status filter"""
+    now = timezone.now()
+    forms = PatientForm.objects.filter(Q(uploaded_at__lt=now) | Q(uploaded_at=now, id__lt=1))
+    return forms.order_by('-uploaded_at', '-id')[:PAGE_SIZE + 1]
+
+
+@register('database.status_page')
+def database_status_page():
+    """A keyset page of one status, as the status filter and physicians' pending list show"""
+    now = timezone.now()
+    forms = PatientForm.objects.filter(status='pending').filter(Q(uploaded_at__lt=now) | Q(uploaded_at=now, id__lt=1))
+    return forms.order_by('-uploaded_at', '-id')[:PAGE_SIZE + 1]
+
+
+@register('forms.timeline')
+def form_timeline():
+    """One form's status history"""
+    return FormStatusEvent.objects.filter(form_id=1, id__gt=0).order_by('id')
+
+
+@register('status_events.tail')
+def status_event_tail():
+    """Status events after a consumer's cursor"""
+    return FormStatusEvent.objects.filter(id__gt=0).order_by('id')[:100]
+
+
+@register('jobs.claim')
+def job_claim():
+    """The oldest due job a worker would claim"""
+    return Job.objects.filter(status='queued', run_after__lte=timezone.now()).values_list('id', flat=True)[:1]
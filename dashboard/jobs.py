@@ -0,0 +1,118 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in the Job table, so they survive restarts and are shared by every
+worker process. A worker claims a job with a conditional UPDATE (queued ->
+running); only one worker can win that update, so any number of
+`manage.py run_worker` processes can drain the queue side by side.
+
+Handlers are plain functions taking the job payload, registered with
+@register('kind') in an app's tasks.py module.
+"""
+import traceback
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+HANDLERS = {}
+
+# Seconds to wait before retrying a failed job, indexed by attempts so far
+RETRY_DELAYS = [10, 60, 300]
+
+
+def register(kind):
+    """Decorator registering a function as the handler for jobs of the given kind"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import every installed app's tasks module so its handlers are registered"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(kind, payload=None, run_after=None, max_attempts=3):
+    """Queue a single job and return it"""
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def enqueue_many(kind, payloads, max_attempts=3):
+    """Queue one job per payload with a single INSERT"""
+    now = timezone.now()
+    return Job.objects.bulk_create([
+        Job(kind=kind, payload=payload, run_after=now, max_attempts=max_attempts)
+        for payload in payloads
+    ])
+
+
+def claim_next(worker_id):
+    """Claim the oldest due job for worker_id, or return None when nothing is due"""
+    while True:
+        now = timezone.now()
+        candidate = Job.objects.filter(status='queued', run_after__lte=now).values_list('id', flat=True).first()
+        if candidate is None:
+            return None
+        claimed = Job.objects.filter(id=candidate, status='queued').update(
+            status='running',
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=candidate)
+        # Another worker claimed it first; try the next one
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome, scheduling a retry on failure"""
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind "{job.kind}"')
+        handler(job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts and handler is not None:
+            delay = RETRY_DELAYS[min(job.attempts, len(RETRY_DELAYS)) - 1]
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'run_after', 'last_error', 'finished_at'])
+        return False
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return True
+
+
+def requeue_stale_jobs(stale_after):
+    """Return running jobs whose worker has been silent for stale_after seconds to the queue.
+
+    A job that has used up its attempts is marked failed instead, so a job that
+    kills its worker is not claimed again forever. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - timedelta(seconds=stale_after))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed',
+        locked_by='',
+        locked_at=None,
+        finished_at=now,
+        last_error=f'Worker stopped responding after {stale_after} seconds on the last attempt',
+    )
+    requeued = stale.update(status='queued', locked_by='', locked_at=None)
+    return requeued, failed
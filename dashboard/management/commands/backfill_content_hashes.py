@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from dashboard.blobs import content_hash_of
+from dashboard.models import PatientForm, StoredBlob, delete_stored_file
+
+
+class Command(BaseCommand):
+    help = 'Hash patient form files stored before content hashing and merge identical files into shared blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving it')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        hashed = 0
+        merged = 0
+        missing = 0
+        # Oldest first, so the earliest copy of each file becomes the shared blob and the original
+        forms = PatientForm.objects.filter(content_hash='').exclude(uploaded_file='').order_by('uploaded_at', 'id')
+        seen = {}
+        for form in forms.only('id', 'uploaded_file').iterator():
+            try:
+                with form.uploaded_file.open('rb') as stored_file:
+                    content_hash = content_hash_of(stored_file)
+            except OSError:
+                missing += 1
+                continue
+            hashed += 1
+            if dry_run:
+                merged += content_hash in seen or StoredBlob.objects.filter(content_hash=content_hash).exists()
+                seen[content_hash] = form.id
+                continue
+            if self.attach(form, content_hash):
+                merged += 1
+
+        verb = 'Would hash' if dry_run else 'Hashed'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {hashed} forms; {merged} shared an earlier identical file, {missing} files were missing')
+        )
+
+    def attach(self, form, content_hash):
+        """Point form at the blob for content_hash, returning True when its own copy of the file was merged away"""
+        with transaction.atomic():
+            old_name = form.uploaded_file.name
+            if StoredBlob.objects.filter(content_hash=content_hash).update(ref_count=F('ref_count') + 1):
+                blob = StoredBlob.objects.get(content_hash=content_hash)
+            else:
+                blob = StoredBlob.objects.create(
+                    content_hash=content_hash, file_name=old_name, size=form.uploaded_file.size, ref_count=1
+                )
+            original_id = PatientForm.objects.filter(content_hash=content_hash).order_by('uploaded_at', 'id').values_list('id', flat=True).first()
+            PatientForm.objects.filter(id=form.id).update(
+                content_hash=content_hash, uploaded_file=blob.file_name, duplicate_of_id=original_id
+            )
+            if blob.file_name == old_name:
+                return False
+            if not PatientForm.objects.filter(uploaded_file=old_name).exists():
+                delete_stored_file(old_name)
+            return True
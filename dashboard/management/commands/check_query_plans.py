@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.query_plans import HOT_QUERIES, autodiscover, check_hot_queries
+
+
+class Command(BaseCommand):
+    help = 'Explain every registered hot query and fail if any plan scans a whole table or sorts without an index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Only check these hot queries; defaults to all of them')
+        parser.add_argument('--show-plans', action='store_true', help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        autodiscover()
+        unknown = set(options['names']) - set(HOT_QUERIES)
+        if unknown:
+            raise CommandError(f"Unknown hot queries: {', '.join(sorted(unknown))}")
+
+        failed = []
+        for hot_query, plan, errors in check_hot_queries(options['names']):
+            if errors:
+                failed.append(hot_query.name)
+                self.stdout.write(self.style.ERROR(f'✗ {hot_query.name}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'✓ {hot_query.name}'))
+            for problem in errors:
+                self.stdout.write(self.style.ERROR(f'    {problem}'))
+            if options['show_plans']:
+                for line in plan:
+                    self.stdout.write(f'    | {line}')
+
+        if failed:
+            raise CommandError(f"{len(failed)} hot queries scan a whole table or sort without an index: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS('All hot query plans use indexes'))
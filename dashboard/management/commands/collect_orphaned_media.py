@@ -0,0 +1,61 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from dashboard.jobs import enqueue
+from dashboard.media_gc import DEFAULT_BATCH_SIZE, QUARANTINE_DIR, collect_orphaned_media
+from dashboard.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Delete or quarantine media files that no patient form refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List orphaned files without touching them')
+        parser.add_argument('--delete', action='store_true', help=f'Delete orphans instead of moving them to MEDIA_ROOT/{QUARANTINE_DIR}')
+        parser.add_argument('--grace-hours', type=float, default=1, help='Leave files modified within this many hours alone')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Files checked against the database per query')
+        parser.add_argument('--max-per-second', type=float, help='Limit how many files are removed per second')
+        parser.add_argument('--queue', action='store_true', help='Run the sweep as a background job instead')
+        parser.add_argument('--repeat-hours', type=float, help='With --queue, repeat the sweep at this interval')
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            self.queue_sweep(options)
+            return
+
+        verbose = options['verbosity'] > 1 or options['dry_run']
+        stats = collect_orphaned_media(
+            dry_run=options['dry_run'],
+            quarantine=not options['delete'],
+            grace=timedelta(hours=options['grace_hours']),
+            batch_size=options['batch_size'],
+            max_per_second=options['max_per_second'],
+            on_orphan=self.stdout.write if verbose else None,
+        )
+
+        if options['dry_run']:
+            summary = f"Found {stats['orphaned']} orphaned files among {stats['scanned']} scanned"
+        else:
+            action = 'deleted' if options['delete'] else 'quarantined'
+            summary = (
+                f"Scanned {stats['scanned']} files; {action} {stats['removed']} orphans "
+                f"({stats['bytes'] / (1024 * 1024):.1f} MB)"
+            )
+        summary += f", {stats['expired_sessions']} abandoned upload sessions"
+        self.stdout.write(self.style.SUCCESS(summary))
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(f"{stats['failed']} files could not be removed"))
+
+    def queue_sweep(self, options):
+        if Job.objects.filter(kind='collect_orphaned_media', status__in=['queued', 'running']).exists():
+            self.stdout.write(self.style.WARNING('A media sweep is already queued'))
+            return
+        payload = {
+            'dry_run': options['dry_run'],
+            'quarantine': not options['delete'],
+            'grace_seconds': int(options['grace_hours'] * 3600),
+            'max_per_second': options['max_per_second'],
+        }
+        if options['repeat_hours']:
+            payload['repeat_every'] = int(options['repeat_hours'] * 3600)
+        job = enqueue('collect_orphaned_media', payload, max_attempts=1)
+        self.stdout.write(self.style.SUCCESS(f'Queued media sweep job #{job.pk}'))
@@ -20,15 +20,14 @@ class Command(BaseCommand):
         # Verify database structure
         self.stdout.write('\n3. Verifying database structure...')
         with connection.cursor() as cursor:
-            # Check if previous_status column exists
-            cursor.execute("PRAGMA table_info(dashboard_patientform);")
-            columns = cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            
-            if 'previous_status' in column_names:
-                self.stdout.write(self.style.SUCCESS('✓ previous_status column exists'))
+            # Undo of cancellations reads previous statuses from the status event log
+            if 'dashboard_formstatusevent' in connection.introspection.table_names(cursor):
+                self.stdout.write(self.style.SUCCESS('✓ status event log exists'))
             else:
-                self.stdout.write(self.style.ERROR('✗ previous_status column missing'))
+                self.stdout.write(self.style.ERROR('✗ status event log missing'))
+            
+            cursor.execute("PRAGMA table_info(dashboard_patientform);")
+            column_names = [col[1] for col in cursor.fetchall()]
             
             # Show all columns
             self.stdout.write(f'Available columns: {", ".join(column_names)}')
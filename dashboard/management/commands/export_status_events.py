@@ -0,0 +1,27 @@
+import json
+from datetime import date
+from django.core.management.base import BaseCommand
+from dashboard.status_events import iter_status_events, latest_event_id
+
+
+class Command(BaseCommand):
+    help = 'Write the patient form status event log as JSON lines, oldest first, for analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, default=0, help='Only export events with a larger id than this')
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='Only export events from this date (YYYY-MM-DD); defaults to all dates',
+        )
+
+    def handle(self, *args, **options):
+        # Stop at the newest event now, so the export is a consistent cut of the log
+        last_id = latest_event_id()
+        count = 0
+        for event in iter_status_events(after_id=options['after'], until_id=last_id, since=options['since']):
+            event['created_at'] = event['created_at'].isoformat()
+            self.stdout.write(json.dumps(event))
+            count += 1
+        # The summary goes to stderr so stdout stays valid JSON lines; --after with the last id resumes from here
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} status events up to id {last_id}'))
@@ -0,0 +1,71 @@
+import os
+from django.core.files.move import file_move_safe
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from dashboard.models import PatientForm, StoredBlob, sharded_file_name
+from dashboard.previews import preview_names
+
+
+class Command(BaseCommand):
+    help = 'Move stored patient form files and their previews into the sharded content-addressed layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Files moved per database update')
+        parser.add_argument('--dry-run', action='store_true', help='Report how many files would move without moving them')
+
+    def handle(self, *args, **options):
+        storage = PatientForm._meta.get_field('uploaded_file').storage
+        batch_size = options['batch_size']
+        moved = 0
+
+        blob_ids = list(StoredBlob.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(blob_ids), batch_size):
+            batch = [
+                (blob, sharded_file_name(blob.content_hash, blob.file_name))
+                for blob in StoredBlob.objects.filter(id__in=blob_ids[start:start + batch_size])
+            ]
+            batch = [(blob, new_name) for blob, new_name in batch if blob.file_name != new_name]
+            if batch and not options['dry_run']:
+                self.move_batch(storage, batch)
+            moved += len(batch)
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} stored files into the sharded layout'))
+
+        unhashed = PatientForm.objects.filter(content_hash='').exclude(uploaded_file='').count()
+        if unhashed:
+            self.stdout.write(self.style.WARNING(
+                f'{unhashed} forms have no content hash yet; run backfill_content_hashes first to move them too'
+            ))
+
+    def move_batch(self, storage, batch):
+        """Move a batch of blobs' files, then repoint their blobs and forms with two bulk updates"""
+        moves = []
+        try:
+            for blob, new_name in batch:
+                old_previews = preview_names(blob.file_name, blob.content_hash).values()
+                new_previews = preview_names(new_name, blob.content_hash).values()
+                for old, new in [(blob.file_name, new_name), *zip(old_previews, new_previews)]:
+                    if storage.exists(old):
+                        self.move(storage, old, new)
+                        moves.append((old, new))
+                blob.file_name = new_name
+
+            new_names = {blob.content_hash: blob.file_name for blob, _ in batch}
+            forms = list(PatientForm.objects.filter(content_hash__in=new_names).only('id', 'content_hash', 'uploaded_file'))
+            for form in forms:
+                form.uploaded_file = new_names[form.content_hash]
+            with transaction.atomic():
+                StoredBlob.objects.bulk_update([blob for blob, _ in batch], ['file_name'])
+                PatientForm.objects.bulk_update(forms, ['uploaded_file'])
+        except Exception:
+            # Put the files back so the stored names stay valid
+            for old, new in reversed(moves):
+                self.move(storage, new, old)
+            raise
+
+    def move(self, storage, old_name, new_name):
+        new_path = storage.path(new_name)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        # Content-addressed names only collide for identical content, so overwriting is safe
+        file_move_safe(storage.path(old_name), new_path, allow_overwrite=True)
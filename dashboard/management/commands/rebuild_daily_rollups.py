@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from dashboard.stats import rebuild_daily_rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill the daily patient form rollups behind the time saved analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='Only rebuild rollups from this date (YYYY-MM-DD); defaults to all dates',
+        )
+
+    def handle(self, *args, **options):
+        rollups = rebuild_daily_rollups(since=options['since'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt {len(rollups)} daily rollups')
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from dashboard.stats import rebuild_form_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized patient form counters from the PatientForm table'
+
+    def handle(self, *args, **options):
+        counters = rebuild_form_counters()
+        for key in sorted(counters):
+            self.stdout.write(f'{key}: {counters[key]}')
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt {len(counters)} form counters')
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from dashboard.search import rebuild_search_index, search_index_available
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient name search index from the PatientForm table'
+
+    def handle(self, *args, **options):
+        if not search_index_available():
+            self.stdout.write(
+                self.style.WARNING('Search index table not found; searches use icontains. Run migrations first.')
+            )
+            return
+        indexed = rebuild_search_index()
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {indexed} patient forms')
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from dashboard.jobs import enqueue_many
+from dashboard.models import PatientForm
+from dashboard.previews import Image, generate_previews, preview_key
+
+
+class Command(BaseCommand):
+    help = 'Generate preview renditions for stored patient forms'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render previews that already exist')
+        parser.add_argument('--queue', action='store_true', help='Queue a generate_previews job per form instead of rendering here')
+
+    def handle(self, *args, **options):
+        forms = PatientForm.objects.exclude(uploaded_file='').order_by('id')
+        if options['queue']:
+            jobs = enqueue_many('generate_previews', [
+                {'form_id': form_id, 'force': options['force']} for form_id in forms.values_list('id', flat=True)
+            ])
+            self.stdout.write(self.style.SUCCESS(f'Queued {len(jobs)} preview jobs'))
+            return
+
+        if Image is None:
+            self.stdout.write(self.style.WARNING('Pillow is not installed, so no previews can be rendered'))
+            return
+        rendered = 0
+        seen = set()
+        for form in forms.iterator():
+            # Forms sharing a stored file share its previews, so render each file once
+            if preview_key(form) in seen:
+                continue
+            seen.add(preview_key(form))
+            if generate_previews(form, force=options['force']):
+                rendered += 1
+        self.stdout.write(self.style.SUCCESS(f'Rendered previews for {rendered} forms'))
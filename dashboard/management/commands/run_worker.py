@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from dashboard.jobs import autodiscover, claim_next, run_job, requeue_stale_jobs
+import os
+import socket
+import time
+
+
+class Command(BaseCommand):
+    help = 'Run a background worker that claims and runs queued jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', default=f'{socket.gethostname()}:{os.getpid()}', help='Name recorded on claimed jobs')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600, help='Requeue running jobs locked for longer than this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling')
+
+    def handle(self, *args, **options):
+        autodiscover()
+        worker_id = options['worker_id']
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} started'))
+
+        processed = 0
+        last_stale_check = 0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - last_stale_check > 60:
+                    requeued, failed = requeue_stale_jobs(options['stale_after'])
+                    if requeued:
+                        self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+                    if failed:
+                        self.stdout.write(self.style.ERROR(f'Failed {failed} stale jobs that were out of attempts'))
+                    last_stale_check = time.monotonic()
+
+                job = claim_next(worker_id)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                if run_job(job):
+                    self.stdout.write(f'Finished {job}')
+                else:
+                    self.stdout.write(self.style.ERROR(f'{job} failed (attempt {job.attempts} of {job.max_attempts})'))
+                processed += 1
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped after {processed} jobs'))
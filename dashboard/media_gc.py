@@ -0,0 +1,163 @@
+"""
+Garbage collection of media files nothing refers to any more.
+
+Files are left behind when an upload's transaction rolls back after its file
+was written, when a delete's file removal fails, or by copies from before
+content-addressed storage. collect_orphaned_media streams through MEDIA_ROOT
+with os.scandir, checks the files it finds against PatientForm, StoredBlob and
+the preview naming scheme a batch at a time, and deletes or quarantines the
+rest. Files younger than the grace period are left alone, since they may belong
+to an upload whose row is not committed yet.
+
+Part files of resumable uploads are handled separately: those of sessions
+that are still live are kept, and abandoned sessions are cleaned up with them.
+"""
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+
+from .chunked_upload import discard_session_file, expired_sessions
+from .models import PatientForm, StoredBlob, UploadSession
+
+QUARANTINE_DIR = 'quarantine'
+DEFAULT_GRACE = timedelta(hours=1)
+DEFAULT_BATCH_SIZE = 500
+
+
+def walk_files(root, skip=()):
+    """Yield a DirEntry for every file under root, reading one directory at a time"""
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in skip:
+                            pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def find_referenced(names):
+    """Return the storage names in names that a form, a stored blob or a live preview uses"""
+    referenced = set(PatientForm.objects.filter(uploaded_file__in=names).values_list('uploaded_file', flat=True))
+    referenced.update(StoredBlob.objects.filter(file_name__in=names).values_list('file_name', flat=True))
+
+    # Previews are named <key>_<size>.jpg, where key is a blob's content hash or form-<id>
+    previews = {}
+    for name in names:
+        if os.path.basename(os.path.dirname(name)) == 'previews':
+            previews.setdefault(os.path.basename(name).rsplit('_', 1)[0], []).append(name)
+    form_keys = {int(key[5:]): key for key in previews if key.startswith('form-') and key[5:].isdigit()}
+    live_keys = set(StoredBlob.objects.filter(content_hash__in=list(previews)).values_list('content_hash', flat=True))
+    live_keys.update(form_keys[form_id] for form_id in PatientForm.objects.filter(id__in=list(form_keys)).values_list('id', flat=True))
+    for key in live_keys:
+        referenced.update(previews[key])
+    return referenced
+
+
+def collect_orphaned_media(dry_run=False, quarantine=True, grace=DEFAULT_GRACE, batch_size=DEFAULT_BATCH_SIZE,
+                           max_per_second=None, on_orphan=None):
+    """Delete or quarantine unreferenced files under MEDIA_ROOT and return a Counter of what happened.
+
+    max_per_second throttles removals so a large sweep does not saturate the
+    disk; on_orphan, if given, is called with each orphan's storage name.
+    """
+    root = str(settings.MEDIA_ROOT)
+    quarantine_root = os.path.join(root, QUARANTINE_DIR)
+    upload_dir = str(settings.CHUNKED_UPLOAD_DIR)
+    cutoff = time.time() - grace.total_seconds()
+    stats = Counter()
+
+    def remove(path, name):
+        stats['orphaned'] += 1
+        if on_orphan:
+            on_orphan(name)
+        if dry_run:
+            return
+        try:
+            size = os.path.getsize(path)
+            if quarantine:
+                target = os.path.join(quarantine_root, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+            else:
+                os.remove(path)
+        except OSError:
+            stats['failed'] += 1
+            return
+        stats['removed'] += 1
+        stats['bytes'] += size
+        if max_per_second:
+            time.sleep(1 / max_per_second)
+
+    def sweep(batch):
+        referenced = find_referenced([name for name, _ in batch])
+        for name, path in batch:
+            if name not in referenced:
+                remove(path, name)
+
+    batch = []
+    for entry in walk_files(root, skip={quarantine_root, upload_dir}):
+        stats['scanned'] += 1
+        if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+            continue
+        batch.append((os.path.relpath(entry.path, root), entry.path))
+        if len(batch) >= batch_size:
+            sweep(batch)
+            batch = []
+    if batch:
+        sweep(batch)
+
+    stats.update(collect_upload_sessions(dry_run, cutoff, on_orphan))
+    return stats
+
+
+def collect_upload_sessions(dry_run, cutoff, on_orphan=None):
+    """Drop abandoned upload sessions, and part files whose session no longer exists"""
+    stats = Counter()
+    abandoned = list(expired_sessions())
+    stats['expired_sessions'] = len(abandoned)
+    if not dry_run:
+        for session in abandoned:
+            discard_session_file(session)
+        UploadSession.objects.filter(pk__in=[session.pk for session in abandoned]).delete()
+
+    part_files = [
+        (session_id_of(entry.name), entry.path)
+        for entry in walk_files(str(settings.CHUNKED_UPLOAD_DIR))
+        if entry.stat(follow_symlinks=False).st_mtime <= cutoff
+    ]
+    session_ids = [session_id for session_id, _ in part_files if session_id]
+    live = set(UploadSession.objects.filter(pk__in=session_ids).values_list('pk', flat=True))
+    for session_id, path in part_files:
+        if session_id in live:
+            continue
+        stats['orphaned'] += 1
+        if on_orphan:
+            on_orphan(path)
+        if not dry_run:
+            try:
+                os.remove(path)
+                stats['removed'] += 1
+            except OSError:
+                stats['failed'] += 1
+    return stats
+
+
+def session_id_of(file_name):
+    """Return the UploadSession id a part file name refers to, or None for stray files"""
+    stem, extension = os.path.splitext(file_name)
+    if extension != '.part':
+        return None
+    try:
+        return uuid.UUID(stem)
+    except ValueError:
+        return None
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:34
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_counters(apps, schema_editor):
+    PatientForm = apps.get_model('dashboard', 'PatientForm')
+    FormCounter = apps.get_model('dashboard', 'FormCounter')
+
+    counters = {}
+    for row in PatientForm.objects.order_by().values('status').annotate(total=Count('id')):
+        counters[f"status:{row['status']}"] = row['total']
+    uploads = PatientForm.objects.order_by().annotate(
+        upload_date=TruncDate('uploaded_at')
+    ).values('upload_date').annotate(total=Count('id'))
+    for row in uploads:
+        counters[f"uploads:{row['upload_date'].isoformat()}"] = row['total']
+    timed = PatientForm.objects.filter(processing_time_seconds__isnull=False).aggregate(
+        count=Count('id'), seconds=Sum('processing_time_seconds')
+    )
+    counters['timed:count'] = timed['count']
+    counters['timed:seconds'] = timed['seconds'] or 0
+
+    FormCounter.objects.bulk_create([FormCounter(key=key, value=value) for key, value in counters.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_remove_patientform_previous_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
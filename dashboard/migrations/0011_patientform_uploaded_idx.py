@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_formcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientform',
+            index=models.Index(fields=['uploaded_at', 'id'], name='patientform_uploaded_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated manually on 2026-10-18 for the patient name FTS5 search index
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE dashboard_patientform_fts "
+            "USING fts5(patient_name, extracted_patient_name, tokenize='trigram')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5 or the trigram tokenizer (3.34+); searches fall back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO dashboard_patientform_fts (rowid, patient_name, extracted_patient_name) "
+        "SELECT id, patient_name, extracted_patient_name FROM dashboard_patientform"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS dashboard_patientform_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_patientform_uploaded_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
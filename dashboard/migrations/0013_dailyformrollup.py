@@ -0,0 +1,75 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:39
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+PROCESSING_TARGET_SECONDS = 6 * 60
+
+
+def populate_rollups(apps, schema_editor):
+    PatientForm = apps.get_model('dashboard', 'PatientForm')
+    FormCounter = apps.get_model('dashboard', 'FormCounter')
+    DailyFormRollup = apps.get_model('dashboard', 'DailyFormRollup')
+
+    rows = PatientForm.objects.order_by().annotate(day=TruncDate('uploaded_at')).values('day').annotate(
+        uploaded=Count('id'),
+        processed=Count('id', filter=Q(processed=True)),
+        timed=Count('processing_time_seconds'),
+        seconds=Sum('processing_time_seconds'),
+        under_target=Count('id', filter=Q(processing_time_seconds__lt=PROCESSING_TARGET_SECONDS)),
+        approved=Count('id', filter=Q(status='approved')),
+        rejected=Count('id', filter=Q(status='rejected')),
+    )
+    DailyFormRollup.objects.bulk_create([
+        DailyFormRollup(
+            date=row['day'],
+            uploaded_count=row['uploaded'],
+            processed_count=row['processed'],
+            timed_count=row['timed'],
+            processing_seconds_total=row['seconds'] or 0,
+            under_target_count=row['under_target'],
+            approved_count=row['approved'],
+            rejected_count=row['rejected'],
+        )
+        for row in rows
+    ])
+
+    # Daily upload counts now live in the rollups; add the all-time processed counters instead
+    FormCounter.objects.filter(key__startswith='uploads:').delete()
+    totals = PatientForm.objects.aggregate(
+        processed=Count('id', filter=Q(processed=True)),
+        under_target=Count('id', filter=Q(processing_time_seconds__lt=PROCESSING_TARGET_SECONDS)),
+    )
+    FormCounter.objects.bulk_create([
+        FormCounter(key='processed:count', value=totals['processed']),
+        FormCounter(key='timed:under_target', value=totals['under_target']),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_patientform_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyFormRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('uploaded_count', models.PositiveIntegerField(default=0)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('timed_count', models.PositiveIntegerField(default=0, help_text='Forms with a recorded processing time')),
+                ('processing_seconds_total', models.BigIntegerField(default=0)),
+                ('under_target_count', models.PositiveIntegerField(default=0)),
+                ('approved_count', models.PositiveIntegerField(default=0)),
+                ('rejected_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0014_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('file_name', models.CharField(help_text='Name of the file in storage', max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Number of forms using this file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='patientform',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the uploaded file', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='patientform',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Earlier form with byte-identical content', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='dashboard.patientform'),
+        ),
+    ]
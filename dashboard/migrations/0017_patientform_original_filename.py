@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:49
+
+import os
+
+from django.db import migrations, models
+
+
+def populate_original_filenames(apps, schema_editor):
+    PatientForm = apps.get_model('dashboard', 'PatientForm')
+    # Until now files were stored under the name they were uploaded with
+    forms = []
+    for form in PatientForm.objects.exclude(uploaded_file='').only('id', 'uploaded_file').iterator():
+        form.original_filename = os.path.basename(form.uploaded_file.name)[:255]
+        forms.append(form)
+    PatientForm.objects.bulk_update(forms, ['original_filename'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0016_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientform',
+            name='original_filename',
+            field=models.CharField(blank=True, help_text='File name as uploaded', max_length=255),
+        ),
+        migrations.RunPython(populate_original_filenames, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:52
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def use_upload_time(apps, schema_editor):
+    PatientForm = apps.get_model('dashboard', 'PatientForm')
+    # Without any history, the upload time is the best known status change
+    PatientForm.objects.update(status_changed_at=F('uploaded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0017_patientform_original_filename'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientform',
+            name='status_changed_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='When status last changed'),
+        ),
+        migrations.RunPython(use_upload_time, migrations.RunPython.noop),
+    ]
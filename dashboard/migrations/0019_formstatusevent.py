@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_current_statuses(apps, schema_editor):
+    PatientForm = apps.get_model('dashboard', 'PatientForm')
+    FormStatusEvent = apps.get_model('dashboard', 'FormStatusEvent')
+    # Earlier transitions were never recorded, so each timeline starts at the form's current status
+    forms = PatientForm.objects.values_list('id', 'status', 'status_changed_at').order_by('id')
+    batch = []
+    for form_id, status, changed_at in forms.iterator():
+        batch.append(FormStatusEvent(form_id=form_id, to_status=status, created_at=changed_at))
+        if len(batch) >= 1000:
+            FormStatusEvent.objects.bulk_create(batch)
+            batch = []
+    FormStatusEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0018_patientform_status_changed_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, help_text='Empty for the status a form was created with', max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, db_index=False, help_text='User who made the change, empty for system changes', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('form', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='dashboard.patientform')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['form', 'created_at'], name='statusevent_form_idx'), models.Index(fields=['created_at'], name='statusevent_created_idx')],
+            },
+        ),
+        migrations.RunPython(seed_current_statuses, migrations.RunPython.noop),
+    ]
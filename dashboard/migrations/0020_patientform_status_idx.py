@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0019_formstatusevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientform',
+            index=models.Index(fields=['status', 'uploaded_at', 'id'], name='patientform_status_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0020_patientform_status_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='formstatusevent',
+            name='statusevent_form_idx',
+        ),
+        migrations.AddIndex(
+            model_name='formstatusevent',
+            index=models.Index(fields=['form', 'id'], name='statusevent_form_idx'),
+        ),
+    ]
@@ -1,11 +1,31 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.core.validators import FileExtensionValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .home_cache import bump_context_version_on_commit
+from .search import index_forms, unindex_forms
+from .previews import preview_names
 import os
+import uuid
 
 def upload_to(instance, filename):
-    """Generate upload path for patient forms"""
-    return os.path.join('patient_forms', filename)
+    """Generate a sharded, content-addressed upload path for patient forms.
+
+    Files are stored as patient_forms/ab/cd/<sha256>.<ext>, which keeps every
+    directory small and makes names collision-free, so saving never has to probe
+    for a free name. Files without a known hash get a random name in the same layout.
+    """
+    key = getattr(instance, 'content_hash', '') or uuid.uuid4().hex
+    return sharded_file_name(key, filename)
+
+def sharded_file_name(key, filename):
+    """Return the storage name for a file keyed by key, keeping filename's extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join('patient_forms', key[:2], key[2:4], f'{key}{extension}')
 
 class PatientForm(models.Model):
     """Model to store uploaded patient forms"""
@@ -24,25 +44,21 @@ class PatientForm(models.Model):
         return self.status == 'cancelled'
     
     def can_undo_cancellation(self):
-        # Temporarily disabled until previous_status field is available
-        return False
-        # try:
-        #     return self.status == 'cancelled' and hasattr(self, 'previous_status') and self.previous_status in ['approved', 'rejected']
-        # except:
-        #     return False
+        return self.status == 'cancelled' and self.previous_status in ['approved', 'rejected']
     
     def undo_cancellation(self):
         """Restore the form to its previous status before cancellation"""
-        # Temporarily disabled until previous_status field is available
-        return False
-        # try:
-        #     if self.can_undo_cancellation():
-        #         self.status = self.previous_status
-        #         self.previous_status = None
-        #         return True
-        # except:
-        #     pass
-        # return False
+        if not self.can_undo_cancellation():
+            return False
+        self.status = self.previous_status
+        return True
+    
+    @cached_property
+    def previous_status(self):
+        """Return the status the form had before its latest cancellation, read from the status event log"""
+        return self.status_events.filter(to_status='cancelled').order_by('-id').values_list(
+            'from_status', flat=True
+        ).first()
     
     AI_DECISION_CHOICES = [
         ('analyzing', 'Analyzing...'),
@@ -61,20 +77,114 @@ class PatientForm(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    # previous_status = models.CharField(max_length=20, choices=STATUS_CHOICES, blank=True, null=True, help_text="Status before cancellation, used for undo")
-    # NOTE: previous_status field is temporarily commented out for deployment compatibility
-    # This field will be uncommented after the migration runs successfully on production
     ai_decision = models.CharField(max_length=20, choices=AI_DECISION_CHOICES, default='analyzing')
     ai_feedback = models.TextField(blank=True, null=True)
     extracted_patient_name = models.CharField(max_length=255, blank=True, null=True)
     processing_time_seconds = models.IntegerField(null=True, blank=True, help_text="Processing time in seconds")
+    status_changed_at = models.DateTimeField(default=timezone.now, db_index=True, help_text="When status last changed")
+    original_filename = models.CharField(max_length=255, blank=True, help_text="File name as uploaded")
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 of the uploaded file")
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates',
+        help_text="Earlier form with byte-identical content"
+    )
+    
+    # Forms processed in under this many minutes count towards the processing target
+    PROCESSING_TARGET_MINUTES = 6
+    
+    # Fields that feed the materialized FormCounter and DailyFormRollup rows
+    COUNTER_FIELDS = ('status', 'uploaded_at', 'processed', 'processing_time_seconds')
+    
+    # User the next status change is recorded against in FormStatusEvent; set it before save()
+    status_actor = None
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Keyset pagination in database_view walks forms by (uploaded_at, id)
+            models.Index(fields=['uploaded_at', 'id'], name='patientform_uploaded_idx'),
+            # The same walk within one status, as the status filter and the physicians' pending list do
+            models.Index(fields=['status', 'uploaded_at', 'id'], name='patientform_status_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored counter values so a delete can take the form out of the counters
+        if not instance.get_deferred_fields().intersection(cls.COUNTER_FIELDS):
+            instance._counter_snapshot = instance.counter_values()
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # The reloaded values are now the stored ones a delete takes out of the counters
+        snapshot = getattr(self, '_counter_snapshot', None)
+        if snapshot is not None:
+            snapshot.update({
+                field: getattr(self, field) for field in self.COUNTER_FIELDS if fields is None or field in fields
+            })
+        elif fields is None and not self.get_deferred_fields().intersection(self.COUNTER_FIELDS):
+            self._counter_snapshot = self.counter_values()
+        self.__dict__.pop('previous_status', None)
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        old_status = ''
+        status_changed = adding
+        # Reading the stored row, writing the form and logging its status event happen under one row lock
+        with transaction.atomic():
+            if not adding:
+                lock_counter_snapshot(self)
+                old_status = (self._counter_snapshot or {}).get('status')
+                update_fields = kwargs.get('update_fields')
+                # Stamp status transitions so the event stream can pick them up
+                if old_status != self.status and (update_fields is None or 'status' in update_fields):
+                    status_changed = True
+                    self.status_changed_at = timezone.now()
+                    if update_fields is not None:
+                        kwargs['update_fields'] = {*update_fields, 'status_changed_at'}
+            super().save(*args, **kwargs)
+            if status_changed:
+                FormStatusEvent.objects.create(
+                    form=self,
+                    from_status=old_status or '',
+                    to_status=self.status,
+                    # New forms are put in their first status by whoever uploaded them
+                    actor_id=self.status_actor.pk if self.status_actor else (self.uploaded_by_id if adding else None),
+                    created_at=self.status_changed_at,
+                )
+        if status_changed:
+            self.status_actor = None
+            self.__dict__.pop('previous_status', None)
+    
+    def move_status(self, from_status, to_status):
+        """Move the form from from_status to to_status if that is still its stored status, and return whether it moved.
+
+        The check and the write share the save's row lock, so a status set by
+        someone else in the meantime is kept; the instance takes it on instead.
+        """
+        with transaction.atomic():
+            lock_counter_snapshot(self)
+            stored_status = (self._counter_snapshot or {}).get('status')
+            if stored_status != from_status:
+                self.status = stored_status or self.status
+                return False
+            self.status = to_status
+            self.save(update_fields=['status'])
+            return True
+    
+    def counter_values(self):
+        """Return the current values of the fields tracked by FormCounter and DailyFormRollup"""
+        return {field: getattr(self, field) for field in self.COUNTER_FIELDS}
     
     def __str__(self):
         return f"Form for {self.patient_name or self.extracted_patient_name or 'Unknown'} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
     
+    @property
+    def display_file_name(self):
+        """Return the name the file was uploaded with"""
+        return self.original_filename or os.path.basename(self.uploaded_file.name or '')
+    
     @property
     def file_size_mb(self):
         """Return file size in MB"""
@@ -106,3 +216,313 @@ class PatientForm(models.Model):
     def ai_decision_display(self):
         """Return human-readable AI decision"""
         return dict(self.AI_DECISION_CHOICES).get(self.ai_decision, self.ai_decision)
+
+
+class FormCounter(models.Model):
+    """Materialized counters for patient form statistics (see dashboard.stats)"""
+    key = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+    
+    @staticmethod
+    def contributions(values):
+        """Return the counter increments a form with the given field values accounts for"""
+        if not values:
+            return {}
+        contributions = {f"status:{values['status']}": 1}
+        if values.get('processed'):
+            contributions['processed:count'] = 1
+        if values.get('processing_time_seconds') is not None:
+            contributions['timed:count'] = 1
+            contributions['timed:seconds'] = values['processing_time_seconds']
+            if values['processing_time_seconds'] < PatientForm.PROCESSING_TARGET_MINUTES * 60:
+                contributions['timed:under_target'] = 1
+        return contributions
+    
+    @classmethod
+    def deltas(cls, old_values, new_values):
+        """Return the counter changes needed to move a form from old_values to new_values"""
+        deltas = cls.contributions(new_values)
+        for key, amount in cls.contributions(old_values).items():
+            deltas[key] = deltas.get(key, 0) - amount
+        return {key: amount for key, amount in deltas.items() if amount}
+    
+    @classmethod
+    def apply(cls, deltas):
+        """Atomically add each delta to its counter, creating missing counters"""
+        if not deltas:
+            return
+        with transaction.atomic():
+            for key, amount in deltas.items():
+                if not cls.objects.filter(key=key).update(value=F('value') + amount):
+                    cls.objects.bulk_create([cls(key=key, value=0)], ignore_conflicts=True)
+                    cls.objects.filter(key=key).update(value=F('value') + amount)
+
+
+class DailyFormRollup(models.Model):
+    """Per-day patient form totals, keyed by upload date and maintained incrementally"""
+    date = models.DateField(unique=True)
+    uploaded_count = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    timed_count = models.PositiveIntegerField(default=0, help_text="Forms with a recorded processing time")
+    processing_seconds_total = models.BigIntegerField(default=0)
+    under_target_count = models.PositiveIntegerField(default=0)
+    approved_count = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"Rollup for {self.date}: {self.uploaded_count} uploaded"
+    
+    @property
+    def avg_processing_minutes(self):
+        """Return the average processing time of the day's timed forms in minutes"""
+        if self.timed_count:
+            return round(self.processing_seconds_total / self.timed_count / 60, 1)
+        return 0.0
+    
+    @staticmethod
+    def contributions(values):
+        """Return the rollup increments, as {date: {column: amount}}, a form with the given values accounts for"""
+        if not values or not values.get('uploaded_at'):
+            return {}
+        row = {'uploaded_count': 1}
+        if values.get('processed'):
+            row['processed_count'] = 1
+        if values.get('processing_time_seconds') is not None:
+            row['timed_count'] = 1
+            row['processing_seconds_total'] = values['processing_time_seconds']
+            if values['processing_time_seconds'] < PatientForm.PROCESSING_TARGET_MINUTES * 60:
+                row['under_target_count'] = 1
+        if values.get('status') in ('approved', 'rejected'):
+            row[f"{values['status']}_count"] = 1
+        return {timezone.localdate(values['uploaded_at']): row}
+    
+    @classmethod
+    def deltas(cls, old_values, new_values):
+        """Return the rollup changes needed to move a form from old_values to new_values"""
+        deltas = cls.contributions(new_values)
+        for date, row in cls.contributions(old_values).items():
+            day = deltas.setdefault(date, {})
+            for column, amount in row.items():
+                day[column] = day.get(column, 0) - amount
+        return {
+            date: {column: amount for column, amount in row.items() if amount}
+            for date, row in deltas.items()
+            if any(row.values())
+        }
+    
+    @classmethod
+    def apply(cls, deltas):
+        """Atomically add each day's deltas to its rollup row, creating missing rows"""
+        if not deltas:
+            return
+        with transaction.atomic():
+            for date, row in deltas.items():
+                changes = {column: F(column) + amount for column, amount in row.items()}
+                if not cls.objects.filter(date=date).update(**changes):
+                    cls.objects.bulk_create([cls(date=date)], ignore_conflicts=True)
+                    cls.objects.filter(date=date).update(**changes)
+
+
+class StoredBlob(models.Model):
+    """One stored upload file, shared by every PatientForm with the same content hash (see dashboard.blobs)"""
+    content_hash = models.CharField(max_length=64, unique=True)
+    file_name = models.CharField(max_length=255, help_text="Name of the file in storage")
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0, help_text="Number of forms using this file")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.file_name} ({self.ref_count} references)"
+    
+    @classmethod
+    def release(cls, content_hash):
+        """Drop one reference to the blob, deleting it and its file when none are left"""
+        with transaction.atomic():
+            cls.objects.filter(content_hash=content_hash, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+            blob = cls.objects.filter(content_hash=content_hash, ref_count=0).first()
+            if blob:
+                blob.delete()
+                delete_stored_file(blob.file_name)
+                for name in preview_names(blob.file_name, content_hash).values():
+                    delete_stored_file(name)
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload in progress (see dashboard.chunked_upload)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    patient_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(help_text="Total size of the file in bytes")
+    received_bytes = models.BigIntegerField(default=0)
+    patient_form = models.ForeignKey(
+        PatientForm, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Form created when the upload completed"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.file_name} ({self.received_bytes}/{self.size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.size
+
+
+def delete_stored_file(name):
+    """Delete a patient form file from storage once the current transaction commits"""
+    storage = PatientForm._meta.get_field('uploaded_file').storage
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+class FormStatusEvent(models.Model):
+    """One status transition of a patient form, in an append-only log (see dashboard.status_events)"""
+    # The (form, id) index serves lookups by form, so the foreign keys get no index of their own
+    form = models.ForeignKey(PatientForm, on_delete=models.CASCADE, related_name='status_events', db_index=False)
+    from_status = models.CharField(max_length=20, blank=True, help_text="Empty for the status a form was created with")
+    to_status = models.CharField(max_length=20)
+    actor = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False,
+        help_text="User who made the change, empty for system changes"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Per-form timelines, read in id order from a keyset cursor
+            models.Index(fields=['form', 'id'], name='statusevent_form_idx'),
+            # Time-window analytics
+            models.Index(fields=['created_at'], name='statusevent_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Form #{self.form_id}: {self.from_status or 'created'} -> {self.to_status}"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Status events are append-only')
+        super().save(*args, **kwargs)
+
+
+class Job(models.Model):
+    """Durable background job, claimed and run by the run_worker management command (see dashboard.jobs)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50, help_text="Name of the registered handler that runs this job")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            # Workers claim the oldest due job in a given status
+            models.Index(fields=['status', 'run_after', 'id'], name='job_claim_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} job #{self.pk} ({self.status})"
+
+def lock_counter_snapshot(instance):
+    """Lock the stored row of a form about to be saved and snapshot the counter values the save replaces.
+
+    Deltas taken from the values an instance was loaded with would let two
+    saves of the same form both subtract the same old status. Must run inside
+    the save's transaction; SQLite has no SELECT ... FOR UPDATE, so there a
+    no-op UPDATE takes the write lock before the read.
+    """
+    rows = PatientForm.objects.filter(pk=instance.pk)
+    if connection.features.has_select_for_update:
+        rows = rows.select_for_update()
+    else:
+        rows.update(status=F('status'))
+    instance._counter_snapshot = rows.values(*PatientForm.COUNTER_FIELDS).first()
+
+@receiver(post_save, sender=PatientForm)
+def update_form_counters(sender, instance, created, update_fields=None, **kwargs):
+    """Keep FormCounter and DailyFormRollup rows in step with form creation and changes"""
+    old_values = None if created else getattr(instance, '_counter_snapshot', None)
+    new_values = instance.counter_values()
+    if old_values and update_fields is not None:
+        # Fields left out of update_fields were not written, so their stored value stands
+        new_values = {field: new_values[field] if field in update_fields else old_values[field] for field in new_values}
+    FormCounter.apply(FormCounter.deltas(old_values, new_values))
+    DailyFormRollup.apply(DailyFormRollup.deltas(old_values, new_values))
+    instance._counter_snapshot = new_values
+
+@receiver(post_delete, sender=PatientForm)
+def remove_form_from_counters(sender, instance, **kwargs):
+    """Take a deleted form out of the FormCounter and DailyFormRollup rows"""
+    old_values = getattr(instance, '_counter_snapshot', None) or instance.counter_values()
+    FormCounter.apply(FormCounter.deltas(old_values, None))
+    DailyFormRollup.apply(DailyFormRollup.deltas(old_values, None))
+
+@receiver(post_save, sender=PatientForm)
+@receiver(post_delete, sender=PatientForm)
+def invalidate_home_context(sender, **kwargs):
+    """Any form write can change the dashboard figures, so drop cached dashboard contexts"""
+    bump_context_version_on_commit()
+
+@receiver(post_save, sender=PatientForm)
+def update_search_index(sender, instance, **kwargs):
+    """Keep the patient name search index in step with saved forms"""
+    index_forms([instance])
+
+@receiver(post_delete, sender=PatientForm)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Drop deleted forms from the patient name search index"""
+    unindex_forms([instance.pk])
+
+@receiver(post_delete, sender=PatientForm)
+def release_uploaded_file(sender, instance, **kwargs):
+    """Drop the deleted form's claim on its file, deleting the file once no form uses it"""
+    if instance.content_hash:
+        StoredBlob.release(instance.content_hash)
+    elif instance.uploaded_file and not PatientForm.objects.filter(uploaded_file=instance.uploaded_file.name).exists():
+        # Forms stored before content hashing own their file outright
+        delete_stored_file(instance.uploaded_file.name)
+        for name in preview_names(instance.uploaded_file.name, f'form-{instance.pk}').values():
+            delete_stored_file(name)
+
+
+def track_bulk_created_forms(forms):
+    """Apply the post_save bookkeeping to forms inserted with bulk_create, which sends no signals"""
+    counter_deltas = {}
+    rollup_deltas = {}
+    for form in forms:
+        values = form.counter_values()
+        for key, amount in FormCounter.deltas(None, values).items():
+            counter_deltas[key] = counter_deltas.get(key, 0) + amount
+        for date, row in DailyFormRollup.deltas(None, values).items():
+            day = rollup_deltas.setdefault(date, {})
+            for column, amount in row.items():
+                day[column] = day.get(column, 0) + amount
+        form._counter_snapshot = values
+    FormCounter.apply(counter_deltas)
+    DailyFormRollup.apply(rollup_deltas)
+    FormStatusEvent.objects.bulk_create([
+        FormStatusEvent(form=form, to_status=form.status, actor_id=form.uploaded_by_id, created_at=form.status_changed_at)
+        for form in forms
+    ])
+    index_forms(forms)
+    bump_context_version_on_commit()
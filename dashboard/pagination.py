@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination for patient forms ordered by (uploaded_at, id).
+
+A cursor encodes the position of a single form, not a page number or offset,
+so fetching any page is one indexed range query regardless of how deep it is,
+and the same cursor stays valid when the search or status filter changes.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 25
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor string cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of forms plus the cursors needed to move to its neighbours"""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(form):
+    """Encode the (uploaded_at, id) position of form as an opaque URL-safe string"""
+    raw = f"{form.uploaded_at.isoformat()}|{form.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor into an (uploaded_at, id) pair"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        uploaded_at, form_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(uploaded_at), int(form_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+def _beyond(position, descending):
+    """Filter for rows that come strictly after position in the given ordering"""
+    uploaded_at, form_id = position
+    if descending:
+        return Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=form_id)
+    return Q(uploaded_at__gt=uploaded_at) | Q(uploaded_at=uploaded_at, id__gt=form_id)
+
+
+def paginate_forms(queryset, descending=True, after=None, before=None, page_size=PAGE_SIZE):
+    """Return the KeysetPage of queryset that follows cursor `after` or precedes cursor `before`"""
+    ordering = ['-uploaded_at', '-id'] if descending else ['uploaded_at', 'id']
+    reverse_ordering = ['uploaded_at', 'id'] if descending else ['-uploaded_at', '-id']
+
+    if before:
+        # Walk backwards from the cursor, then restore display order
+        position = decode_cursor(before)
+        rows = list(queryset.filter(_beyond(position, not descending)).order_by(*reverse_ordering)[:page_size + 1])
+        has_previous = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        # The cursor's own form may have left the queryset since, e.g. under a new filter
+        has_next = queryset.exclude(_beyond(position, not descending)).exists()
+    else:
+        if after:
+            queryset = queryset.filter(_beyond(decode_cursor(after), descending))
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_next = len(rows) > page_size
+        items = rows[:page_size]
+        has_previous = bool(after)
+
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1]) if items and has_next else None,
+        previous_cursor=encode_cursor(items[0]) if items and has_previous else None,
+    )
@@ -0,0 +1,112 @@
+"""
+Small JPEG preview renditions of uploaded patient forms.
+
+Each form gets one preview per PREVIEW_SIZES entry, rendered from the image
+itself or the first page of a PDF, and stored in a previews/ directory next to
+the original. Previews are named after the content hash, so forms sharing a
+stored file (see dashboard.blobs) share its previews too, and a preview URL
+never changes meaning, which lets browsers cache it for good.
+
+Rendering needs Pillow, plus poppler's pdftoppm for PDFs; without them no
+previews are made and the views fall back to the original file.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; previews are skipped without it
+    Image = None
+
+# Longest edge in pixels of each rendition
+PREVIEW_SIZES = {
+    'small': 320,
+    'large': 1280,
+}
+PREVIEW_QUALITY = 80
+PDF_RENDER_TIMEOUT = 30
+
+
+def preview_key(form):
+    """Return the name shared by all previews of form's file"""
+    return form.content_hash or f'form-{form.pk}'
+
+
+def preview_names(file_name, key):
+    """Map each preview size to its storage name for the stored file file_name"""
+    directory = os.path.join(os.path.dirname(file_name), 'previews')
+    return {size: os.path.join(directory, f'{key}_{size}.jpg') for size in PREVIEW_SIZES}
+
+
+def form_preview_names(form):
+    """Map each preview size to the storage name of form's preview"""
+    return preview_names(form.uploaded_file.name, preview_key(form))
+
+
+def generate_previews(form, force=False):
+    """Render and store form's previews, returning the names written.
+
+    Existing previews are kept unless force is set.
+    """
+    if Image is None or not form.uploaded_file:
+        return []
+    storage = form.uploaded_file.storage
+    names = form_preview_names(form)
+    if not force and all(storage.exists(name) for name in names.values()):
+        return []
+
+    source = open_source_image(form)
+    if source is None:
+        return []
+
+    written = []
+    with source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        for size, edge in PREVIEW_SIZES.items():
+            rendition = source.copy()
+            rendition.thumbnail((edge, edge))
+            buffer = BytesIO()
+            rendition.save(buffer, 'JPEG', quality=PREVIEW_QUALITY, optimize=True)
+            # Storage would pick a new name rather than overwrite, so clear the old rendition first
+            storage.delete(names[size])
+            written.append(storage.save(names[size], ContentFile(buffer.getvalue())))
+    return written
+
+
+def open_source_image(form):
+    """Return a PIL image of form's file, or its first page for PDFs, or None if it cannot be rendered"""
+    largest = max(PREVIEW_SIZES.values())
+    try:
+        if os.path.splitext(form.uploaded_file.name)[1].lower() == '.pdf':
+            return render_pdf_first_page(form.uploaded_file.path, largest)
+        image = Image.open(form.uploaded_file.path)
+        # Let the JPEG decoder downscale while decoding instead of loading full-size phone photos
+        image.draft('RGB', (largest, largest))
+        image.load()
+        return image
+    except (OSError, ValueError, NotImplementedError, Image.DecompressionBombError):
+        return None
+
+
+def render_pdf_first_page(path, edge):
+    """Render the first page of the PDF at path with pdftoppm, scaled to edge pixels on its longest side"""
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'page')
+        try:
+            subprocess.run(
+                [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(edge), path, output],
+                check=True, capture_output=True, timeout=PDF_RENDER_TIMEOUT,
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            return None
+        image = Image.open(output + '.png')
+        image.load()
+        return image
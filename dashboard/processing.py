@@ -0,0 +1,108 @@
+"""
+Analysis stage for uploaded patient forms, run off the request path by the
+`analyze_form` job (see dashboard.tasks).
+
+The analyzer itself is pluggable through settings.FORM_ANALYZER: a dotted path
+to a callable that takes a PatientForm and returns a dict with ai_decision,
+ai_feedback and optionally extracted_patient_name.
+"""
+import os
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Fields analyze_form writes back
+ANALYSIS_FIELDS = ['ai_decision', 'ai_feedback', 'extracted_patient_name', 'processed', 'processing_time_seconds']
+
+# Leading bytes each allowed extension's content must start with
+FILE_SIGNATURES = {
+    '.pdf': [b'%PDF-'],
+    '.png': [b'\x89PNG\r\n\x1a\n'],
+    '.jpg': [b'\xff\xd8\xff'],
+    '.jpeg': [b'\xff\xd8\xff'],
+}
+
+
+def analyze_form(form):
+    """Move form through the processing status, run the configured analyzer and record the results"""
+    # Only freshly uploaded forms are shown as processing; reviewed forms keep their status.
+    # A form still processing is left over from a run that died, so a retry takes it over.
+    was_pending = form.status == 'processing' or form.move_status('pending', 'processing')
+
+    analyzer = import_string(settings.FORM_ANALYZER)
+    try:
+        result = analyzer(form)
+    finally:
+        if was_pending:
+            # A reviewer may have decided the form while it was analyzed; their status stands
+            form.move_status('processing', 'pending')
+
+    form.ai_decision = result['ai_decision']
+    form.ai_feedback = result['ai_feedback']
+    if result.get('extracted_patient_name'):
+        form.extracted_patient_name = result['extracted_patient_name']
+    form.processed = True
+    # Processing time is the turnaround from upload to a finished analysis, queue wait included
+    form.processing_time_seconds = max(0, round((timezone.now() - form.uploaded_at).total_seconds()))
+    # Only the analysis is written, so the status and anything else edited meanwhile are left alone
+    form.save(update_fields=ANALYSIS_FIELDS)
+    return form
+
+
+def basic_form_analyzer(form):
+    """Check that the upload is a readable file of the type its extension claims.
+
+    This does not make a clinical recommendation, so every readable form is
+    marked for review; plug a real model in through settings.FORM_ANALYZER.
+    """
+    extension = os.path.splitext(form.uploaded_file.name)[1].lower()
+    try:
+        with form.uploaded_file.open('rb') as uploaded_file:
+            header = uploaded_file.read(16)
+            page_count = count_pdf_pages(uploaded_file) if extension == '.pdf' else None
+    except OSError as e:
+        return {
+            'ai_decision': 'reject',
+            'ai_feedback': f'The uploaded file could not be read: {e}',
+        }
+
+    if not any(header.startswith(signature) for signature in FILE_SIGNATURES.get(extension, [])):
+        return {
+            'ai_decision': 'reject',
+            'ai_feedback': f'The file content does not match its {extension} extension. Please re-upload the form.',
+        }
+
+    feedback = f'{extension[1:].upper()} file received and verified'
+    if page_count:
+        feedback += f' ({page_count} page{"s" if page_count != 1 else ""})'
+    feedback += '. Ready for physician review.'
+    return {
+        'ai_decision': 'review_required',
+        'ai_feedback': feedback,
+    }
+
+
+def count_pdf_pages(uploaded_file, chunk_size=64 * 1024):
+    """Count page objects in an open PDF file, reading it in chunks.
+
+    Pages inside compressed object streams are not visible this way, so 0 means unknown.
+    """
+    uploaded_file.seek(0)
+    count = 0
+    tail = b''
+    while True:
+        chunk = uploaded_file.read(chunk_size)
+        if not chunk:
+            break
+        data = tail + chunk
+        # The tail was already scanned as the end of the previous chunk, so only count what it adds
+        count += _page_markers(data) - _page_markers(tail)
+        tail = data[-12:]
+    return count
+
+
+def _page_markers(data):
+    """Count /Type /Page markers (excluding /Type /Pages) in data"""
+    pages = data.count(b'/Type /Page') + data.count(b'/Type/Page')
+    return pages - data.count(b'/Type /Pages') - data.count(b'/Type/Pages')
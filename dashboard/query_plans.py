@@ -0,0 +1,83 @@
+"""
+Query-plan regression checks for the hot query shapes.
+
+Each app lists the queries its list views and APIs depend on in a hot_queries
+module, as functions returning a QuerySet registered with @register('name').
+The check_query_plans command asks the database how it would run each one
+(EXPLAIN QUERY PLAN on SQLite) and fails when a plan scans a whole table, so a
+schema change that drops or shadows an index is caught before it turns a list
+view back into a table scan.
+
+Queries that are meant to walk an index in order and stop at a LIMIT, like an
+unfiltered keyset page, are registered with allow_index_scan=True; a bare table
+scan still fails them. A sort the planner cannot serve from an index (a temp
+B-tree on SQLite) fails too, since it reads every matching row before the
+LIMIT applies.
+"""
+import re
+
+from django.db import connection
+from django.utils.module_loading import autodiscover_modules
+
+HOT_QUERIES = {}
+
+# Plan lines that read every row of a table, optionally through an index
+SCAN_PATTERN = re.compile(r'\bSCAN (?:TABLE )?(?P<table>\w+)(?P<index> USING (?:COVERING )?INDEX \w+)?')
+SORT_PATTERN = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|GROUP BY|DISTINCT)')
+
+
+class HotQuery:
+    """A registered query shape and the plan shapes it may take"""
+
+    def __init__(self, name, build, allow_index_scan=False):
+        self.name = name
+        self.build = build
+        self.allow_index_scan = allow_index_scan
+
+
+def register(name, allow_index_scan=False):
+    """Decorator registering a function that builds a hot query for plan checks"""
+    def decorator(func):
+        HOT_QUERIES[name] = HotQuery(name, func, allow_index_scan)
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import every installed app's hot_queries module so its queries are registered"""
+    autodiscover_modules('hot_queries')
+
+
+def query_plan(queryset):
+    """Return the database's plan for queryset as a list of lines"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def plan_problems(hot_query, plan):
+    """Return the problems found in a query plan"""
+    errors = []
+    for line in plan:
+        scan = SCAN_PATTERN.search(line)
+        # Subqueries and constant rows are scans of intermediate results, not tables
+        if scan and not line.lstrip().startswith(('SCAN (', 'SCAN CONSTANT')):
+            if not scan.group('index') or not hot_query.allow_index_scan:
+                errors.append(f'full scan: {line.strip()}')
+        elif 'Seq Scan on' in line:
+            errors.append(f'full scan: {line.strip()}')
+        if SORT_PATTERN.search(line):
+            errors.append(f'sort not served by an index: {line.strip()}')
+    return errors
+
+
+def check_hot_queries(names=None):
+    """Yield (hot query, plan, errors) for the registered queries, or those named"""
+    for name in sorted(names or HOT_QUERIES):
+        hot_query = HOT_QUERIES[name]
+        plan = query_plan(hot_query.build())
+        yield hot_query, plan, plan_problems(hot_query, plan)
@@ -0,0 +1,71 @@
+"""
+SQLite FTS5 search index over patient names.
+
+The dashboard_patientform_fts table holds a trigram-tokenized copy of
+patient_name and extracted_patient_name keyed by form id. Trigram matching gives
+the same case-insensitive substring semantics as icontains but is answered from
+the index instead of scanning dashboard_patientform. The PatientForm signal
+handlers in dashboard.models keep it in sync; rebuild_search_index repairs it.
+
+Queries shorter than three characters (the trigram size) and databases without
+FTS5 fall back to icontains.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'dashboard_patientform_fts'
+MIN_QUERY_LENGTH = 3
+
+_index_available = None
+
+
+def search_index_available():
+    """Return True when the FTS table exists on the default database"""
+    global _index_available
+    if _index_available is None:
+        _index_available = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _index_available
+
+
+def index_forms(forms):
+    """Add or refresh the index entries for forms"""
+    if not forms or not search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(form.pk,) for form in forms])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, patient_name, extracted_patient_name) VALUES (%s, %s, %s)",
+            [(form.pk, form.patient_name, form.extracted_patient_name) for form in forms],
+        )
+
+
+def unindex_forms(form_ids):
+    """Remove the index entries for the given form ids"""
+    if not form_ids or not search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(form_id,) for form_id in form_ids])
+
+
+def rebuild_search_index():
+    """Repopulate the index from dashboard_patientform and return the number of rows indexed"""
+    if not search_index_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, patient_name, extracted_patient_name) "
+            f"SELECT id, patient_name, extracted_patient_name FROM dashboard_patientform"
+        )
+        return cursor.rowcount
+
+
+def filter_forms_by_name(queryset, query):
+    """Narrow queryset to forms whose patient_name or extracted_patient_name contains query"""
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH or not search_index_available():
+        return queryset.filter(Q(patient_name__icontains=query) | Q(extracted_patient_name__icontains=query))
+    # A quoted phrase of trigrams matches the query as a contiguous substring
+    phrase = '"' + query.replace('"', '""') + '"'
+    return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [phrase]))
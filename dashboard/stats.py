@@ -0,0 +1,111 @@
+"""
+Patient form statistics backed by the materialized FormCounter and
+DailyFormRollup tables.
+
+Both tables are adjusted by the PatientForm signal handlers in dashboard.models,
+so reading them costs one small query no matter how many forms are stored.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyFormRollup, FormCounter, PatientForm
+
+PROCESSING_TARGET_SECONDS = PatientForm.PROCESSING_TARGET_MINUTES * 60
+
+
+def get_form_stats(today=None):
+    """Return form counts per status plus processing-time and daily upload figures"""
+    today = today or timezone.localdate()
+    status_keys = {f"status:{status}": status for status, _ in PatientForm.STATUS_CHOICES}
+    counters = dict(
+        FormCounter.objects.filter(
+            key__in=[*status_keys, 'processed:count', 'timed:count', 'timed:seconds', 'timed:under_target']
+        ).values_list('key', 'value')
+    )
+
+    stats = {status: counters.get(key, 0) for key, status in status_keys.items()}
+    stats['total'] = sum(stats[status] for status in status_keys.values())
+    # Cancelled forms are hidden by default, so "active" is what most views show
+    stats['active'] = stats['total'] - stats['cancelled']
+    stats['processed'] = counters.get('processed:count', 0)
+    stats['under_target'] = counters.get('timed:under_target', 0)
+    stats['uploaded_today'] = DailyFormRollup.objects.filter(date=today).values_list('uploaded_count', flat=True).first() or 0
+
+    timed_count = counters.get('timed:count', 0)
+    stats['avg_processing_seconds'] = counters.get('timed:seconds', 0) / timed_count if timed_count else None
+    return stats
+
+
+def get_daily_rollups(days, today=None):
+    """Return one DailyFormRollup per day for the last `days` days, oldest first.
+
+    Days without uploads get an unsaved, zero-filled rollup so charts have no gaps.
+    """
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    stored = {rollup.date: rollup for rollup in DailyFormRollup.objects.filter(date__gte=start, date__lte=today)}
+    return [stored.get(start + timedelta(days=offset)) or DailyFormRollup(date=start + timedelta(days=offset)) for offset in range(days)]
+
+
+def rebuild_form_counters():
+    """Recompute every FormCounter row from the PatientForm table"""
+    counters = {}
+    for row in PatientForm.objects.order_by().values('status').annotate(total=Count('id')):
+        counters[f"status:{row['status']}"] = row['total']
+
+    totals = PatientForm.objects.aggregate(
+        processed=Count('id', filter=Q(processed=True)),
+        timed=Count('processing_time_seconds'),
+        seconds=Sum('processing_time_seconds'),
+        under_target=Count('id', filter=Q(processing_time_seconds__lt=PROCESSING_TARGET_SECONDS)),
+    )
+    counters['processed:count'] = totals['processed']
+    counters['timed:count'] = totals['timed']
+    counters['timed:seconds'] = totals['seconds'] or 0
+    counters['timed:under_target'] = totals['under_target']
+
+    with transaction.atomic():
+        FormCounter.objects.all().delete()
+        FormCounter.objects.bulk_create([FormCounter(key=key, value=value) for key, value in counters.items()])
+    return counters
+
+
+def rebuild_daily_rollups(since=None):
+    """Recompute DailyFormRollup rows from the PatientForm table, optionally only from date `since`"""
+    forms = PatientForm.objects.order_by()
+    rollups = DailyFormRollup.objects.all()
+    if since:
+        forms = forms.filter(uploaded_at__date__gte=since)
+        rollups = rollups.filter(date__gte=since)
+
+    rows = forms.annotate(day=TruncDate('uploaded_at')).values('day').annotate(
+        uploaded=Count('id'),
+        processed=Count('id', filter=Q(processed=True)),
+        timed=Count('processing_time_seconds'),
+        seconds=Sum('processing_time_seconds'),
+        under_target=Count('id', filter=Q(processing_time_seconds__lt=PROCESSING_TARGET_SECONDS)),
+        approved=Count('id', filter=Q(status='approved')),
+        rejected=Count('id', filter=Q(status='rejected')),
+    )
+    new_rollups = [
+        DailyFormRollup(
+            date=row['day'],
+            uploaded_count=row['uploaded'],
+            processed_count=row['processed'],
+            timed_count=row['timed'],
+            processing_seconds_total=row['seconds'] or 0,
+            under_target_count=row['under_target'],
+            approved_count=row['approved'],
+            rejected_count=row['rejected'],
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        rollups.delete()
+        DailyFormRollup.objects.bulk_create(new_rollups)
+    return new_rollups
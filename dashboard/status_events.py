@@ -0,0 +1,71 @@
+"""
+Readers over the append-only FormStatusEvent log.
+
+PatientForm.save() writes one event per status transition, in the same
+transaction as the form row, and track_bulk_created_forms writes the first
+event of forms inserted in bulk. Set form.status_actor before saving to record
+who made the change. Events are never updated, so their ids only grow, and a
+consumer that remembers the last id it handled can pick up exactly the events
+after it: form_timeline serves one form's history, and iter_status_events
+streams the whole log in id order for analytics and incremental consumers.
+"""
+from .models import FormStatusEvent, PatientForm
+
+TIMELINE_LIMIT = 200
+STREAM_BATCH_SIZE = 1000
+
+# Columns yielded by iter_status_events
+EVENT_FIELDS = ('id', 'form_id', 'from_status', 'to_status', 'actor_id', 'created_at')
+
+
+def form_timeline(form, after_id=0, limit=TIMELINE_LIMIT):
+    """Return (events, has_more): up to limit of form's status events after the id after_id, oldest first"""
+    events = FormStatusEvent.objects.filter(form=form, id__gt=after_id).select_related('actor')
+    rows = list(events.order_by('id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def event_payload(event):
+    """Return the JSON representation of a status event"""
+    statuses = dict(PatientForm.STATUS_CHOICES)
+    return {
+        'id': event.id,
+        'form_id': event.form_id,
+        'from_status': event.from_status,
+        'to_status': event.to_status,
+        'to_status_display': statuses.get(event.to_status, event.to_status),
+        'actor': (event.actor.get_full_name() or event.actor.username) if event.actor else None,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+def iter_status_events(after_id=0, until_id=None, batch_size=STREAM_BATCH_SIZE, since=None):
+    """Yield the log's events after after_id as dicts of EVENT_FIELDS, in id order.
+
+    The log is read a batch at a time by id, so memory use stays flat however
+    long it is. until_id stops at a fixed id, so a run does not chase events
+    written while it reads; since skips events created before a datetime.
+    """
+    events = FormStatusEvent.objects.order_by('id')
+    if until_id is not None:
+        events = events.filter(id__lte=until_id)
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    while True:
+        batch = list(events.filter(id__gt=after_id).values(*EVENT_FIELDS)[:batch_size])
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after_id = batch[-1]['id']
+
+
+def latest_event_id():
+    """Return the id of the newest status event, or 0 when there are none"""
+    return FormStatusEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def previous_statuses(form_ids):
+    """Return {form id: status before its latest cancellation} for the given forms"""
+    rows = FormStatusEvent.objects.filter(form_id__in=form_ids, to_status='cancelled').order_by('id')
+    # Later cancellations overwrite earlier ones
+    return dict(rows.values_list('form_id', 'from_status'))
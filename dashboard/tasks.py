@@ -0,0 +1,47 @@
+"""
+Background job handlers for the dashboard app (see dashboard.jobs).
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .jobs import enqueue, register
+from .models import PatientForm
+from .processing import analyze_form
+from .previews import generate_previews
+from .media_gc import collect_orphaned_media
+
+
+@register('analyze_form')
+def analyze_form_job(payload):
+    """Run the analysis stage for an uploaded form"""
+    form = PatientForm.objects.filter(pk=payload['form_id']).first()
+    if form is None:
+        return  # Deleted before a worker got to it
+    analyze_form(form)
+
+
+@register('generate_previews')
+def generate_previews_job(payload):
+    """Render the preview images for an uploaded form"""
+    form = PatientForm.objects.filter(pk=payload['form_id']).first()
+    if form is None:
+        return
+    generate_previews(form, force=payload.get('force', False))
+
+
+@register('collect_orphaned_media')
+def collect_orphaned_media_job(payload):
+    """Sweep unreferenced media files, rescheduling itself when repeat_every is set"""
+    collect_orphaned_media(
+        dry_run=payload.get('dry_run', False),
+        quarantine=payload.get('quarantine', True),
+        grace=timedelta(seconds=payload.get('grace_seconds', 3600)),
+        max_per_second=payload.get('max_per_second'),
+    )
+    if payload.get('repeat_every'):
+        enqueue(
+            'collect_orphaned_media', payload,
+            run_after=timezone.now() + timedelta(seconds=payload['repeat_every']),
+            max_attempts=1,
+        )
@@ -0,0 +1,573 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from PIL import Image
+
+from .chunked_upload import OffsetMismatch, append_chunk, session_path, start_session
+from .events import fetch_events
+from .file_responses import UnsatisfiableRange, parse_range_header
+from .home_cache import get_context_version
+from .jobs import claim_next, enqueue, requeue_stale_jobs
+from .media_gc import collect_orphaned_media
+from .models import DailyFormRollup, FormCounter, Job, PatientForm, StoredBlob, UploadSession
+from .pagination import paginate_forms
+from .previews import PREVIEW_SIZES, form_preview_names, generate_previews, preview_names
+from .processing import analyze_form
+from .query_plans import HotQuery, autodiscover, check_hot_queries, plan_problems
+from .search import filter_forms_by_name, search_index_available
+from .stats import get_daily_rollups, get_form_stats, rebuild_daily_rollups, rebuild_form_counters
+from .views import build_home_context, create_uploaded_form
+
+
+def make_form(**fields):
+    return PatientForm.objects.create(uploaded_file=SimpleUploadedFile('form.pdf', b'%PDF-1.4 test'), **fields)
+
+
+def failing_analyzer(form):
+    raise RuntimeError('analyzer crashed')
+
+
+def approving_analyzer(form):
+    # A reviewer decides the form while the analyzer runs
+    reviewed = PatientForm.objects.get(pk=form.pk)
+    reviewed.status = 'approved'
+    reviewed.save()
+    return {'ai_decision': 'accept', 'ai_feedback': 'Looks complete.'}
+
+
+class MediaTestCase(TestCase):
+    """Test case whose uploads go to a throwaway MEDIA_ROOT"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(
+            MEDIA_ROOT=cls.media_root, CHUNKED_UPLOAD_DIR=os.path.join(cls.media_root, 'upload_sessions'),
+        ))
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        super().setUpClass()
+
+
+class FormCounterTests(MediaTestCase):
+    def test_saves_of_stale_instances_apply_deltas_to_the_stored_row(self):
+        form = make_form(patient_name='Jane Roe')
+        first = PatientForm.objects.get(pk=form.pk)
+        second = PatientForm.objects.get(pk=form.pk)
+
+        first.status = 'approved'
+        first.save()
+        # second was loaded as pending, but the row it replaces is approved by now
+        second.status = 'rejected'
+        second.save()
+
+        stats = get_form_stats()
+        self.assertEqual((stats['pending'], stats['approved'], stats['rejected'], stats['total']), (0, 0, 1, 1))
+        self.assertEqual(list(form.status_events.values_list('from_status', 'to_status')), [
+            ('', 'pending'), ('pending', 'approved'), ('approved', 'rejected'),
+        ])
+
+        counters = dict(FormCounter.objects.values_list('key', 'value'))
+        rollups = list(DailyFormRollup.objects.values('date', 'approved_count', 'rejected_count'))
+        rebuild_form_counters()
+        rebuild_daily_rollups()
+        self.assertEqual({key: value for key, value in counters.items() if value}, {
+            key: value for key, value in FormCounter.objects.values_list('key', 'value') if value
+        })
+        self.assertEqual(rollups, list(DailyFormRollup.objects.values('date', 'approved_count', 'rejected_count')))
+
+
+class PaginationTests(MediaTestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.forms = []
+        for minutes, status in enumerate(['pending', 'approved', 'pending', 'approved', 'approved']):
+            form = make_form(status=status)
+            PatientForm.objects.filter(pk=form.pk).update(uploaded_at=now - timedelta(minutes=minutes))
+            self.forms.append(form.pk)
+
+    def ids(self, page):
+        return [form.pk for form in page]
+
+    def test_next_cursors_walk_every_form_once(self):
+        seen = []
+        page = paginate_forms(PatientForm.objects.all(), page_size=2)
+        while True:
+            seen += self.ids(page)
+            if not page.next_cursor:
+                break
+            page = paginate_forms(PatientForm.objects.all(), after=page.next_cursor, page_size=2)
+        self.assertEqual(seen, self.forms)
+
+    def test_cursors_survive_filter_and_sort_changes(self):
+        cursor = paginate_forms(PatientForm.objects.all(), page_size=1).next_cursor
+        approved = PatientForm.objects.filter(status='approved')
+        self.assertEqual(self.ids(paginate_forms(approved, after=cursor, page_size=5)), [self.forms[1], self.forms[3], self.forms[4]])
+        self.assertEqual(self.ids(paginate_forms(approved, descending=False, after=cursor, page_size=5)), [])
+
+    def test_pages_before_a_cursor_know_what_follows_them(self):
+        second = paginate_forms(PatientForm.objects.all(), after=paginate_forms(PatientForm.objects.all(), page_size=2).next_cursor, page_size=2)
+        first = paginate_forms(PatientForm.objects.all(), before=second.previous_cursor, page_size=2)
+        self.assertEqual((self.ids(first), first.previous_cursor is None, first.next_cursor is not None), (self.forms[:2], True, True))
+
+        # Under a filter nothing is left at or after the last form's cursor
+        last = paginate_forms(PatientForm.objects.all(), after=second.next_cursor, page_size=2)
+        pending = paginate_forms(PatientForm.objects.filter(status='pending'), before=last.previous_cursor, page_size=2)
+        self.assertEqual((self.ids(pending), pending.next_cursor), ([self.forms[0], self.forms[2]], None))
+
+
+class PatientNameSearchTests(MediaTestCase):
+    def setUp(self):
+        self.jane = make_form(patient_name='Jane Roe')
+        self.extracted = make_form(extracted_patient_name='Robert "Bob" Lee')
+        self.other = make_form(patient_name='Ann Smith')
+
+    def matches(self, query):
+        return set(filter_forms_by_name(PatientForm.objects.all(), query).values_list('pk', flat=True))
+
+    def test_substrings_of_either_name_match_through_the_index(self):
+        self.assertTrue(search_index_available())
+        self.assertEqual(self.matches('ROE'), {self.jane.pk})
+        self.assertEqual(self.matches('"bob"'), {self.extracted.pk})
+        self.assertEqual(self.matches('mith'), {self.other.pk})
+
+    def test_queries_shorter_than_a_trigram_fall_back_to_icontains(self):
+        self.assertEqual(self.matches('ro'), {self.jane.pk, self.extracted.pk})
+        self.assertEqual(self.matches('e'), {self.jane.pk, self.extracted.pk})
+
+    def test_renamed_forms_are_found_by_their_new_name_only(self):
+        self.jane.patient_name = 'Janet Doe'
+        self.jane.save()
+        self.assertEqual(self.matches('Roe'), set())
+        self.assertEqual(self.matches('janet'), {self.jane.pk})
+
+
+class DailyRollupTests(MediaTestCase):
+    def rollup(self, date):
+        return DailyFormRollup.objects.filter(date=date).values(
+            'uploaded_count', 'processed_count', 'timed_count', 'processing_seconds_total',
+            'under_target_count', 'approved_count', 'rejected_count',
+        ).first()
+
+    def test_status_moves_and_deletes_adjust_the_upload_day(self):
+        today = timezone.localdate()
+        make_form()
+        moved = make_form()
+        moved.processed = True
+        moved.processing_time_seconds = 120
+        moved.status = 'approved'
+        moved.save()
+        moved.status = 'rejected'
+        moved.save()
+        self.assertEqual(self.rollup(today), {
+            'uploaded_count': 2, 'processed_count': 1, 'timed_count': 1, 'processing_seconds_total': 120,
+            'under_target_count': 1, 'approved_count': 0, 'rejected_count': 1,
+        })
+        self.assertEqual((get_form_stats()['rejected'], get_form_stats()['avg_processing_seconds']), (1, 120))
+
+        moved.delete()
+        incremental = self.rollup(today)
+        self.assertEqual((incremental['uploaded_count'], incremental['rejected_count'], incremental['timed_count']), (1, 0, 0))
+        self.assertEqual((get_form_stats()['total'], get_form_stats()['rejected']), (1, 0))
+        rebuild_daily_rollups()
+        self.assertEqual(self.rollup(today), incremental)
+
+    def test_days_without_uploads_are_zero_filled(self):
+        today = timezone.localdate()
+        make_form()
+        rollups = get_daily_rollups(3, today=today)
+        self.assertEqual([rollup.date for rollup in rollups], [today - timedelta(days=2), today - timedelta(days=1), today])
+        self.assertEqual([rollup.uploaded_count for rollup in rollups], [0, 0, 1])
+        self.assertIsNone(rollups[0].pk)
+
+
+class HomeCacheTests(MediaTestCase):
+    def test_form_writes_invalidate_the_dashboard_only_once_committed(self):
+        version = get_context_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_form(patient_name='Jane Roe')
+            self.assertEqual(get_context_version(), version)
+        self.assertNotEqual(get_context_version(), version)
+
+    def test_rolled_back_writes_leave_the_dashboard_cached(self):
+        version = get_context_version()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            make_form(patient_name='Jane Roe')
+            raise RuntimeError
+        self.assertEqual(get_context_version(), version)
+
+    def test_home_context_queries_do_not_grow_with_conversations(self):
+        from messaging.models import Conversation, Message
+        administrator = User.objects.create_user('administrator', password='secret')
+        administrator.profile.role = 'administrator'
+        administrator.profile.save()
+        sender = User.objects.create_user('physician', password='secret')
+
+        def add_conversations(count):
+            for _ in range(count):
+                conversation = Conversation.objects.create()
+                conversation.participants.add(administrator, sender)
+                Message.objects.create(conversation=conversation, sender=sender, content='Please review')
+            with CaptureQueriesContext(connection) as queries:
+                context = build_home_context(User.objects.select_related('profile').get(pk=administrator.pk))
+            return len(queries), context
+
+        few, _ = add_conversations(1)
+        many, context = add_conversations(4)
+        self.assertEqual(few, many)
+        self.assertEqual(context['unread_messages_count'], 5)
+        self.assertEqual(context['latest_conversation'], Conversation.objects.order_by('-updated_at', '-id').first())
+
+
+class AnalyzeFormTests(MediaTestCase):
+    def stored_status(self, form):
+        return PatientForm.objects.values_list('status', flat=True).get(pk=form.pk)
+
+    @override_settings(FORM_ANALYZER='dashboard.tests.failing_analyzer')
+    def test_failed_analysis_puts_the_form_back_to_pending(self):
+        form = make_form()
+        with self.assertRaises(RuntimeError):
+            analyze_form(form)
+        self.assertEqual(self.stored_status(form), 'pending')
+
+    def test_retry_of_a_form_left_processing_finishes_it(self):
+        form = make_form()
+        # A worker died mid-analysis and left the form processing
+        PatientForm.objects.get(pk=form.pk).move_status('pending', 'processing')
+        analyze_form(PatientForm.objects.get(pk=form.pk))
+        self.assertEqual(self.stored_status(form), 'pending')
+        self.assertEqual(get_form_stats()['processing'], 0)
+
+    @override_settings(FORM_ANALYZER='dashboard.tests.approving_analyzer')
+    def test_status_set_during_analysis_is_kept(self):
+        form = make_form()
+        analyze_form(PatientForm.objects.get(pk=form.pk))
+        form.refresh_from_db()
+        self.assertEqual((form.status, form.ai_decision, form.processed), ('approved', 'accept', True))
+        self.assertEqual(list(form.status_events.values_list('from_status', 'to_status')), [
+            ('', 'pending'), ('pending', 'processing'), ('processing', 'approved'),
+        ])
+
+
+class JobQueueTests(TestCase):
+    def stale_running_job(self, attempts):
+        job = enqueue('analyze_form', {'form_id': 1})
+        for _ in range(attempts):
+            Job.objects.filter(pk=job.pk).update(status='queued')
+            claim_next('worker-1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        return job
+
+    def test_a_job_is_claimed_by_one_worker_only(self):
+        job = enqueue('analyze_form', {'form_id': 1})
+        self.assertEqual(claim_next('worker-1').pk, job.pk)
+        self.assertIsNone(claim_next('worker-2'))
+
+    def test_stale_jobs_with_attempts_left_are_requeued(self):
+        job = self.stale_running_job(attempts=1)
+        self.assertEqual(requeue_stale_jobs(stale_after=600), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('queued', ''))
+
+    def test_stale_jobs_out_of_attempts_fail_instead_of_looping(self):
+        job = self.stale_running_job(attempts=3)
+        self.assertEqual(requeue_stale_jobs(stale_after=600), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(claim_next('worker-1'))
+
+
+class DeduplicationTests(MediaTestCase):
+    def upload(self, content=b'%PDF-1.4 same'):
+        return create_uploaded_form(None, SimpleUploadedFile('form.pdf', content), 'Jane Roe')
+
+    def queued_form_ids(self):
+        return sorted(job.payload['form_id'] for job in Job.objects.filter(kind='analyze_form'))
+
+    def test_copies_of_an_analyzed_form_share_its_file_and_results(self):
+        original = self.upload()
+        PatientForm.objects.filter(pk=original.pk).update(processed=True, ai_decision='accept', ai_feedback='Complete.')
+        copy = self.upload()
+        self.assertEqual((copy.duplicate_of_id, copy.uploaded_file.name), (original.pk, original.uploaded_file.name))
+        self.assertEqual((copy.processed, copy.ai_decision), (True, 'accept'))
+        self.assertEqual(self.queued_form_ids(), [original.pk])
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+    def test_copies_of_an_unanalyzed_form_are_still_analyzed(self):
+        original = self.upload()
+        copy = self.upload()
+        self.assertEqual(copy.duplicate_of_id, original.pk)
+        self.assertEqual(self.queued_form_ids(), [original.pk, copy.pk])
+
+    def test_the_stored_file_is_removed_with_its_last_form(self):
+        original = self.upload()
+        copy = self.upload()
+        storage = original.uploaded_file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+        self.assertTrue(storage.exists(copy.uploaded_file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertFalse(storage.exists(copy.uploaded_file.name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+
+class FileLayoutTests(MediaTestCase):
+    def legacy_form(self, content):
+        form = create_uploaded_form(None, SimpleUploadedFile('form.pdf', content), 'Jane Roe')
+        storage = form.uploaded_file.storage
+        legacy_name = storage.save('patient_forms/form.pdf', ContentFile(content))
+        preview_name = storage.save(preview_names(legacy_name, form.content_hash)['small'], ContentFile(b'jpeg'))
+        storage.delete(form.uploaded_file.name)
+        StoredBlob.objects.filter(content_hash=form.content_hash).update(file_name=legacy_name)
+        PatientForm.objects.filter(pk=form.pk).update(uploaded_file=legacy_name)
+        return PatientForm.objects.get(pk=form.pk), legacy_name, preview_name
+
+    def test_uploads_are_stored_under_their_content_hash(self):
+        form = create_uploaded_form(None, SimpleUploadedFile('Scan 1.PDF', b'%PDF-1.4 sharded'), 'Jane Roe')
+        key = form.content_hash
+        self.assertEqual(form.uploaded_file.name, f'patient_forms/{key[:2]}/{key[2:4]}/{key}.pdf')
+        self.assertEqual(form.display_file_name, 'Scan 1.PDF')
+
+    def test_migrate_file_layout_moves_files_and_previews(self):
+        form, legacy_name, preview_name = self.legacy_form(b'%PDF-1.4 legacy')
+        storage = form.uploaded_file.storage
+        call_command('migrate_file_layout', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(PatientForm.objects.get(pk=form.pk).uploaded_file.name, legacy_name)
+
+        call_command('migrate_file_layout', stdout=io.StringIO())
+        form.refresh_from_db()
+        key = form.content_hash
+        self.assertEqual(form.uploaded_file.name, f'patient_forms/{key[:2]}/{key[2:4]}/{key}.pdf')
+        self.assertEqual(StoredBlob.objects.get(content_hash=key).file_name, form.uploaded_file.name)
+        with form.uploaded_file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF-1.4 legacy')
+        self.assertFalse(storage.exists(legacy_name) or storage.exists(preview_name))
+        self.assertTrue(storage.exists(form_preview_names(form)['small']))
+
+
+class MediaGarbageCollectionTests(MediaTestCase):
+    def media_file(self, name, age=timedelta(days=1)):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'stale')
+        old = (timezone.now() - age).timestamp()
+        os.utime(path, (old, old))
+        return path
+
+    def test_dry_runs_report_orphans_and_real_runs_quarantine_them(self):
+        form = create_uploaded_form(None, SimpleUploadedFile('form.pdf', b'%PDF-1.4 kept'), 'Jane Roe')
+        stored = form.uploaded_file.path
+        os.utime(stored, (0, 0))
+        kept = [
+            stored,
+            self.media_file(form_preview_names(form)['small']),
+            # Too young to tell from an upload whose row is not committed yet
+            self.media_file('patient_forms/new.pdf', age=timedelta(minutes=5)),
+        ]
+        orphan = self.media_file('patient_forms/orphan.pdf')
+        stray_part = self.media_file('upload_sessions/stray.part')
+
+        reported = []
+        stats = collect_orphaned_media(dry_run=True, on_orphan=reported.append)
+        self.assertEqual((stats['orphaned'], stats['removed']), (2, 0))
+        self.assertEqual(sorted(reported), sorted(['patient_forms/orphan.pdf', stray_part]))
+        self.assertTrue(os.path.exists(orphan) and os.path.exists(stray_part))
+
+        stats = collect_orphaned_media()
+        self.assertEqual(stats['removed'], 2)
+        self.assertFalse(os.path.exists(orphan) or os.path.exists(stray_part))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'quarantine', 'patient_forms', 'orphan.pdf')))
+        self.assertTrue(all(os.path.exists(path) for path in kept))
+
+
+class BatchUploadTests(MediaTestCase):
+    def test_identical_files_in_one_batch_are_flagged_as_duplicates(self):
+        self.client.force_login(User.objects.create_user('uploader', password='secret'))
+        response = self.client.post('/ajax-batch-upload/', {'files': [
+            SimpleUploadedFile('a.pdf', b'%PDF-1.4 same'),
+            SimpleUploadedFile('b.pdf', b'%PDF-1.4 other'),
+            SimpleUploadedFile('c.pdf', b'%PDF-1.4 same'),
+        ]})
+        first, other, copy = response.json()['results']
+        self.assertEqual((first['duplicate_of'], other['duplicate_of'], copy['duplicate_of']), (None, None, first['file_id']))
+        self.assertEqual(StoredBlob.objects.get(content_hash=PatientForm.objects.get(pk=copy['file_id']).content_hash).ref_count, 2)
+
+
+class ChunkedUploadTests(MediaTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('uploader', password='secret')
+        self.session = start_session(self.user, 'form.pdf', size=8)
+
+    def stored_bytes(self):
+        with open(session_path(self.session), 'rb') as part:
+            return part.read()
+
+    def test_a_retried_chunk_losing_the_race_leaves_received_bytes_alone(self):
+        original = UploadSession.objects.get(pk=self.session.pk)
+        retry = UploadSession.objects.get(pk=self.session.pk)
+        self.assertEqual(append_chunk(original, io.BytesIO(b'%PDF'), 0, 4), 4)
+        # The retry read the session before the original chunk was counted
+        with self.assertRaises(OffsetMismatch) as raised:
+            append_chunk(retry, io.BytesIO(b'XXXX'), 0, 4)
+        self.assertEqual(raised.exception.expected, 4)
+        self.assertEqual(self.stored_bytes(), b'%PDF')
+        self.assertEqual(os.listdir(os.path.dirname(session_path(self.session))), [f'{self.session.pk}.part'])
+
+    def test_clients_resume_from_the_offset_the_server_reports(self):
+        self.client.force_login(self.user)
+        content = b'%PDF-1.4 resumed upload'
+        started = self.client.post('/uploads/', {'file_name': 'form.pdf', 'size': len(content), 'patient_name': 'Jane Roe'},
+                                   content_type='application/json').json()
+        url = f"/uploads/{started['upload_id']}/"
+
+        def put(offset, data):
+            return self.client.put(f'{url}?offset={offset}', data, content_type='application/octet-stream')
+
+        self.assertEqual(put(0, content[:10]).json()['offset'], 10)
+        # The client lost the reply and resends from a stale offset
+        mismatch = put(4, content[4:10])
+        self.assertEqual((mismatch.status_code, mismatch.json()['offset']), (409, 10))
+        self.assertEqual(self.client.post(f'{url}complete/').status_code, 409)
+
+        self.assertEqual(self.client.get(url).json()['offset'], 10)
+        self.assertEqual(put(10, content[10:]).json()['offset'], len(content))
+        completed = self.client.post(f'{url}complete/').json()
+        form = PatientForm.objects.get(pk=completed['file_id'])
+        with form.uploaded_file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertEqual((form.patient_name, form.original_filename), ('Jane Roe', 'form.pdf'))
+
+
+class PreviewTests(MediaTestCase):
+    def upload_image(self, uploader=None, color='white'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), color).save(buffer, 'PNG')
+        return create_uploaded_form(uploader, SimpleUploadedFile('scan.png', buffer.getvalue()), 'Jane Roe')
+
+    def test_previews_are_rendered_once_per_size_and_shared_by_copies(self):
+        form = self.upload_image()
+        self.assertEqual(len(generate_previews(form)), len(PREVIEW_SIZES))
+        storage = form.uploaded_file.storage
+        for size, edge in PREVIEW_SIZES.items():
+            with storage.open(form_preview_names(form)[size]) as preview, Image.open(preview) as image:
+                self.assertEqual((image.format, max(image.size)), ('JPEG', edge))
+
+        copy = self.upload_image()
+        self.assertEqual(form_preview_names(copy), form_preview_names(form))
+        self.assertEqual(generate_previews(copy), [])
+
+    def test_previews_are_served_with_immutable_caching(self):
+        uploader = User.objects.create_user('uploader', password='secret')
+        # Previews are keyed by content and the class shares one MEDIA_ROOT, so use an image of its own
+        form = self.upload_image(uploader, color='black')
+        self.client.force_login(uploader)
+        self.assertEqual(self.client.get(f'/files/{form.pk}/preview/small/').status_code, 404)
+        generate_previews(form)
+        response = self.client.get(f'/files/{form.pk}/preview/small/')
+        self.assertEqual((response.status_code, response['Cache-Control']), (200, 'private, max-age=31536000, immutable'))
+
+
+class FileResponseTests(MediaTestCase):
+    def setUp(self):
+        self.content = b'%PDF-1.4 test'
+        uploader = User.objects.create_user('uploader', password='secret')
+        self.form = create_uploaded_form(uploader, SimpleUploadedFile('form.pdf', self.content), 'Jane Roe')
+
+    def get(self, client, **headers):
+        return client.get(f'/files/{self.form.pk}/', headers=headers)
+
+    def test_asgi_file_responses_stream_through_async_iterators(self):
+        client = AsyncClient()
+        client.force_login(self.form.uploaded_by)
+        full = async_to_sync(self.get)(client)
+        partial = async_to_sync(self.get)(client, Range='bytes=2-5')
+        # Django drains sync iterators into memory under ASGI, so both bodies must be async
+        self.assertTrue(full.is_async and partial.is_async)
+        self.assertEqual((full.status_code, full['Content-Length']), (200, str(len(self.content))))
+        self.assertEqual((partial.status_code, partial['Content-Range']), (206, f'bytes 2-5/{len(self.content)}'))
+
+        async def body(response):
+            return b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(async_to_sync(body)(full), self.content)
+        self.assertEqual(async_to_sync(body)(partial), self.content[2:6])
+
+    def test_ranges_are_parsed_per_rfc_9110(self):
+        self.assertEqual(parse_range_header('bytes=2-5', 13), (2, 5))
+        self.assertEqual(parse_range_header('bytes=10-', 13), (10, 12))
+        self.assertEqual(parse_range_header('bytes=-4', 13), (9, 12))
+        self.assertEqual(parse_range_header('bytes=5-99', 13), (5, 12))
+        self.assertIsNone(parse_range_header('bytes=0-1,4-5', 13))
+        with self.assertRaises(UnsatisfiableRange):
+            parse_range_header('bytes=13-', 13)
+
+    def test_conditional_and_range_requests(self):
+        self.client.force_login(self.form.uploaded_by)
+        full = self.get(self.client)
+        etag = full['ETag']
+        self.assertEqual((full.status_code, full['Accept-Ranges']), (200, 'bytes'))
+        self.assertEqual(b''.join(full.streaming_content), self.content)
+
+        self.assertEqual(self.get(self.client, If_None_Match=etag).status_code, 304)
+        self.assertEqual(self.get(self.client, Range='bytes=-4', If_Range=etag).status_code, 206)
+        # A stale If-Range validator gets the whole current file instead of a range
+        stale = self.get(self.client, Range='bytes=-4', If_Range='"stale"')
+        self.assertEqual((stale.status_code, b''.join(stale.streaming_content)), (200, self.content))
+        unsatisfiable = self.get(self.client, Range='bytes=100-')
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, f'bytes */{len(self.content)}'))
+
+    def test_wsgi_file_responses_stay_synchronous(self):
+        self.client.force_login(self.form.uploaded_by)
+        response = self.get(self.client, Range='bytes=2-5')
+        self.assertFalse(response.is_async)
+        self.assertEqual(b''.join(response.streaming_content), self.content[2:6])
+
+
+class EventStreamTests(MediaTestCase):
+    def user_with_role(self, username, role):
+        user = User.objects.create_user(username, password='secret')
+        user.profile.role = role
+        user.profile.save()
+        return User.objects.get(pk=user.pk)
+
+    def status_events(self, user):
+        events, _ = fetch_events(user, (0, 0), topics=('status',))
+        return [(data['form_id'], data['status']) for _, _, data in events]
+
+    def test_physicians_receive_events_of_forms_entering_and_leaving_the_pending_queue(self):
+        physician = self.user_with_role('physician', 'screening_physician')
+        administrator = self.user_with_role('administrator', 'administrator')
+        pending = make_form()
+        decided = make_form()
+        decided.status = 'approved'
+        decided.save()
+
+        # The approval lets the physician's list drop the form; its earlier pending event stays hidden
+        self.assertEqual(self.status_events(physician), [(pending.pk, 'pending'), (decided.pk, 'approved')])
+        self.assertEqual(self.status_events(administrator), [
+            (pending.pk, 'pending'), (decided.pk, 'pending'), (decided.pk, 'approved'),
+        ])
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_are_served_by_indexes(self):
+        autodiscover()
+        self.assertEqual({hot_query.name: errors for hot_query, _, errors in check_hot_queries() if errors}, {})
+
+    def test_sorts_outside_an_index_fail_the_check(self):
+        plan = ['SEARCH dashboard_formstatusevent USING INDEX statusevent_form_idx (form_id=?)', 'USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(plan_problems(HotQuery('forms.timeline', None), plan), [
+            'sort not served by an index: USE TEMP B-TREE FOR ORDER BY',
+        ])
@@ -0,0 +1,36 @@
+"""
+Upload handlers that compute a SHA-256 content hash while the file streams in.
+
+The finished upload carries the hex digest as `content_hash`, so
+dashboard.blobs can look up identical content without reading the file again.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """Feed every received chunk into a SHA-256 hasher and attach the digest to the finished file"""
+
+    def new_file(self, *args, **kwargs):
+        # Set up before super(), which may stop later handlers by raising
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.hasher.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
@@ -10,9 +10,17 @@ urlpatterns = [
     path('time-saved/', views.time_saved_analytics, name='time_saved'),
     path('settings/', views.settings_view, name='settings'),
     path('ajax-upload/', views.ajax_upload, name='ajax_upload'),
+    path('ajax-batch-upload/', views.ajax_batch_upload, name='ajax_batch_upload'),
+    path('uploads/', views.upload_session_start, name='upload_session_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_session_chunk, name='upload_session_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.upload_session_complete, name='upload_session_complete'),
     path('update-form-status/', views.update_form_status, name='update_form_status'),
     path('undo-cancellation/', views.undo_cancellation, name='undo_cancellation'),
+    path('forms/<int:form_id>/timeline/', views.form_status_timeline, name='form_status_timeline'),
     path('view-file/<int:form_id>/', views.view_patient_file, name='view_patient_file'),
+    path('files/<int:form_id>/', views.serve_patient_file, name='patient_file'),
+    path('files/<int:form_id>/preview/<str:size>/', views.serve_patient_file_preview, name='patient_file_preview'),
+    path('events/', views.event_stream_view, name='events'),
     path('delete-form/<int:form_id>/', views.delete_patient_form, name='delete_patient_form'),
     path('api/patient-cases/', views.api_patient_cases, name='api_patient_cases'),
 ]
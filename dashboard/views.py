@@ -1,71 +1,84 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
 from django.conf import settings
-from django.db.models import Q, Count, Avg
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
 from django.utils import timezone
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
 import os
 import json
-from .models import PatientForm
+from .models import PatientForm, UploadSession, track_bulk_created_forms
+from .stats import get_form_stats, get_daily_rollups
+from .home_cache import get_home_context
+from .pagination import paginate_forms, InvalidCursor
+from .search import filter_forms_by_name
+from .jobs import enqueue, enqueue_many
+from .blobs import bulk_create_uploads, store_upload
+from .file_responses import stored_file_response
+from .previews import PREVIEW_SIZES, form_preview_names, preview_key
+from .status_events import event_payload, form_timeline, previous_statuses
+from .events import MAX_STREAM_SECONDS, TOPICS, current_cursor, decode_event_id, event_stream
+from .chunked_upload import (
+    CHUNK_SIZE, MAX_CHUNK_SIZE, AssembledFile, OffsetMismatch, append_chunk, discard_session_file, start_session,
+)
+
+# Chart windows offered on the time saved analytics page, in days
+ANALYTICS_WINDOWS = [7, 30, 90]
+
+# Upload limits shared by the single and batch upload views
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB in bytes
+ALLOWED_UPLOAD_EXTENSIONS = ['pdf', 'png', 'jpg', 'jpeg']
+MAX_BATCH_UPLOAD_FILES = 50
+
+# Feedback shown on a form until a worker has analyzed it
+ANALYSIS_QUEUED_FEEDBACK = "Queued for AI analysis"
 
 @login_required
 def dashboard_home(request):
+    # Serve the cached context until a form or message write bumps the cache version
+    context = dict(get_home_context(request.user, build_home_context))
+    context['user_name'] = request.user.get_full_name() or request.user.username
+    return render(request, 'dashboard/home.html', context)
+
+def build_home_context(user):
+    """Build the cacheable part of the dashboard home context for user"""
     # Get recent forms excluding cancelled ones (cancelled forms are hidden by default)
-    recent_forms = PatientForm.objects.exclude(status='cancelled').order_by('-uploaded_at')[:5]
+    recent_forms = list(PatientForm.objects.exclude(status='cancelled').order_by('-uploaded_at')[:5])
+    # Counts come from the materialized counters rather than per-request COUNT queries
+    form_stats = get_form_stats()
     # Total forms count excludes cancelled forms
-    total_forms = PatientForm.objects.exclude(status='cancelled').count()
+    total_forms = form_stats['active']
     
     # Get message notifications for administrators and doctors
     unread_messages_count = 0
     latest_conversation = None
-    if hasattr(request.user, 'profile') and request.user.profile.role in ['administrator', 'screening_physician']:
+    if hasattr(user, 'profile') and user.profile.role in ['administrator', 'screening_physician']:
         try:
-            from messaging.models import Conversation, Message, MessageReadStatus
-            # Get conversations where user is participant
-            user_conversations = Conversation.objects.filter(participants=request.user)
-            
-            unread_messages_count = 0
-            latest_conversation_with_unread = None
-            
-            for conversation in user_conversations:
-                # Count unread messages in this conversation (messages not sent by current user and not read by them)
-                unread_in_conversation = Message.objects.filter(
-                    conversation=conversation
-                ).exclude(
-                    sender=request.user
-                ).exclude(
-                    read_statuses__user=request.user
-                ).count()
-                
-                unread_messages_count += unread_in_conversation
-                
-                if unread_in_conversation > 0 and not latest_conversation_with_unread:
-                    latest_conversation_with_unread = conversation
-            
-            latest_conversation = latest_conversation_with_unread
+            from messaging.services import unread_message_summary
+            # One grouped count for all of the user's conversations, not one COUNT per conversation
+            unread_messages_count, latest_conversation = unread_message_summary(user)
         except ImportError:
             pass
     
     # Calculate statistics based on actual database data
-    approved_forms = PatientForm.objects.filter(status='approved').count()
-    rejected_forms = PatientForm.objects.filter(status='rejected').count()
-    cancelled_forms = PatientForm.objects.filter(status='cancelled').count()
-    pending_forms = PatientForm.objects.filter(status='pending').count()
-    processing_forms = PatientForm.objects.filter(status='processing').count()
+    approved_forms = form_stats['approved']
+    rejected_forms = form_stats['rejected']
+    cancelled_forms = form_stats['cancelled']
+    pending_forms = form_stats['pending']
+    processing_forms = form_stats['processing']
     
     # Calculate average processing time for completed forms
-    completed_forms = PatientForm.objects.filter(processing_time_seconds__isnull=False)
-    if completed_forms.exists():
-        avg_time_seconds = completed_forms.aggregate(avg_time=Avg('processing_time_seconds'))['avg_time']
-        if avg_time_seconds:
-            avg_minutes = round(avg_time_seconds / 60, 1)
-            avg_processing_time = f"{avg_minutes}m"
-        else:
-            avg_processing_time = "0.0m"
+    avg_time_seconds = form_stats['avg_processing_seconds']
+    if avg_time_seconds:
+        avg_minutes = round(avg_time_seconds / 60, 1)
+        avg_processing_time = f"{avg_minutes}m"
     else:
         avg_processing_time = "0.0m"
     
@@ -77,10 +90,9 @@ def dashboard_home(request):
         acceptance_rate = "0%"
     
     # Check if user should see notifications
-    can_see_notifications = request.user.profile.role in ['administrator', 'screening_physician']
+    can_see_notifications = user.profile.role in ['administrator', 'screening_physician']
     
     context = {
-        'user_name': request.user.get_full_name() or request.user.username,
         'total_forms': total_forms,
         'accepted_forms': approved_forms,
         'rejected_forms': rejected_forms,
@@ -88,7 +100,7 @@ def dashboard_home(request):
         'pending_forms': pending_forms,
         'processing_forms': processing_forms,
         'avg_processing_time': avg_processing_time,
-        'forms_processed_today': PatientForm.objects.filter(uploaded_at__date=timezone.now().date()).count(),
+        'forms_processed_today': form_stats['uploaded_today'],
         'acceptance_rate': acceptance_rate,
         'processing_target': '<6 min',
         'recent_forms': recent_forms,
@@ -96,7 +108,41 @@ def dashboard_home(request):
         'latest_conversation': latest_conversation,
         'can_see_notifications': can_see_notifications,
     }
-    return render(request, 'dashboard/home.html', context)
+    return context
+
+def validate_upload(uploaded_file):
+    """Return an error message if uploaded_file is too large or of an unsupported type, else None"""
+    return validate_upload_details(uploaded_file.name, uploaded_file.size)
+
+def validate_upload_details(file_name, size):
+    """Return an error message if a file of this name and size may not be uploaded, else None"""
+    # Validate file size (10MB limit)
+    if size > MAX_UPLOAD_SIZE:
+        return 'File size must be less than 10MB.'
+    
+    # Validate file extension
+    file_extension = file_name.split('.')[-1].lower()
+    if file_extension not in ALLOWED_UPLOAD_EXTENSIONS:
+        return 'Only PDF, PNG, and JPG files are allowed.'
+    return None
+
+def create_uploaded_form(user, uploaded_file, patient_name):
+    """Save a PatientForm for a validated upload and queue its background work.
+
+    Identical content shares the stored file and, once analyzed, its results.
+    """
+    with transaction.atomic():
+        patient_form = PatientForm(
+            patient_name=patient_name if patient_name else None,
+            uploaded_by=user,
+            ai_feedback=ANALYSIS_QUEUED_FEEDBACK
+        )
+        needs_analysis = store_upload(patient_form, uploaded_file)
+        patient_form.save()
+        if needs_analysis:
+            enqueue('analyze_form', {'form_id': patient_form.id})
+            enqueue('generate_previews', {'form_id': patient_form.id})
+    return patient_form
 
 @login_required
 def upload_form(request):
@@ -109,33 +155,20 @@ def upload_form(request):
             messages.error(request, 'Please select a file to upload.')
             return render(request, 'dashboard/upload_form.html')
         
-        # Validate file size (10MB limit)
-        max_size = 10 * 1024 * 1024  # 10MB in bytes
-        if uploaded_file.size > max_size:
-            messages.error(request, 'File size must be less than 10MB.')
-            return render(request, 'dashboard/upload_form.html')
-        
-        # Validate file extension
-        allowed_extensions = ['pdf', 'png', 'jpg', 'jpeg']
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-        if file_extension not in allowed_extensions:
-            messages.error(request, 'Only PDF, PNG, and JPG files are allowed.')
+        # Validate file size and extension
+        error = validate_upload(uploaded_file)
+        if error:
+            messages.error(request, error)
             return render(request, 'dashboard/upload_form.html')
         
         try:
-            # Create PatientForm instance
-            patient_form = PatientForm.objects.create(
-                patient_name=patient_name if patient_name else None,
-                uploaded_file=uploaded_file,
-                uploaded_by=request.user
-            )
-            
-            # Here you would add AI processing logic
-            # For now, we'll just simulate instant feedback
-            patient_form.ai_feedback = "AI will analyze the form and provide instant feedback"
-            patient_form.save()
+            # Create PatientForm instance and queue it for background analysis
+            patient_form = create_uploaded_form(request.user, uploaded_file, patient_name)
             
-            messages.success(request, f'Form uploaded successfully! File: {uploaded_file.name}')
+            if patient_form.duplicate_of_id:
+                messages.success(request, f'Form uploaded successfully! File: {uploaded_file.name} is identical to form #{patient_form.duplicate_of_id}.')
+            else:
+                messages.success(request, f'Form uploaded successfully! File: {uploaded_file.name}')
             return redirect('dashboard:upload_form')
             
         except Exception as e:
@@ -152,33 +185,20 @@ def ajax_upload(request):
         uploaded_file = request.FILES['file']
         patient_name = request.POST.get('patient_name', '').strip()
         
-        # Validate file size (10MB limit)
-        max_size = 10 * 1024 * 1024  # 10MB in bytes
-        if uploaded_file.size > max_size:
-            return JsonResponse({'success': False, 'error': 'File size must be less than 10MB.'})
-        
-        # Validate file extension
-        allowed_extensions = ['pdf', 'png', 'jpg', 'jpeg']
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-        if file_extension not in allowed_extensions:
-            return JsonResponse({'success': False, 'error': 'Only PDF, PNG, and JPG files are allowed.'})
+        # Validate file size and extension
+        error = validate_upload(uploaded_file)
+        if error:
+            return JsonResponse({'success': False, 'error': error})
         
         try:
-            # Create PatientForm instance
-            patient_form = PatientForm.objects.create(
-                patient_name=patient_name if patient_name else None,
-                uploaded_file=uploaded_file,
-                uploaded_by=request.user
-            )
-            
-            # Simulate AI processing
-            patient_form.ai_feedback = "AI will analyze the form and provide instant feedback"
-            patient_form.save()
+            # Create PatientForm instance and queue it for background analysis
+            patient_form = create_uploaded_form(request.user, uploaded_file, patient_name)
             
             return JsonResponse({
                 'success': True, 
                 'message': f'File "{uploaded_file.name}" uploaded successfully!',
-                'file_id': patient_form.id
+                'file_id': patient_form.id,
+                'duplicate_of': patient_form.duplicate_of_id
             })
             
         except Exception as e:
@@ -186,6 +206,146 @@ def ajax_upload(request):
     
     return JsonResponse({'success': False, 'error': 'No file provided'})
 
+@csrf_exempt
+@login_required
+def upload_session_start(request):
+    """Start a resumable chunked upload and return its id and the offset to send from"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    try:
+        data = json.loads(request.body)
+        file_name = os.path.basename(str(data['file_name']))
+        size = int(data['size'])
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'file_name and size are required'})
+    
+    error = validate_upload_details(file_name, size)
+    if error or size <= 0:
+        return JsonResponse({'success': False, 'error': error or 'The file is empty.'})
+    
+    session = start_session(request.user, file_name, size, str(data.get('patient_name') or '').strip())
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(session.pk),
+        'offset': 0,
+        'size': session.size,
+        'chunk_size': CHUNK_SIZE,
+    })
+
+@csrf_exempt
+@login_required
+def upload_session_chunk(request, upload_id):
+    """Report a chunked upload's offset (GET) or append the raw request body at ?offset= (PUT/POST)"""
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user, patient_form__isnull=True).first()
+    if session is None:
+        return JsonResponse({'success': False, 'error': 'Upload not found'}, status=404)
+    if request.method == 'GET':
+        return JsonResponse({'success': True, 'offset': session.received_bytes, 'size': session.size})
+    if request.method not in ('PUT', 'POST'):
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'A numeric offset is required'})
+    if not 0 < length <= MAX_CHUNK_SIZE:
+        return JsonResponse({'success': False, 'error': f'Chunks must be between 1 byte and {MAX_CHUNK_SIZE} bytes'})
+    
+    try:
+        # Streamed from the request to disk without reading the body into memory
+        new_offset = append_chunk(session, request, offset, length)
+    except OffsetMismatch as e:
+        # The client resumes from the offset the server actually has
+        return JsonResponse({'success': False, 'error': str(e), 'offset': e.expected}, status=409)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'offset': session.received_bytes})
+    return JsonResponse({'success': True, 'offset': new_offset, 'size': session.size})
+
+@csrf_exempt
+@login_required
+def upload_session_complete(request, upload_id):
+    """Turn a fully received chunked upload into a PatientForm"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user, patient_form__isnull=True).first()
+    if session is None:
+        return JsonResponse({'success': False, 'error': 'Upload not found'}, status=404)
+    if not session.is_complete:
+        return JsonResponse({'success': False, 'error': 'Upload is incomplete', 'offset': session.received_bytes}, status=409)
+    
+    try:
+        with AssembledFile(session) as assembled_file:
+            patient_form = create_uploaded_form(request.user, assembled_file, session.patient_name)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error uploading file: {str(e)}'})
+    session.patient_form = patient_form
+    session.save(update_fields=['patient_form', 'updated_at'])
+    # Already moved into storage unless the content was a duplicate
+    discard_session_file(session)
+    
+    return JsonResponse({
+        'success': True,
+        'message': f'File "{session.file_name}" uploaded successfully!',
+        'file_id': patient_form.id,
+        'duplicate_of': patient_form.duplicate_of_id
+    })
+
+@csrf_exempt
+@login_required
+def ajax_batch_upload(request):
+    """Handle AJAX uploads of many files in one multipart request"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    
+    uploaded_files = request.FILES.getlist('files')
+    if not uploaded_files:
+        return JsonResponse({'success': False, 'error': 'No files provided'})
+    if len(uploaded_files) > MAX_BATCH_UPLOAD_FILES:
+        return JsonResponse({'success': False, 'error': f'At most {MAX_BATCH_UPLOAD_FILES} files can be uploaded at once.'})
+    
+    # Optional patient names, matched to files by position
+    patient_names = request.POST.getlist('patient_names')
+    
+    # Validate every file first so one bad file does not cost the others a round trip
+    results = []
+    new_forms = []
+    for index, uploaded_file in enumerate(uploaded_files):
+        error = validate_upload(uploaded_file)
+        results.append({'file_name': uploaded_file.name, 'success': error is None, 'error': error, 'file_id': None, 'duplicate_of': None})
+        if error is None:
+            patient_name = patient_names[index].strip() if index < len(patient_names) else ''
+            new_forms.append((index, uploaded_file, PatientForm(
+                patient_name=patient_name or None,
+                uploaded_by=request.user,
+                ai_feedback=ANALYSIS_QUEUED_FEEDBACK
+            )))
+    
+    if new_forms:
+        try:
+            # One transaction and one INSERT for all forms (two when the batch repeats a file) and one for their analysis jobs
+            with transaction.atomic():
+                needs_analysis = [store_upload(form, uploaded_file) for _, uploaded_file, form in new_forms]
+                created = bulk_create_uploads([form for _, _, form in new_forms])
+                track_bulk_created_forms(created)
+                # Duplicates of analyzed forms already share their original's analysis and previews
+                new_form_payloads = [{'form_id': form.id} for form, needed in zip(created, needs_analysis) if needed]
+                enqueue_many('analyze_form', new_form_payloads)
+                enqueue_many('generate_previews', new_form_payloads)
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': f'Error uploading files: {str(e)}'})
+        for (index, _, _), form in zip(new_forms, created):
+            results[index]['file_id'] = form.id
+            results[index]['duplicate_of'] = form.duplicate_of_id
+    
+    return JsonResponse({
+        'success': bool(new_forms),
+        'message': f'{len(new_forms)} of {len(uploaded_files)} files uploaded successfully.',
+        'uploaded': len(new_forms),
+        'failed': len(uploaded_files) - len(new_forms),
+        'results': results,
+    })
+
 @login_required
 def database_view(request):
     """Display all patient forms with search and filter functionality"""
@@ -198,10 +358,7 @@ def database_view(request):
     # Search functionality
     search_query = request.GET.get('search', '').strip()
     if search_query:
-        forms = forms.filter(
-            Q(patient_name__icontains=search_query) | 
-            Q(extracted_patient_name__icontains=search_query)
-        )
+        forms = filter_forms_by_name(forms, search_query)
     
     # Status filter
     status_filter = request.GET.get('status', 'all')
@@ -214,57 +371,48 @@ def database_view(request):
         # By default, exclude cancelled forms to keep them hidden
         forms = forms.exclude(status='cancelled')
     
-    # Time-based sorting
+    # Time-based sorting, paginated by (uploaded_at, id) cursors so deep pages stay cheap
     sort_order = request.GET.get('sort', 'desc')  # Default to newest first (descending)
-    if sort_order == 'asc':
-        forms = forms.order_by('uploaded_at')  # Oldest first
+    try:
+        page = paginate_forms(
+            forms,
+            descending=sort_order != 'asc',
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    except InvalidCursor:
+        page = paginate_forms(forms, descending=sort_order != 'asc')
+    
+    # Add message information for administrators, fetched for the whole page at once
+    forms_with_messages = list(page)
+    message_summaries = {}
+    if hasattr(request.user, 'profile') and request.user.profile.role == 'administrator':
+        from messaging.services import form_message_summaries
+        message_summaries = form_message_summaries([form.id for form in forms_with_messages], request.user)
+    
+    # Undo buttons on cancelled forms need the status each one was cancelled from
+    cancelled_ids = [form.id for form in forms_with_messages if form.status == 'cancelled']
+    restorable = previous_statuses(cancelled_ids) if cancelled_ids else {}
+    
+    for form in forms_with_messages:
+        if form.status == 'cancelled':
+            form.previous_status = restorable.get(form.id)
+        summary = message_summaries.get(form.id)
+        form.has_messages = summary is not None
+        form.related_conversation = summary['conversation'] if summary else None
+        form.has_physician_decision = summary['has_physician_decision'] if summary else False
+        form.unread_count = summary['unread_count'] if summary else 0
+    
+    # Category counts come from the materialized counters; only searches need a COUNT query
+    form_stats = get_form_stats()
+    if search_query:
+        total_forms = forms.count()
+    elif hasattr(request.user, 'profile') and request.user.profile.role == 'screening_physician':
+        total_forms = form_stats['pending']
+    elif status_filter in dict(PatientForm.STATUS_CHOICES):
+        total_forms = form_stats[status_filter]
     else:
-        forms = forms.order_by('-uploaded_at')  # Newest first
-    
-    # Add message information for administrators
-    forms_with_messages = []
-    for form in forms:
-        form.has_messages = False
-        form.unread_count = 0
-        form.related_conversation = None
-        
-        # For administrators, check if there are messages about this form
-        if hasattr(request.user, 'profile') and request.user.profile.role == 'administrator':
-            try:
-                from messaging.models import Conversation, Message, MessageReadStatus
-                
-                # Look for conversations where the message content mentions this form
-                form_patient_name = form.patient_name or form.extracted_patient_name or "Unknown Patient"
-                related_messages = Message.objects.filter(
-                    content__icontains=f"patient form: {form_patient_name}"
-                ).exclude(sender=request.user)
-                
-                if related_messages.exists():
-                    form.has_messages = True
-                    # Find the conversation with the most recent message
-                    latest_message = related_messages.order_by('-created_at').first()
-                    form.related_conversation = latest_message.conversation
-                    
-                    # Check if any messages contain physician decisions
-                    form.has_physician_decision = related_messages.filter(
-                        content__icontains="PHYSICIAN DECISION:"
-                    ).exists()
-                    
-                    # Count unread messages in this conversation
-                    form.unread_count = Message.objects.filter(
-                        conversation=latest_message.conversation
-                    ).exclude(
-                        sender=request.user
-                    ).exclude(
-                        read_statuses__user=request.user
-                    ).count()
-                else:
-                    form.has_physician_decision = False
-                    
-            except ImportError:
-                pass
-        
-        forms_with_messages.append(form)
+        total_forms = form_stats['active']
     
     # Calculate category counts for administrators
     pending_count = 0
@@ -273,22 +421,37 @@ def database_view(request):
     cancelled_count = 0
     
     if hasattr(request.user, 'profile') and request.user.profile.role == 'administrator':
-        all_forms = PatientForm.objects.all()
-        pending_count = all_forms.filter(status='pending').count()
-        approved_count = all_forms.filter(status='approved').count()
-        rejected_count = all_forms.filter(status='rejected').count()
-        cancelled_count = all_forms.filter(status='cancelled').count()
+        pending_count = form_stats['pending']
+        approved_count = form_stats['approved']
+        rejected_count = form_stats['rejected']
+        cancelled_count = form_stats['cancelled']
+    
+    # Page links keep the current search, status and sort parameters
+    next_page_url = None
+    previous_page_url = None
+    if page.next_cursor:
+        params = request.GET.copy()
+        params.pop('before', None)
+        params['after'] = page.next_cursor
+        next_page_url = f'?{params.urlencode()}'
+    if page.previous_cursor:
+        params = request.GET.copy()
+        params.pop('after', None)
+        params['before'] = page.previous_cursor
+        previous_page_url = f'?{params.urlencode()}'
     
     context = {
         'forms': forms_with_messages,
         'search_query': search_query,
         'status_filter': status_filter,
         'sort_order': sort_order,
-        'total_forms': len(forms_with_messages),
+        'total_forms': total_forms,
         'pending_count': pending_count,
         'approved_count': approved_count,
         'rejected_count': rejected_count,
         'cancelled_count': cancelled_count,
+        'next_page_url': next_page_url,
+        'previous_page_url': previous_page_url,
     }
     
     return render(request, 'dashboard/database.html', context)
@@ -296,59 +459,52 @@ def database_view(request):
 @login_required
 def time_saved_analytics(request):
     """Display time saved analytics and processing efficiency metrics"""
-    from django.utils import timezone
-    from datetime import timedelta
-    import json
+    # All-time totals come from the form counters and the charts from daily rollups,
+    # so the page never aggregates raw forms
+    form_stats = get_form_stats()
     
-    # Get all forms for calculations
-    all_forms = PatientForm.objects.all()
-    processed_forms = PatientForm.objects.filter(processed=True)
+    # Chart window in days (7, 30 or 90)
+    try:
+        window_days = int(request.GET.get('days', 7))
+    except ValueError:
+        window_days = 7
+    if window_days not in ANALYTICS_WINDOWS:
+        window_days = 7
     
     # Calculate metrics
-    total_processed = processed_forms.count()
+    total_processed = form_stats['processed']
     
-    # Calculate average processing time (mock data for now)
+    # Calculate average processing time from the recorded processing times
     avg_processing_minutes = 0.0
     ai_processing_seconds = 0.0
-    if processed_forms.exists():
-        # Mock calculation - in real implementation, you'd use actual processing times
-        avg_processing_minutes = 2.5  # Simulated average
-        ai_processing_seconds = 0.0  # AI is instant for display purposes
+    if form_stats['avg_processing_seconds'] is not None:
+        avg_processing_minutes = round(form_stats['avg_processing_seconds'] / 60, 1)
+        ai_processing_seconds = round(form_stats['avg_processing_seconds'], 1)
     
     # Calculate time saved vs manual processing
     # Assume manual processing takes 15 minutes per form on average
     manual_processing_minutes_per_form = 15
     ai_processing_minutes_per_form = avg_processing_minutes
     time_saved_per_form = manual_processing_minutes_per_form - ai_processing_minutes_per_form
-    total_time_saved_hours = (time_saved_per_form * total_processed) / 60
+    total_time_saved_hours = round((time_saved_per_form * total_processed) / 60, 1)
     
     # Calculate efficiency gain percentage
     efficiency_gain = 0
     if manual_processing_minutes_per_form > 0 and total_processed > 0:
-        efficiency_gain = ((manual_processing_minutes_per_form - ai_processing_minutes_per_form) / manual_processing_minutes_per_form) * 100
+        efficiency_gain = round(((manual_processing_minutes_per_form - ai_processing_minutes_per_form) / manual_processing_minutes_per_form) * 100, 1)
     
     # Target achievement (forms processed under 6 minutes)
-    target_minutes = 6
-    forms_under_target = processed_forms.filter(processing_time_seconds__lt=target_minutes*60).count() if processed_forms.exists() else 0
+    target_minutes = PatientForm.PROCESSING_TARGET_MINUTES
+    forms_under_target = form_stats['under_target']
     target_achievement_percentage = (forms_under_target / total_processed * 100) if total_processed > 0 else 0
     success_rate = target_achievement_percentage
     
-    # Generate chart data for last 7 days
-    today = timezone.now().date()
-    last_7_days = []
-    processing_time_data = []
-    daily_volume_data = []
-    
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        day_name = date.strftime('%a')
-        last_7_days.append(day_name)
-        
-        # Mock data for processing times (in real app, calculate from actual data)
-        processing_time_data.append(0.0)  # All showing 0 as in screenshot
-        
-        # Mock data for daily volume
-        daily_volume_data.append(0)  # All showing 0 as in screenshot
+    # Generate chart data for the selected window, one rollup row per day
+    label_format = '%a' if window_days <= 7 else '%b %d'
+    rollups = get_daily_rollups(window_days)
+    chart_labels = [rollup.date.strftime(label_format) for rollup in rollups]
+    processing_time_data = [rollup.avg_processing_minutes for rollup in rollups]
+    daily_volume_data = [rollup.uploaded_count for rollup in rollups]
     
     context = {
         'total_processed': total_processed,
@@ -357,7 +513,9 @@ def time_saved_analytics(request):
         'target_achievement_percentage': int(target_achievement_percentage),
         'forms_under_target': forms_under_target,
         'target_minutes': target_minutes,
-        'last_7_days': json.dumps(last_7_days),
+        'window_days': window_days,
+        'analytics_windows': ANALYTICS_WINDOWS,
+        'last_7_days': json.dumps(chart_labels),
         'processing_time_data': json.dumps(processing_time_data),
         'daily_volume_data': json.dumps(daily_volume_data),
         'performance_status': 'excellent' if avg_processing_minutes < target_minutes else 'good' if avg_processing_minutes < target_minutes * 1.5 else 'needs_improvement',
@@ -418,22 +576,16 @@ def update_form_status(request):
                 form = PatientForm.objects.get(id=form_id)
                 old_status = form.status
                 
-                # Special validation for cancellation
-                if new_status == 'cancelled':
-                    if not form.can_be_cancelled():
-                        return JsonResponse({'success': False, 'error': 'Only approved or rejected forms can be cancelled'})
-                    # Store the current status as previous status for undo functionality
-                    try:
-                        if hasattr(form, 'previous_status'):
-                            form.previous_status = old_status
-                    except:
-                        pass  # Ignore if previous_status field doesn't exist yet
+                # Special validation for cancellation; undo reads the prior status back from the event log
+                if new_status == 'cancelled' and not form.can_be_cancelled():
+                    return JsonResponse({'success': False, 'error': 'Only approved or rejected forms can be cancelled'})
                 
                 # Prevent changes to cancelled forms
                 if old_status == 'cancelled':
                     return JsonResponse({'success': False, 'error': 'Cancelled forms cannot be modified'})
                 
                 form.status = new_status
+                form.status_actor = request.user
                 form.save()
                 
                 # If admin is reverting a decision back to pending, notify physicians
@@ -442,8 +594,13 @@ def update_form_status(request):
                     old_status in ['approved', 'rejected'] and 
                     new_status == 'pending'):
                     
-                    # Create a notification message to physicians
-                    notify_physicians_of_status_reversion(form, old_status, request.user)
+                    # Notify physicians from a worker so the admin is not kept waiting on the fan-out
+                    enqueue('notify_status_reversion', {
+                        'form_id': form.id,
+                        'old_status': old_status,
+                        'admin_id': request.user.id,
+                        'reverted_at': timezone.now().isoformat(),
+                    })
                 
                 return JsonResponse({
                     'success': True, 
@@ -480,14 +637,11 @@ def undo_cancellation(request):
                 if not form.can_undo_cancellation():
                     return JsonResponse({'success': False, 'error': 'This form cannot be restored. Only cancelled forms with a previous status can be undone.'})
                 
-                # Store the previous status before undoing
-                try:
-                    previous_status = getattr(form, 'previous_status', None)
-                except:
-                    previous_status = None
+                previous_status = form.previous_status
                 
                 # Undo the cancellation
                 if form.undo_cancellation():
+                    form.status_actor = request.user
                     form.save()
                     
                     return JsonResponse({
@@ -509,6 +663,38 @@ def undo_cancellation(request):
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
+@login_required
+def form_status_timeline(request, form_id):
+    """Return a form's status history as JSON, paged by event id with ?after="""
+    form = PatientForm.objects.filter(id=form_id).first()
+    if form is None:
+        return JsonResponse({'success': False, 'error': 'Form not found'}, status=404)
+    if not can_view_form_file(request.user, form):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    after = request.GET.get('after', '0')
+    if not after.isdigit():
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+    events, has_more = form_timeline(form, after_id=int(after))
+    return JsonResponse({
+        'success': True,
+        'form_id': form.id,
+        'status': form.status,
+        'events': [event_payload(event) for event in events],
+        'has_more': has_more,
+        'next_after': events[-1].id if has_more else None,
+    })
+
+def can_view_form_file(user, form):
+    """Return True if user may view the file uploaded for form"""
+    if hasattr(user, 'profile'):
+        user_role = user.profile.role
+        # Allow administrators and screening physicians to view files
+        if user_role not in ['administrator', 'screening_physician']:
+            # Also allow the user who uploaded the file to view it
+            return form.uploaded_by_id == user.id
+    return True
+
 @login_required
 def view_patient_file(request, form_id):
     """View/download the uploaded patient file"""
@@ -516,24 +702,25 @@ def view_patient_file(request, form_id):
         form = PatientForm.objects.get(id=form_id)
         
         # Check if user has permission to view this file
-        if hasattr(request.user, 'profile'):
-            user_role = request.user.profile.role
-            # Allow administrators and screening physicians to view files
-            if user_role not in ['administrator', 'screening_physician']:
-                # Also allow the user who uploaded the file to view it
-                if form.uploaded_by != request.user:
-                    return JsonResponse({'success': False, 'error': 'Permission denied'})
+        if not can_view_form_file(request.user, form):
+            return JsonResponse({'success': False, 'error': 'Permission denied'})
         
         if form.uploaded_file:
             # Get file information
-            file_url = form.uploaded_file.url
-            file_name = os.path.basename(form.uploaded_file.name)
-            file_extension = os.path.splitext(file_name)[1].lower()
+            file_url = reverse('dashboard:patient_file', args=[form.id])
+            file_name = form.display_file_name
+            file_extension = os.path.splitext(form.uploaded_file.name)[1].lower()
+            
+            # Point the modal at the small rendition when the worker has made one
+            preview_url = None
+            if form.uploaded_file.storage.exists(form_preview_names(form)['large']):
+                preview_url = preview_file_url(form, 'large')
             
             # Return file information for JavaScript to handle
             return JsonResponse({
                 'success': True,
                 'file_url': file_url,
+                'preview_url': preview_url,
                 'file_name': file_name,
                 'file_extension': file_extension,
                 'patient_name': form.patient_name or form.extracted_patient_name or 'Unknown Patient',
@@ -545,66 +732,71 @@ def view_patient_file(request, form_id):
     except PatientForm.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Form not found'})
 
-
-def notify_physicians_of_status_reversion(patient_form, old_status, admin_user):
-    """Notify physicians when admin reverts a form status back to pending"""
+@login_required
+def serve_patient_file(request, form_id):
+    """Stream the uploaded patient file, honouring Range and conditional requests"""
+    form = PatientForm.objects.filter(id=form_id).first()
+    if form is None or not form.uploaded_file:
+        raise Http404('File not found')
+    if not can_view_form_file(request.user, form):
+        return HttpResponseForbidden('Permission denied')
+    
+    # Identical content always has the same hash, so it makes a strong validator
+    etag = f'"{form.content_hash}"' if form.content_hash else None
     try:
-        from messaging.models import Conversation, Message
-        from django.contrib.auth.models import User
-        from accounts.models import UserProfile
-        
-        # Get all physicians
-        physicians = User.objects.filter(profile__role='screening_physician')
-        
-        patient_name = patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'
-        
-        # Create a message for each physician
-        for physician in physicians:
-            # Check if conversation already exists between admin and physician
-            existing_conversation = Conversation.objects.filter(
-                participants=admin_user
-            ).filter(
-                participants=physician
-            ).annotate(
-                participant_count=Count('participants')
-            ).filter(
-                participant_count=2
-            ).first()
-            
-            if existing_conversation:
-                conversation = existing_conversation
-            else:
-                # Create new conversation
-                conversation = Conversation.objects.create(
-                    title=f"Form Status Updates - {patient_name}"
-                )
-                conversation.participants.add(admin_user, physician)
-            
-            # Create the notification message
-            reversion_message = f"""ADMIN STATUS REVERSION NOTICE
+        return stored_file_response(
+            request, form.uploaded_file, etag=etag, last_modified=form.uploaded_at, filename=form.display_file_name
+        )
+    except FileNotFoundError:
+        raise Http404('File not found')
 
-The status of patient form for "{patient_name}" has been reverted from {old_status.upper()} back to PENDING for re-evaluation.
 
-Please review this case again and provide your decision.
+def preview_file_url(form, size):
+    """Return the URL of form's preview, versioned by content so it can be cached indefinitely"""
+    return f"{reverse('dashboard:patient_file_preview', args=[form.id, size])}?v={preview_key(form)[:12]}"
 
-Patient: {patient_name}
-Previous Status: {old_status.title()}
-New Status: Pending
-Reverted by: {admin_user.get_full_name() or admin_user.username}
-Time: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}
+@login_required
+def serve_patient_file_preview(request, form_id, size):
+    """Serve a preview rendition of the uploaded patient file"""
+    form = PatientForm.objects.filter(id=form_id).first()
+    if form is None or not form.uploaded_file or size not in PREVIEW_SIZES:
+        raise Http404('Preview not found')
+    if not can_view_form_file(request.user, form):
+        return HttpResponseForbidden('Permission denied')
+    
+    # Wrapping the name in a FieldFile defers opening it until the body is actually sent
+    preview = FieldFile(form, form.uploaded_file.field, form_preview_names(form)[size])
+    if not preview.storage.exists(preview.name):
+        raise Http404('Preview not found')
+    # Previews are named after the file's content, so a cached copy never goes stale
+    return stored_file_response(
+        request, preview,
+        etag=f'"{preview_key(form)}-{size}"',
+        last_modified=form.uploaded_at,
+        cache_control='private, max-age=31536000, immutable',
+    )
 
-This form is now available in your dashboard for review."""
-            
-            # Create the message
-            Message.objects.create(
-                conversation=conversation,
-                sender=admin_user,
-                content=reversion_message
-            )
-            
-    except Exception as e:
-        # Log error but don't fail the main operation
-        print(f"Error notifying physicians of status reversion: {e}")
+
+@login_required
+async def event_stream_view(request):
+    """Server-Sent Events feed of new messages and form status changes"""
+    user = await request.auser()
+    # EventSource resends the last id it saw when it reconnects
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    cursor = decode_event_id(last_event_id) or await sync_to_async(current_cursor)()
+    topics = [topic for topic in request.GET.get('topics', '').split(',') if topic in TOPICS] or TOPICS
+    conversation_id = request.GET.get('conversation')
+    conversation_id = int(conversation_id) if conversation_id and conversation_id.isdigit() else None
+
+    # A WSGI worker is tied up for as long as the stream is open, so send one batch and let the client poll
+    max_seconds = MAX_STREAM_SECONDS if isinstance(request, ASGIRequest) else 0
+    response = StreamingHttpResponse(
+        event_stream(user, cursor, topics, conversation_id, max_seconds), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering events until the stream ends
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
@@ -623,23 +815,11 @@ def delete_patient_form(request, form_id):
             else:
                 return JsonResponse({'success': False, 'error': 'Permission denied'})
             
-            # Store file info for cleanup
-            file_path = None
-            if form.uploaded_file:
-                file_path = form.uploaded_file.path
-            
             patient_name = form.patient_name or form.extracted_patient_name or 'Unknown Patient'
             
-            # Delete the form
+            # Delete the form; its file goes too once no other form shares it (see StoredBlob)
             form.delete()
             
-            # Try to delete the associated file from filesystem
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError:
-                    pass  # File deletion failed, but form is already deleted
-            
             return JsonResponse({
                 'success': True,
                 'message': f'Patient form for {patient_name} has been successfully deleted.'
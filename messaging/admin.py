@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Conversation, Message, MessageReadStatus
+from .models import Conversation, Message, MessageReadStatus, PhysicianDecision
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
@@ -31,3 +31,10 @@ class MessageReadStatusAdmin(admin.ModelAdmin):
     list_filter = ['read_at']
     search_fields = ['user__username', 'message__content']
     raw_id_fields = ['message', 'user']
+
+@admin.register(PhysicianDecision)
+class PhysicianDecisionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'patient_form', 'physician', 'decision', 'created_at']
+    list_filter = ['decision', 'created_at']
+    search_fields = ['physician__username', 'patient_form__patient_name']
+    raw_id_fields = ['patient_form', 'physician', 'message']
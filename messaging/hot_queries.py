@@ -0,0 +1,42 @@
+"""
+Hot query shapes of messaging, checked by check_query_plans (see dashboard.query_plans).
+
+Each function builds the query the way its view or service does, with placeholder values.
+"""
+from django.db.models import Exists, OuterRef
+
+from dashboard.query_plans import register
+
+from .models import Conversation, Message, MessageReadStatus
+from .services import HISTORY_PAGE_SIZE
+
+
+@register('messages.history')
+def conversation_history():
+    """The latest page of a conversation, as conversation_detail and message_history_api read it"""
+    return Message.objects.filter(conversation_id=1).order_by('-created_at', '-id')[:HISTORY_PAGE_SIZE + 1]
+
+
+@register('messages.unread_in_conversation')
+def unread_in_conversation():
+    """Messages in a conversation user has no read receipt for"""
+    return Message.objects.filter(conversation_id=1).exclude(sender_id=1).exclude(read_statuses__user_id=1)
+
+
+@register('read_statuses.by_user')
+def read_statuses_by_user():
+    """The messages a user has read"""
+    return MessageReadStatus.objects.filter(user_id=1).values_list('message_id', flat=True)
+
+
+@register('conversations.direct')
+def direct_conversation():
+    """The one-to-one conversation of a pair of users"""
+    return Conversation.objects.filter(direct_key=Conversation.direct_key_for(1, 2))
+
+
+@register('messages.tail')
+def message_tail():
+    """Messages after an event stream cursor in a user's conversations"""
+    membership = Conversation.participants.through.objects.filter(conversation_id=OuterRef('conversation_id'), user_id=1)
+    return Message.objects.filter(Exists(membership), id__gt=0).order_by('id')[:100]
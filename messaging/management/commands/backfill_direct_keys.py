@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from dashboard.home_cache import bump_context_version
+from messaging.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'Set direct_key on existing one-to-one conversations, optionally merging duplicate threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Conversations updated per query')
+        parser.add_argument('--merge', action='store_true', help='Move messages of duplicate threads into the oldest one and delete the rest')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving it')
+
+    def handle(self, *args, **options):
+        # Participants of every conversation that has no key yet, read from the join table in one pass
+        participants = {}
+        rows = Conversation.participants.through.objects.filter(
+            conversation__direct_key__isnull=True
+        ).values_list('conversation_id', 'user_id')
+        for conversation_id, user_id in rows.iterator():
+            participants.setdefault(conversation_id, set()).add(user_id)
+
+        # Group two-person conversations by pair, oldest first
+        threads = {}
+        for conversation_id in sorted(participants):
+            users = participants[conversation_id]
+            if len(users) == 2:
+                threads.setdefault(Conversation.direct_key_for(*users), []).append(conversation_id)
+
+        keyed = dict(Conversation.objects.filter(direct_key__in=list(threads)).values_list('direct_key', 'id'))
+        to_key = []
+        duplicates = {}
+        for key, conversation_ids in threads.items():
+            if key in keyed:
+                canonical = keyed[key]
+            else:
+                canonical = conversation_ids.pop(0)
+                to_key.append(Conversation(id=canonical, direct_key=key))
+            if conversation_ids:
+                duplicates[canonical] = conversation_ids
+
+        duplicate_count = sum(len(ids) for ids in duplicates.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Would key {len(to_key)} conversations'))
+            if duplicate_count:
+                self.stdout.write(self.style.WARNING(f'{duplicate_count} duplicate threads found'))
+            return
+
+        Conversation.objects.bulk_update(to_key, ['direct_key'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Keyed {len(to_key)} conversations'))
+
+        if not duplicate_count:
+            return
+        if not options['merge']:
+            self.stdout.write(self.style.WARNING(
+                f'{duplicate_count} duplicate threads left unkeyed; run with --merge to fold them into one thread per pair'
+            ))
+            return
+
+        for canonical, conversation_ids in duplicates.items():
+            with transaction.atomic():
+                # The surviving thread keeps the newest activity of the ones folded into it
+                latest = Conversation.objects.filter(id__in=[canonical, *conversation_ids]).aggregate(
+                    latest=Max('updated_at')
+                )['latest']
+                Message.objects.filter(conversation_id__in=conversation_ids).update(conversation_id=canonical)
+                Conversation.objects.filter(id__in=conversation_ids).delete()
+                Conversation.objects.filter(id=canonical).update(updated_at=latest)
+        # update() skips the signals that normally invalidate the dashboard
+        bump_context_version()
+        self.stdout.write(self.style.SUCCESS(f'Merged {duplicate_count} duplicate threads'))
@@ -0,0 +1,78 @@
+from bisect import bisect_right
+from django.core.management.base import BaseCommand
+from dashboard.models import PatientForm
+from messaging.models import Message
+import re
+
+# Phrases the messaging views have used to mention a patient form in message text
+FORM_REFERENCE_PATTERNS = [
+    re.compile(r'patient form:\s*([^,\n]+)', re.IGNORECASE),
+    re.compile(r'PATIENT CASE:\s*([^\n]+)'),
+    re.compile(r'patient form for "([^"\n]+)"', re.IGNORECASE),
+]
+
+
+class Command(BaseCommand):
+    help = 'Link existing messages to the patient forms their text refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages updated per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report matches without saving them')
+
+    def handle(self, *args, **options):
+        forms_by_name = self.load_form_names()
+        batch_size = options['batch_size']
+        batch = []
+        linked = 0
+        scanned = 0
+
+        messages = Message.objects.filter(patient_form__isnull=True).only('id', 'content', 'created_at')
+        for message in messages.iterator(chunk_size=batch_size):
+            scanned += 1
+            form_id = self.match_form(message, forms_by_name)
+            if form_id is None:
+                continue
+            message.patient_form_id = form_id
+            message.is_physician_decision = 'PHYSICIAN DECISION:' in message.content.upper()
+            batch.append(message)
+            linked += 1
+            if len(batch) >= batch_size:
+                self.save_batch(batch, options['dry_run'])
+                batch = []
+        self.save_batch(batch, options['dry_run'])
+
+        verb = 'Would link' if options['dry_run'] else 'Linked'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {linked} of {scanned} unlinked messages to patient forms')
+        )
+
+    def load_form_names(self):
+        """Map each lower-cased patient name to its forms' (uploaded_at, id) pairs in upload order"""
+        forms_by_name = {}
+        rows = PatientForm.objects.order_by('uploaded_at', 'id').values_list(
+            'id', 'patient_name', 'extracted_patient_name', 'uploaded_at'
+        )
+        for form_id, patient_name, extracted_name, uploaded_at in rows.iterator():
+            for name in {patient_name, extracted_name}:
+                if name:
+                    forms_by_name.setdefault(name.strip().lower(), []).append((uploaded_at, form_id))
+        return forms_by_name
+
+    def match_form(self, message, forms_by_name):
+        """Return the id of the newest form named in message that was uploaded before it was sent"""
+        for pattern in FORM_REFERENCE_PATTERNS:
+            match = pattern.search(message.content)
+            if not match:
+                continue
+            candidates = forms_by_name.get(match.group(1).strip().lower())
+            if not candidates:
+                continue
+            position = bisect_right(candidates, (message.created_at, float('inf')))
+            # A message cannot be about a form uploaded after it was sent
+            if position:
+                return candidates[position - 1][1]
+        return None
+
+    def save_batch(self, batch, dry_run):
+        if batch and not dry_run:
+            Message.objects.bulk_update(batch, ['patient_form', 'is_physician_decision'])
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from messaging.search import message_index_available, rebuild_message_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the message search index from the Message table'
+
+    def handle(self, *args, **options):
+        if not message_index_available():
+            self.stdout.write(
+                self.style.WARNING('Message search index table not found; searches use icontains. Run migrations first.')
+            )
+            return
+        indexed = rebuild_message_index()
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {indexed} messages')
+        )
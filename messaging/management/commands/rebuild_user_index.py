@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from messaging.search import rebuild_user_index, user_index_available
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the user directory search index from the User and UserProfile tables'
+
+    def handle(self, *args, **options):
+        if not user_index_available():
+            self.stdout.write(
+                self.style.WARNING('User search index table not found; searches use icontains. Run migrations first.')
+            )
+            return
+        indexed = rebuild_user_index()
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {indexed} users')
+        )
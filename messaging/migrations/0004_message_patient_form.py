@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_patientform_uploaded_idx'),
+        ('messaging', '0003_remove_conversation_patient_form'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='is_physician_decision',
+            field=models.BooleanField(default=False, help_text='Message records a physician decision on the linked form'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='patient_form',
+            field=models.ForeignKey(blank=True, help_text='Patient form this message is about', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='dashboard.patientform'),
+        ),
+    ]
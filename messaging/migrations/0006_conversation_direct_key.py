@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_message_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='direct_key',
+            field=models.CharField(blank=True, help_text='Ordered participant id pair of a one-to-one conversation; empty for group conversations', max_length=41, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated manually on 2026-10-18 for the user directory FTS5 search index
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_user_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE messaging_user_fts "
+            "USING fts5(username, full_name, role, tokenize='trigram')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5 or the trigram tokenizer (3.34+); searches fall back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO messaging_user_fts (rowid, username, full_name, role) "
+        "SELECT u.id, u.username, trim(u.first_name || ' ' || u.last_name), "
+        "CASE p.role WHEN 'administrator' THEN 'Administrator' "
+        "WHEN 'screening_physician' THEN 'Screening Physician' ELSE '' END "
+        "FROM auth_user u LEFT JOIN accounts_userprofile p ON p.user_id = u.id"
+    )
+
+
+def drop_user_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS messaging_user_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('messaging', '0006_conversation_direct_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_user_index, drop_user_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated manually on 2026-10-18 for the message content FTS5 search index
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_message_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE messaging_message_fts "
+            "USING fts5(content, tokenize='porter unicode61')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5; searches fall back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO messaging_message_fts (rowid, content) SELECT id, content FROM messaging_message"
+    )
+
+
+def drop_message_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS messaging_message_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_user_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_message_index, drop_message_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0018_patientform_status_changed_at'),
+        ('messaging', '0008_message_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhysicianDecision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decision', models.CharField(choices=[('accept', 'Accept'), ('reject', 'Reject'), ('review', 'Needs Review')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('message', models.OneToOneField(blank=True, help_text='Message that announced the decision', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='physician_decision', to='messaging.message')),
+                ('patient_form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='physician_decisions', to='dashboard.patientform')),
+                ('physician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='physician_decisions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['patient_form', 'created_at'], name='decision_form_idx'), models.Index(fields=['physician', 'created_at'], name='decision_physician_idx')],
+            },
+        ),
+    ]
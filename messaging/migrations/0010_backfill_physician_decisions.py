@@ -0,0 +1,91 @@
+# Generated manually on 2026-10-18 to record past physician decisions as PhysicianDecision rows
+
+import re
+from bisect import bisect_right
+
+from django.db import migrations
+
+# Decision keywords as the messaging views wrote them into decision messages
+DECISION_MARKERS = [
+    ('PHYSICIAN DECISION: NEEDS REVIEW', 'review'),
+    ('PHYSICIAN DECISION: ACCEPT', 'accept'),
+    ('PHYSICIAN DECISION: REJECT', 'reject'),
+]
+
+# Phrases the messaging views used to name the patient form, as in link_messages_to_forms
+FORM_REFERENCE_PATTERNS = [
+    re.compile(r'patient form:\s*([^,\n]+)', re.IGNORECASE),
+    re.compile(r'PATIENT CASE:\s*([^\n]+)'),
+    re.compile(r'patient form for "([^"\n]+)"', re.IGNORECASE),
+]
+
+
+def load_form_names(PatientForm):
+    """Map each lower-cased patient name to its forms' (uploaded_at, id) pairs in upload order"""
+    forms_by_name = {}
+    rows = PatientForm.objects.order_by('uploaded_at', 'id').values_list(
+        'id', 'patient_name', 'extracted_patient_name', 'uploaded_at'
+    )
+    for form_id, patient_name, extracted_name, uploaded_at in rows.iterator():
+        for name in {patient_name, extracted_name}:
+            if name:
+                forms_by_name.setdefault(name.strip().lower(), []).append((uploaded_at, form_id))
+    return forms_by_name
+
+
+def named_form(message, forms_by_name):
+    """Return the id of the newest form named in message that was uploaded before it was sent"""
+    for pattern in FORM_REFERENCE_PATTERNS:
+        match = pattern.search(message.content)
+        candidates = forms_by_name.get(match.group(1).strip().lower()) if match else None
+        if not candidates:
+            continue
+        position = bisect_right(candidates, (message.created_at, float('inf')))
+        if position:
+            return candidates[position - 1][1]
+    return None
+
+
+def record_past_decisions(apps, schema_editor):
+    # Decision messages sent before messages were linked to forms only name the
+    # patient in their text, so the form is resolved here rather than relying on
+    # link_messages_to_forms having run first
+    Message = apps.get_model('messaging', 'Message')
+    PatientForm = apps.get_model('dashboard', 'PatientForm')
+    PhysicianDecision = apps.get_model('messaging', 'PhysicianDecision')
+    forms_by_name = load_form_names(PatientForm)
+    decisions = []
+    linked = []
+    messages = Message.objects.filter(content__icontains='PHYSICIAN DECISION:').only(
+        'id', 'sender_id', 'patient_form_id', 'is_physician_decision', 'content', 'created_at'
+    )
+    for message in messages.iterator():
+        content = message.content.upper()
+        decision = next((value for marker, value in DECISION_MARKERS if marker in content), None)
+        form_id = message.patient_form_id or named_form(message, forms_by_name)
+        if not decision or form_id is None:
+            continue
+        if (message.patient_form_id, message.is_physician_decision) != (form_id, True):
+            message.patient_form_id = form_id
+            message.is_physician_decision = True
+            linked.append(message)
+        decisions.append(PhysicianDecision(
+            patient_form_id=form_id,
+            physician_id=message.sender_id,
+            decision=decision,
+            message_id=message.id,
+            created_at=message.created_at,
+        ))
+    Message.objects.bulk_update(linked, ['patient_form', 'is_physician_decision'], batch_size=500)
+    PhysicianDecision.objects.bulk_create(decisions, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_physiciandecision'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_past_decisions, migrations.RunPython.noop),
+    ]
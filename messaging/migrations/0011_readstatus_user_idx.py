@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_backfill_physician_decisions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Build the composite index before dropping the single-column one it replaces
+        migrations.AddIndex(
+            model_name='messagereadstatus',
+            index=models.Index(fields=['user', 'message'], name='readstatus_user_idx'),
+        ),
+        migrations.AlterField(
+            model_name='messagereadstatus',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
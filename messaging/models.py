@@ -1,17 +1,34 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from dashboard.home_cache import bump_context_version_on_commit
+from .search import index_messages, index_users, unindex_messages, unindex_users
 
 class Conversation(models.Model):
     """Model to represent a conversation between users"""
     participants = models.ManyToManyField(User, related_name='conversations')
     title = models.CharField(max_length=200, blank=True, null=True)
+    direct_key = models.CharField(
+        max_length=41,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Ordered participant id pair of a one-to-one conversation; empty for group conversations"
+    )
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-updated_at']
     
+    @staticmethod
+    def direct_key_for(user_id, other_user_id):
+        """Return the direct_key of the one-to-one conversation between two users"""
+        low, high = sorted([user_id, other_user_id])
+        return f"{low}:{high}"
+    
     def __str__(self):
         if self.title:
             return self.title
@@ -34,9 +51,22 @@ class Message(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
     edited_at = models.DateTimeField(null=True, blank=True)
+    patient_form = models.ForeignKey(
+        'dashboard.PatientForm',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='messages',
+        help_text="Patient form this message is about"
+    )
+    is_physician_decision = models.BooleanField(default=False, help_text="Message records a physician decision on the linked form")
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Conversation history is read a page at a time by (created_at, id) within a conversation
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}..."
@@ -47,14 +77,94 @@ class Message(models.Model):
             self.is_read = True
             self.save(update_fields=['is_read'])
 
+class PhysicianDecision(models.Model):
+    """A screening physician's decision on a patient form, recorded with the status change it caused"""
+    DECISION_CHOICES = [
+        ('accept', 'Accept'),
+        ('reject', 'Reject'),
+        ('review', 'Needs Review'),
+    ]
+    # Form status each decision moves the form to
+    DECISION_STATUSES = {
+        'accept': 'approved',
+        'reject': 'rejected',
+        'review': 'pending',
+    }
+    
+    patient_form = models.ForeignKey('dashboard.PatientForm', on_delete=models.CASCADE, related_name='physician_decisions')
+    physician = models.ForeignKey(User, on_delete=models.CASCADE, related_name='physician_decisions')
+    decision = models.CharField(max_length=10, choices=DECISION_CHOICES)
+    message = models.OneToOneField(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='physician_decision',
+        help_text="Message that announced the decision"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['patient_form', 'created_at'], name='decision_form_idx'),
+            models.Index(fields=['physician', 'created_at'], name='decision_physician_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.physician.username}: {self.get_decision_display()} on form #{self.patient_form_id}"
+
 class MessageReadStatus(models.Model):
     """Model to track which messages have been read by which users"""
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='read_statuses')
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Lookups by user are served by readstatus_user_idx
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     read_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         unique_together = ['message', 'user']
+        indexes = [
+            # A user's receipts, answered from the index alone when only message ids are needed
+            models.Index(fields=['user', 'message'], name='readstatus_user_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} read: {self.message.content[:30]}..."
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=MessageReadStatus)
+def invalidate_home_context_on_create(sender, created, **kwargs):
+    """New messages and read receipts change the unread summary on the dashboard"""
+    if created:
+        bump_context_version_on_commit()
+
+@receiver(post_delete, sender=Message)
+def invalidate_home_context_on_delete(sender, **kwargs):
+    """Deleted messages can change the unread summary on the dashboard"""
+    bump_context_version_on_commit()
+
+@receiver(post_save, sender=User)
+def update_user_index(sender, instance, **kwargs):
+    """Keep the user directory search index in step with saved users"""
+    index_users([instance])
+
+@receiver(post_save, sender='accounts.UserProfile')
+def update_user_index_role(sender, instance, **kwargs):
+    """A profile's role is part of its user's index entry"""
+    index_users([instance.user])
+
+@receiver(post_delete, sender=User)
+def remove_from_user_index(sender, instance, **kwargs):
+    """Drop deleted users from the user directory search index"""
+    unindex_users([instance.pk])
+
+@receiver(post_save, sender=Message)
+def update_message_index(sender, instance, **kwargs):
+    """Keep the message search index in step with saved messages"""
+    index_messages([instance])
+
+@receiver(post_delete, sender=Message)
+def remove_from_message_index(sender, instance, **kwargs):
+    """Drop deleted messages from the message search index"""
+    unindex_messages([instance.pk])
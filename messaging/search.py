@@ -0,0 +1,218 @@
+"""
+SQLite FTS5 search indexes over the user directory and message history.
+
+The messaging_user_fts table holds a trigram-tokenized copy of each user's
+username, full name and role label keyed by user id, so recipient autocomplete
+is answered from the index instead of an icontains scan of auth_user. Matches
+are ranked by bm25, with username and name prefix matches first. Signal
+handlers in messaging.models keep it in sync as users and profiles are saved;
+rebuild_user_index repairs it.
+
+Words shorter than three characters (the trigram size) and databases without
+FTS5 fall back to icontains.
+
+messaging_message_fts holds message content, tokenized into words with porter
+stemming, keyed by message id. search_messages joins it to the conversations
+the user takes part in and ranks hits by bm25 relevance discounted by age.
+Message signal handlers keep it in sync; bulk inserts call index_messages
+themselves.
+"""
+import html
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'messaging_user_fts'
+MESSAGE_FTS_TABLE = 'messaging_message_fts'
+MIN_TERM_LENGTH = 3
+# bm25 weights for the username, full_name and role columns
+COLUMN_WEIGHTS = (4.0, 2.0, 1.0)
+# Index matches ranked before prefix matches are moved to the front
+CANDIDATE_LIMIT = 50
+
+ROLE_LABELS = {
+    'administrator': 'Administrator',
+    'screening_physician': 'Screening Physician',
+}
+
+# Relevance points a message loses per day of age, so a month-old hit needs a clearly better match to win
+RECENCY_WEIGHT = 0.05
+# Control characters bracketing matched words in snippets, turned into <mark> tags after escaping
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+_available_tables = None
+
+
+def _table_available(table):
+    global _available_tables
+    if _available_tables is None:
+        _available_tables = set(connection.introspection.table_names()) if connection.vendor == 'sqlite' else set()
+    return table in _available_tables
+
+
+def user_index_available():
+    """Return True when the user FTS table exists on the default database"""
+    return _table_available(FTS_TABLE)
+
+
+def message_index_available():
+    """Return True when the message FTS table exists on the default database"""
+    return _table_available(MESSAGE_FTS_TABLE)
+
+
+def user_role(user):
+    """Return the role label indexed for user, or '' when it has no profile"""
+    profile = getattr(user, 'profile', None)
+    return ROLE_LABELS.get(profile.role, '') if profile else ''
+
+
+def index_users(users):
+    """Add or refresh the index entries for users"""
+    if not users or not user_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(user.pk,) for user in users])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, username, full_name, role) VALUES (%s, %s, %s, %s)",
+            [(user.pk, user.username, user.get_full_name(), user_role(user)) for user in users],
+        )
+
+
+def unindex_users(user_ids):
+    """Remove the index entries for the given user ids"""
+    if not user_ids or not user_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(user_id,) for user_id in user_ids])
+
+
+def rebuild_user_index():
+    """Repopulate the index from auth_user and accounts_userprofile and return the number of rows indexed"""
+    if not user_index_available():
+        return 0
+    role_label = ' '.join(f"WHEN '{role}' THEN '{label}'" for role, label in ROLE_LABELS.items())
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, username, full_name, role) "
+            f"SELECT u.id, u.username, trim(u.first_name || ' ' || u.last_name), "
+            f"CASE p.role {role_label} ELSE '' END "
+            f"FROM auth_user u LEFT JOIN accounts_userprofile p ON p.user_id = u.id"
+        )
+        return cursor.rowcount
+
+
+def search_users(query, exclude=None, limit=10):
+    """Return up to limit users matching every word of query, best match first"""
+    words = query.split()
+    if not words:
+        return []
+    users = User.objects.select_related('profile')
+    if exclude is not None:
+        users = users.exclude(id=exclude.id)
+
+    # Words too short for a trigram match are checked with icontains against the index's candidates
+    indexed = [word for word in words if len(word) >= MIN_TERM_LENGTH]
+    for word in words:
+        if word not in indexed or not user_index_available():
+            users = users.filter(
+                Q(username__icontains=word) | Q(first_name__icontains=word) | Q(last_name__icontains=word)
+            )
+
+    if indexed and user_index_available():
+        # Each quoted phrase of trigrams must appear somewhere in the row
+        match = ' '.join('"' + word.replace('"', '""') + '"' for word in indexed)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s",
+                [match, *COLUMN_WEIGHTS, CANDIDATE_LIMIT],
+            )
+            ranked_ids = [row[0] for row in cursor.fetchall()]
+        found = users.in_bulk(ranked_ids)
+        candidates = [found[user_id] for user_id in ranked_ids if user_id in found]
+    else:
+        candidates = list(users.order_by('username')[:CANDIDATE_LIMIT])
+
+    # Someone typing the start of a username or name usually means that person
+    prefix = words[0].lower()
+    candidates.sort(key=lambda user: (
+        not user.username.lower().startswith(prefix),
+        not (user.first_name.lower().startswith(prefix) or user.last_name.lower().startswith(prefix)),
+    ))
+    return candidates[:limit]
+
+
+def index_messages(messages):
+    """Add or refresh the index entries for messages"""
+    if not messages or not message_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {MESSAGE_FTS_TABLE} WHERE rowid = %s", [(message.pk,) for message in messages])
+        cursor.executemany(
+            f"INSERT INTO {MESSAGE_FTS_TABLE} (rowid, content) VALUES (%s, %s)",
+            [(message.pk, message.content) for message in messages],
+        )
+
+
+def unindex_messages(message_ids):
+    """Remove the index entries for the given message ids"""
+    if not message_ids or not message_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {MESSAGE_FTS_TABLE} WHERE rowid = %s", [(message_id,) for message_id in message_ids])
+
+
+def rebuild_message_index():
+    """Repopulate the message index from messaging_message and return the number of rows indexed"""
+    if not message_index_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {MESSAGE_FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {MESSAGE_FTS_TABLE} (rowid, content) SELECT id, content FROM messaging_message")
+        return cursor.rowcount
+
+
+def search_messages(user, query, limit=20):
+    """Return up to limit (message, snippet html) pairs from user's conversations matching query, best first.
+
+    Every word must match, as a word prefix. Without the FTS5 table the newest
+    icontains matches are returned with the start of each message as the snippet.
+    """
+    from .models import Message
+
+    words = [word for word in query.split() if any(char.isalnum() for char in word)]
+    if not words:
+        return []
+    messages = Message.objects.select_related('sender', 'conversation', 'physician_decision')
+
+    if not message_index_available():
+        matches = messages.filter(conversation__participants=user)
+        for word in words:
+            matches = matches.filter(content__icontains=word)
+        return [(message, html.escape(message.content[:200])) for message in matches.order_by('-created_at', '-id')[:limit]]
+
+    match = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT f.rowid, snippet({MESSAGE_FTS_TABLE}, 0, %s, %s, '…', 16) "
+            f"FROM {MESSAGE_FTS_TABLE} f "
+            f"JOIN messaging_message m ON m.id = f.rowid "
+            f"JOIN messaging_conversation_participants p ON p.conversation_id = m.conversation_id AND p.user_id = %s "
+            f"WHERE {MESSAGE_FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({MESSAGE_FTS_TABLE}) + (julianday('now') - julianday(m.created_at)) * %s "
+            f"LIMIT %s",
+            [SNIPPET_START, SNIPPET_END, user.id, match, RECENCY_WEIGHT, limit],
+        )
+        rows = cursor.fetchall()
+    found = messages.in_bulk([message_id for message_id, _ in rows])
+    return [
+        (found[message_id], highlight(snippet))
+        for message_id, snippet in rows if message_id in found
+    ]
+
+
+def highlight(snippet):
+    """Escape an FTS snippet and turn its match markers into <mark> tags"""
+    return html.escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
@@ -0,0 +1,368 @@
+"""
+Set-based messaging queries shared by the dashboard and messaging views.
+"""
+from django.db import IntegrityError, transaction
+from django.contrib.auth.models import User
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from dashboard.home_cache import bump_context_version_on_commit
+
+from .models import Conversation, Message, MessageReadStatus, PhysicianDecision
+from .search import index_messages
+
+# Messages returned per history request, and the most a client may ask for
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+def form_message_summaries(form_ids, user):
+    """Summarise the messages linked to each form in form_ids, as seen by user.
+
+    Returns a dict mapping form id to has_physician_decision, unread_count and
+    the conversation holding the latest message about the form. Forms without
+    messages from other users are left out. Runs a fixed number of queries
+    however many forms are requested.
+    """
+    rows = list(
+        Message.objects.filter(patient_form_id__in=form_ids)
+        .exclude(sender=user)
+        .order_by()
+        .values('patient_form_id')
+        .annotate(latest_id=Max('id'))
+    )
+    if not rows:
+        return {}
+    decided_forms = set(
+        PhysicianDecision.objects.filter(patient_form_id__in=[row['patient_form_id'] for row in rows])
+        .values_list('patient_form_id', flat=True)
+    )
+
+    latest_conversations = dict(
+        Message.objects.filter(id__in=[row['latest_id'] for row in rows]).values_list('id', 'conversation_id')
+    )
+    conversations = Conversation.objects.in_bulk(set(latest_conversations.values()))
+
+    # Unread messages are those from other users that have no read receipt for user
+    unread_counts = dict(
+        Message.objects.filter(conversation_id__in=conversations.keys())
+        .exclude(sender=user)
+        .exclude(read_statuses__user=user)
+        .order_by()
+        .values('conversation_id')
+        .annotate(unread=Count('id'))
+        .values_list('conversation_id', 'unread')
+    )
+
+    summaries = {}
+    for row in rows:
+        conversation_id = latest_conversations[row['latest_id']]
+        summaries[row['patient_form_id']] = {
+            'conversation': conversations[conversation_id],
+            'has_physician_decision': row['patient_form_id'] in decided_forms,
+            'unread_count': unread_counts.get(conversation_id, 0),
+        }
+    return summaries
+
+
+def inbox_conversations(user):
+    """Return user's conversations, newest first, annotated for the inbox listing.
+
+    Each conversation carries other_participant_id, last_message_id and
+    unread_count as correlated subqueries, so a page of them is one query
+    however many conversations the user has. Pass a page to
+    attach_inbox_details to load the participants and messages they refer to.
+    """
+    participants = Conversation.participants.through.objects.filter(conversation_id=OuterRef('pk'))
+    messages = Message.objects.filter(conversation_id=OuterRef('pk'))
+    unread = (
+        messages.filter(is_read=False)
+        .exclude(sender=user)
+        .order_by()
+        .values('conversation_id')
+        .annotate(unread=Count('id'))
+        .values('unread')
+    )
+    return Conversation.objects.filter(participants=user).annotate(
+        other_participant_id=Subquery(participants.exclude(user_id=user.id).order_by('id').values('user_id')[:1]),
+        last_message_id=Subquery(messages.order_by('-created_at', '-id').values('id')[:1]),
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+    ).order_by('-updated_at', '-id')
+
+
+def attach_inbox_details(conversations):
+    """Set other_participant and last_message on conversations from inbox_conversations, in two queries"""
+    conversations = list(conversations)
+    users = User.objects.in_bulk({conv.other_participant_id for conv in conversations} - {None})
+    last_messages = Message.objects.only('id', 'sender_id', 'content', 'created_at').in_bulk(
+        {conv.last_message_id for conv in conversations} - {None}
+    )
+    for conv in conversations:
+        conv.other_participant = users.get(conv.other_participant_id)
+        conv.last_message = last_messages.get(conv.last_message_id)
+    return conversations
+
+
+def inbox_totals(user):
+    """Return the unread message and contact counts shown above the inbox"""
+    return {
+        'total_unread': Message.objects.filter(conversation__participants=user, is_read=False)
+        .exclude(sender=user)
+        .count(),
+        'active_contacts': User.objects.filter(conversations__participants=user)
+        .exclude(id=user.id)
+        .distinct()
+        .count(),
+    }
+
+
+def unread_message_summary(user):
+    """Return (unread count, newest conversation with unread messages) for the dashboard home notice.
+
+    A message is unread when another participant sent it and user has no read
+    receipt for it. Counts are grouped per conversation in one query, so the
+    cost does not grow with the number of conversations.
+    """
+    unread_counts = dict(
+        Message.objects.filter(conversation__participants=user)
+        .exclude(sender=user)
+        .exclude(read_statuses__user=user)
+        .order_by()
+        .values('conversation_id')
+        .annotate(unread=Count('id'))
+        .values_list('conversation_id', 'unread')
+    )
+    if not unread_counts:
+        return 0, None
+    latest = Conversation.objects.filter(id__in=unread_counts).order_by('-updated_at', '-id').first()
+    return sum(unread_counts.values()), latest
+
+
+def get_or_create_direct_conversation(user, other_user, title=None):
+    """Return the one-to-one conversation between two users, creating it if needed, and whether it was created.
+
+    The lookup is a single get on the unique direct_key. Two workers racing to
+    create the same conversation both try to insert it; the loser's insert
+    fails on the unique constraint and it returns the winner's row instead.
+    """
+    key = Conversation.direct_key_for(user.id, other_user.id)
+    try:
+        return Conversation.objects.get(direct_key=key), False
+    except Conversation.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(direct_key=key, title=title)
+            conversation.participants.add(user, other_user)
+        return conversation, True
+    except IntegrityError:
+        return Conversation.objects.get(direct_key=key), False
+
+
+def mark_conversation_read(conversation, user, up_to_message_id=None):
+    """Mark the messages other participants sent in conversation as read by user.
+
+    Only messages up to and including up_to_message_id are marked when it is
+    given, so a client can acknowledge exactly what it has shown. Runs one
+    UPDATE, one SELECT and one INSERT however many messages are unread, and
+    returns the number of new read receipts.
+    """
+    received = Message.objects.filter(conversation=conversation).exclude(sender=user)
+    if up_to_message_id is not None:
+        received = received.filter(id__lte=up_to_message_id)
+
+    with transaction.atomic():
+        flagged = received.filter(is_read=False).update(is_read=True)
+        unreceipted = list(received.exclude(read_statuses__user=user).values_list('id', flat=True))
+        read_at = timezone.now()
+        # A concurrent request may have written some of these receipts already
+        MessageReadStatus.objects.bulk_create(
+            [MessageReadStatus(message_id=message_id, user=user, read_at=read_at) for message_id in unreceipted],
+            ignore_conflicts=True,
+        )
+
+    # bulk_create and update() skip the post_save signal that normally invalidates the dashboard
+    if flagged or unreceipted:
+        bump_context_version_on_commit()
+    return len(unreceipted)
+
+
+def message_history(conversation, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """Return up to limit of conversation's messages, oldest first, and whether more lie beyond them.
+
+    Messages come from just before message id `before`, just after message id
+    `after`, or from the end of the conversation when neither is given. The
+    range is read along the (conversation, created_at, id) index, so no page
+    costs more than another however long the thread is. Raises
+    Message.DoesNotExist if the anchor message is not in conversation.
+    """
+    messages = Message.objects.filter(conversation=conversation).select_related('sender', 'physician_decision')
+    if after is not None:
+        anchor = messages.get(id=after)
+        rows = list(
+            messages.filter(Q(created_at__gt=anchor.created_at) | Q(created_at=anchor.created_at, id__gt=anchor.id))
+            .order_by('created_at', 'id')[:limit + 1]
+        )
+        return rows[:limit], len(rows) > limit
+
+    if before is not None:
+        anchor = messages.get(id=before)
+        messages = messages.filter(Q(created_at__lt=anchor.created_at) | Q(created_at=anchor.created_at, id__lt=anchor.id))
+    # Walk backwards from the anchor, then restore display order
+    rows = list(messages.order_by('-created_at', '-id')[:limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
+
+
+def message_payload(message, user):
+    """Return the JSON representation of message as seen by user"""
+    decision = getattr(message, 'physician_decision', None)
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'sender': message.sender.get_full_name() or message.sender.username,
+        'sent_by_me': message.sender_id == user.id,
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+        'is_read': message.is_read,
+        'is_physician_decision': message.is_physician_decision,
+        'decision': decision.decision if decision else None,
+        'patient_form_id': message.patient_form_id,
+    }
+
+
+def notify_physicians_of_status_reversion(patient_form, old_status, admin_user, reverted_at=None):
+    """Tell every screening physician that admin_user reverted patient_form to pending.
+
+    Finds all of the admin's one-to-one conversations with physicians in one
+    query, creates the missing ones in bulk, and bulk-inserts one message per
+    physician, so the number of queries does not grow with the number of
+    physicians. Runs from the notify_status_reversion job rather than the
+    admin's request.
+    """
+    reverted_at = reverted_at or timezone.now()
+    physicians = list(User.objects.filter(profile__role='screening_physician').exclude(id=admin_user.id).only('id'))
+    if not physicians:
+        return 0
+    keys = {physician.id: Conversation.direct_key_for(admin_user.id, physician.id) for physician in physicians}
+    patient_name = patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'
+
+    with transaction.atomic():
+        conversations = dict(Conversation.objects.filter(direct_key__in=keys.values()).values_list('direct_key', 'id'))
+        missing = [key for key in keys.values() if key not in conversations]
+        if missing:
+            # A conversation created concurrently for the same pair is left alone by ignore_conflicts
+            Conversation.objects.bulk_create(
+                [Conversation(direct_key=key, title=f"Form Status Updates - {patient_name}") for key in missing],
+                ignore_conflicts=True,
+            )
+            conversations.update(Conversation.objects.filter(direct_key__in=missing).values_list('direct_key', 'id'))
+            Participant = Conversation.participants.through
+            Participant.objects.bulk_create(
+                [
+                    Participant(conversation_id=conversations[keys[physician.id]], user_id=user_id)
+                    for physician in physicians if keys[physician.id] in missing
+                    for user_id in (admin_user.id, physician.id)
+                ],
+                ignore_conflicts=True,
+            )
+
+        content = f"""ADMIN STATUS REVERSION NOTICE
+
+The status of patient form for "{patient_name}" has been reverted from {old_status.upper()} back to PENDING for re-evaluation.
+
+Please review this case again and provide your decision.
+
+Patient: {patient_name}
+Previous Status: {old_status.title()}
+New Status: Pending
+Reverted by: {admin_user.get_full_name() or admin_user.username}
+Time: {reverted_at.strftime('%Y-%m-%d %H:%M:%S')}
+
+This form is now available in your dashboard for review."""
+        notices = Message.objects.bulk_create([
+            Message(
+                conversation_id=conversations[keys[physician.id]],
+                sender=admin_user,
+                content=content,
+                patient_form=patient_form,
+                created_at=reverted_at,
+            )
+            for physician in physicians
+        ])
+        Conversation.objects.filter(id__in=conversations.values()).update(updated_at=timezone.now())
+        # bulk_create skips the post_save signals that index messages and invalidate the dashboard
+        index_messages(notices)
+
+    bump_context_version_on_commit()
+    return len(physicians)
+
+
+# Message text announcing each decision
+DECISION_MESSAGES = {
+    'accept': 'PHYSICIAN DECISION: ACCEPT\n\nForm has been reviewed and approved for processing.',
+    'reject': 'PHYSICIAN DECISION: REJECT\n\nForm requires attention or has issues that need to be addressed.',
+    'review': 'PHYSICIAN DECISION: NEEDS REVIEW\n\nForm requires additional review, keep patient status pending.',
+}
+
+
+def patient_case_header(patient_form):
+    """Return the banner that opens a message about patient_form"""
+    patient_name = patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'
+    header = f"📋 PATIENT CASE: {patient_name.upper()}\n"
+    header += f"📅 Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n\n"
+    return header
+
+
+def patient_case_details(patient_form):
+    """Return the case summary block appended to messages about patient_form"""
+    details = "\n\n--- PATIENT CASE DETAILS ---\n"
+    details += f"Patient: {patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'}\n"
+    details += f"Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n"
+    details += f"Current Status: {patient_form.get_status_display()}\n"
+    if patient_form.ai_decision:
+        details += f"AI Recommendation: {patient_form.get_ai_decision_display()}\n"
+    details += "--- END CASE DETAILS ---\n\n"
+    return details
+
+
+def record_physician_decision(physician, patient_form, decision, conversation, notes=''):
+    """Record physician's decision on patient_form, post it to conversation, and apply the status it implies.
+
+    The announcing message, the form's status change and the PhysicianDecision
+    row are written in one transaction, so none exists without the others.
+    Raises ValueError for an unknown decision or a cancelled form.
+    """
+    if decision not in PhysicianDecision.DECISION_STATUSES:
+        raise ValueError(f'Unknown decision: {decision}')
+
+    with transaction.atomic():
+        patient_form = type(patient_form).objects.select_for_update().get(pk=patient_form.pk)
+        if patient_form.status == 'cancelled':
+            raise ValueError('Cancelled forms cannot be modified')
+
+        content = patient_case_header(patient_form) + DECISION_MESSAGES[decision] + patient_case_details(patient_form)
+        if notes and not notes.startswith('PHYSICIAN DECISION:'):
+            content += f'\n\nAdditional Notes:\n{notes}'
+        message = Message.objects.create(
+            conversation=conversation,
+            sender=physician,
+            content=content,
+            patient_form=patient_form,
+            is_physician_decision=True,
+        )
+
+        new_status = PhysicianDecision.DECISION_STATUSES[decision]
+        if patient_form.status != new_status:
+            patient_form.status = new_status
+            patient_form.status_actor = physician
+            patient_form.save()
+
+        conversation.save(update_fields=['updated_at'])
+        return PhysicianDecision.objects.create(
+            patient_form=patient_form,
+            physician=physician,
+            decision=decision,
+            message=message,
+            created_at=message.created_at,
+        )
@@ -0,0 +1,23 @@
+"""
+Background job handlers for the messaging app (see dashboard.jobs).
+"""
+from datetime import datetime
+
+from django.contrib.auth.models import User
+
+from dashboard.jobs import register
+from dashboard.models import PatientForm
+
+from .services import notify_physicians_of_status_reversion
+
+
+@register('notify_status_reversion')
+def notify_status_reversion_job(payload):
+    """Send the status reversion notice for a form to every screening physician"""
+    form = PatientForm.objects.filter(pk=payload['form_id']).first()
+    admin_user = User.objects.filter(pk=payload['admin_id']).first()
+    if form is None or admin_user is None:
+        return
+    notify_physicians_of_status_reversion(
+        form, payload['old_status'], admin_user, reverted_at=datetime.fromisoformat(payload['reverted_at'])
+    )
@@ -1,3 +1,304 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from dashboard.jobs import autodiscover, claim_next, run_job
+from dashboard.models import Job, PatientForm
+
+from .management.commands.link_messages_to_forms import Command as LinkMessagesCommand
+from .models import Conversation, Message, MessageReadStatus, PhysicianDecision
+from .search import search_messages, search_users, user_index_available
+from .services import (
+    attach_inbox_details, get_or_create_direct_conversation, inbox_conversations, mark_conversation_read, message_payload,
+    notify_physicians_of_status_reversion,
+)
+
+
+def make_user(username, role=None):
+    user = User.objects.create_user(username, password='secret')
+    if role:
+        user.profile.role = role
+        user.profile.save()
+    return user
+
+
+def make_conversation(*users):
+    conversation = Conversation.objects.create()
+    conversation.participants.add(*users)
+    return conversation
+
+
+def send(conversation, sender, count=1, content='Please review'):
+    return [Message.objects.create(conversation=conversation, sender=sender, content=content) for _ in range(count)]
+
+
+class LinkMessagesToFormsTests(SimpleTestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.command = LinkMessagesCommand()
+        self.forms_by_name = {'jane roe': [(self.now - timedelta(days=2), 1), (self.now + timedelta(days=1), 2)]}
+
+    def message(self, sent_at):
+        return Message(content='Regarding patient form: Jane Roe', created_at=sent_at)
+
+    def test_links_the_newest_form_uploaded_before_the_message(self):
+        self.assertEqual(self.command.match_form(self.message(self.now), self.forms_by_name), 1)
+
+    def test_leaves_messages_sent_before_every_named_form_unlinked(self):
+        message = self.message(self.now - timedelta(days=3))
+        self.assertIsNone(self.command.match_form(message, self.forms_by_name))
+
+
+class BackfillPhysicianDecisionsTests(TestCase):
+    def test_unlinked_decision_messages_are_matched_to_forms_by_their_text(self):
+        backfill = import_module('messaging.migrations.0010_backfill_physician_decisions')
+        physician = User.objects.create_user('physician', password='secret')
+        conversation = Conversation.objects.create()
+        form = PatientForm.objects.create(uploaded_file='patient_forms/form.pdf', patient_name='Jane Roe')
+        message = Message.objects.create(
+            conversation=conversation,
+            sender=physician,
+            content='📋 PATIENT CASE: JANE ROE\n\nPHYSICIAN DECISION: REJECT\n\nForm requires attention.',
+        )
+
+        backfill.record_past_decisions(apps, None)
+
+        decision = PhysicianDecision.objects.get()
+        self.assertEqual((decision.patient_form_id, decision.message_id, decision.decision), (form.pk, message.pk, 'reject'))
+        message.refresh_from_db()
+        self.assertEqual((message.patient_form_id, message.is_physician_decision), (form.pk, True))
+
+
+class MessageSearchTests(TestCase):
+    def test_results_carry_their_decisions_without_extra_queries(self):
+        user = User.objects.create_user('physician', password='secret')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(user)
+        for content in ('Follow-up scan booked', 'Follow-up bloods booked'):
+            Message.objects.create(conversation=conversation, sender=user, content=content)
+
+        results = search_messages(user, 'booked')
+        self.assertEqual(len(results), 2)
+        with self.assertNumQueries(0):
+            for message, _ in results:
+                message_payload(message, user)
+
+
+class MarkConversationReadTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', password='secret')
+        self.sender = User.objects.create_user('sender', password='secret')
+        self.conversation = make_conversation(self.reader, self.sender)
+
+    def mark_read(self, up_to_message_id=None):
+        with CaptureQueriesContext(connection) as queries:
+            marked = mark_conversation_read(self.conversation, self.reader, up_to_message_id)
+        return marked, len(queries)
+
+    def test_queries_do_not_grow_with_unread_messages(self):
+        send(self.conversation, self.sender, 2)
+        few_marked, few_queries = self.mark_read()
+        send(self.conversation, self.sender, 20)
+        many_marked, many_queries = self.mark_read()
+        self.assertEqual((few_marked, many_marked), (2, 20))
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(self.mark_read()[0], 0)
+
+    def test_only_other_participants_messages_up_to_the_given_one_are_marked(self):
+        first, second, third = send(self.conversation, self.sender, 3)
+        send(self.conversation, self.reader)
+        self.assertEqual(self.mark_read(up_to_message_id=second.id)[0], 2)
+        self.assertEqual(
+            set(MessageReadStatus.objects.filter(user=self.reader).values_list('message_id', flat=True)), {first.id, second.id}
+        )
+        self.assertEqual(list(Message.objects.filter(is_read=False, sender=self.sender)), [third])
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='secret')
+        self.client.force_login(self.user)
+
+    def add_contact(self, name, unread):
+        contact = User.objects.create_user(name, password='secret')
+        conversation = make_conversation(self.user, contact)
+        send(conversation, contact, unread, content=f'Hello from {name}')
+        return conversation
+
+    def inbox_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/messages/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_inbox_queries_do_not_grow_with_conversations(self):
+        self.add_contact('alice', 1)
+        few, _ = self.inbox_queries()
+        for index in range(5):
+            self.add_contact(f'contact{index}', 2)
+        many, response = self.inbox_queries()
+        self.assertEqual(few, many)
+        self.assertEqual((response.context['total_unread'], response.context['active_contacts']), (11, 6))
+
+    def test_conversations_carry_their_contact_preview_and_unread_count(self):
+        older = self.add_contact('alice', 1)
+        newer = self.add_contact('bob', 3)
+        send(older, self.user, content='My reply')
+        Conversation.objects.filter(pk=older.pk).update(updated_at=timezone.now())
+
+        rows = attach_inbox_details(inbox_conversations(self.user))
+        self.assertEqual(
+            [(row.pk, row.other_participant.username, row.last_message.content, row.unread_count) for row in rows],
+            [(older.pk, 'alice', 'My reply', 1), (newer.pk, 'bob', 'Hello from bob', 3)],
+        )
+
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='secret')
+        self.conversation = make_conversation(self.user)
+        now = timezone.now()
+        self.messages = send(self.conversation, self.user, 7)
+        # Two messages share a timestamp, so the id breaks the tie
+        for index, message in enumerate(self.messages):
+            Message.objects.filter(pk=message.pk).update(created_at=now + timedelta(seconds=min(index, 5)))
+        self.ids = [message.id for message in self.messages]
+        self.client.force_login(self.user)
+
+    def history(self, **params):
+        response = self.client.get(f'/messages/conversation/{self.conversation.pk}/messages/', params)
+        data = response.json() if response['Content-Type'] == 'application/json' else {}
+        return response.status_code, [message['id'] for message in data.get('messages', [])], data.get('has_more')
+
+    def test_pages_walk_back_and_forward_without_gaps(self):
+        self.assertEqual(self.history(limit=3), (200, self.ids[4:], True))
+        self.assertEqual(self.history(limit=3, before=self.ids[4]), (200, self.ids[1:4], True))
+        self.assertEqual(self.history(limit=3, before=self.ids[1]), (200, self.ids[:1], False))
+        self.assertEqual(self.history(limit=3, after=self.ids[4]), (200, self.ids[5:], False))
+
+    def test_bad_parameters_and_foreign_anchors_are_refused(self):
+        other = make_conversation(self.user)
+        foreign = send(other, self.user)[0]
+        self.assertEqual(self.history(before='x')[0], 400)
+        self.assertEqual(self.history(before=foreign.id)[0], 404)
+        outsider = User.objects.create_user('outsider', password='secret')
+        self.client.force_login(outsider)
+        self.assertEqual(self.history()[0], 404)
+
+
+class DirectConversationTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+
+    def test_either_participant_finds_the_same_conversation(self):
+        conversation, created = get_or_create_direct_conversation(self.alice, self.bob)
+        self.assertTrue(created)
+        self.assertEqual(get_or_create_direct_conversation(self.bob, self.alice), (conversation, False))
+        self.assertEqual(set(conversation.participants.all()), {self.alice, self.bob})
+
+    def test_the_loser_of_a_create_race_returns_the_winners_conversation(self):
+        winner, _ = get_or_create_direct_conversation(self.alice, self.bob)
+        # The loser looked the key up before the winner's row was committed
+        real_get = Conversation.objects.get
+        with mock.patch.object(Conversation.objects, 'get', side_effect=[Conversation.DoesNotExist, real_get(pk=winner.pk)]):
+            conversation, created = get_or_create_direct_conversation(self.bob, self.alice)
+        self.assertEqual((conversation, created), (winner, False))
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(winner.participants.count(), 2)
+
+    def test_backfill_keys_legacy_threads_and_merges_duplicates(self):
+        oldest = make_conversation(self.alice, self.bob)
+        duplicate = make_conversation(self.bob, self.alice)
+        moved = send(duplicate, self.bob)[0]
+        group = make_conversation(self.alice, self.bob, User.objects.create_user('carol', password='secret'))
+
+        call_command('backfill_direct_keys', '--merge', stdout=io.StringIO())
+        oldest.refresh_from_db()
+        self.assertEqual(oldest.direct_key, Conversation.direct_key_for(self.alice.id, self.bob.id))
+        self.assertFalse(Conversation.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(Message.objects.get(pk=moved.pk).conversation_id, oldest.pk)
+        self.assertIsNone(Conversation.objects.get(pk=group.pk).direct_key)
+        self.assertEqual(get_or_create_direct_conversation(self.bob, self.alice), (oldest, False))
+
+
+class StatusReversionNoticeTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin', 'administrator')
+        self.form = PatientForm.objects.create(uploaded_file='patient_forms/form.pdf', patient_name='Jane Roe', status='approved')
+
+    def add_physicians(self, count):
+        return [make_user(f'physician{User.objects.count()}', 'screening_physician') for _ in range(count)]
+
+    def notify(self):
+        with CaptureQueriesContext(connection) as queries:
+            notify_physicians_of_status_reversion(self.form, 'approved', self.admin)
+        return len(queries)
+
+    def test_reverting_a_decision_queues_the_notice_instead_of_sending_it(self):
+        physician = self.add_physicians(1)[0]
+        self.client.force_login(self.admin)
+        response = self.client.post('/update-form-status/', {'form_id': self.form.pk, 'status': 'pending'},
+                                    content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertFalse(Message.objects.exists())
+
+        autodiscover()
+        self.assertTrue(run_job(claim_next('worker-1')))
+        notice = Message.objects.get()
+        self.assertEqual((notice.sender, notice.patient_form_id), (self.admin, self.form.pk))
+        self.assertEqual(set(notice.conversation.participants.all()), {self.admin, physician})
+        self.assertFalse(Job.objects.filter(status='queued').exists())
+
+    def test_queries_do_not_grow_with_physicians_and_threads_are_reused(self):
+        existing = get_or_create_direct_conversation(self.admin, self.add_physicians(1)[0])[0]
+        # Each run finds some threads and creates the rest
+        self.add_physicians(1)
+        few = self.notify()
+        self.add_physicians(5)
+        many = self.notify()
+        self.assertEqual(few, many)
+        self.assertEqual(Conversation.objects.count(), 7)
+        self.assertEqual(existing.messages.count(), 2)
+        self.assertEqual(Message.objects.count(), 9)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.searcher = make_user('searcher', 'administrator')
+        self.jo = make_user('jsmith', 'screening_physician')
+        self.jo.first_name, self.jo.last_name = 'Jo', 'Smith'
+        self.jo.save()
+        self.anna = make_user('anna', 'administrator')
+        self.anna.last_name = 'Blacksmith'
+        self.anna.save()
+
+    def usernames(self, query):
+        return [user.username for user in search_users(query, exclude=self.searcher)]
+
+    def test_names_and_role_labels_match_through_the_index(self):
+        self.assertTrue(user_index_available())
+        self.assertEqual(self.usernames('SMITH'), ['jsmith', 'anna'])
+        self.assertEqual(self.usernames('physician'), ['jsmith'])
+        self.assertEqual(self.usernames('searcher'), [])
+
+    def test_words_shorter_than_a_trigram_narrow_the_index_matches(self):
+        self.assertEqual(self.usernames('jo smith'), ['jsmith'])
+        self.assertEqual(self.usernames('an'), ['anna'])
+
+    def test_profile_and_name_changes_are_searchable_at_once(self):
+        self.anna.profile.role = 'screening_physician'
+        self.anna.profile.save()
+        self.anna.first_name = 'Annabel'
+        self.anna.save()
+        self.assertEqual(set(self.usernames('physician')), {'jsmith', 'anna'})
+        self.assertEqual(self.usernames('annabel'), ['anna'])
@@ -6,6 +6,9 @@ app_name = 'messaging'
 urlpatterns = [
     path('', views.inbox, name='inbox'),
     path('conversation/<int:conversation_id>/', views.conversation_detail, name='conversation_detail'),
+    path('conversation/<int:conversation_id>/messages/', views.message_history_api, name='message_history'),
+    path('conversation/<int:conversation_id>/read/', views.mark_conversation_read_ajax, name='mark_conversation_read'),
+    path('search/', views.message_search_api, name='message_search'),
     path('start/', views.start_conversation, name='start_conversation'),
     path('send-message/', views.send_message_ajax, name='send_message_ajax'),
     path('search-users/', views.user_search_ajax, name='user_search_ajax'),
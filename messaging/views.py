@@ -3,44 +3,34 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db.models import Q, Count
+from django.urls import reverse
+from django.db.models import Q
 from django.utils import timezone
 from django.core.paginator import Paginator
-from .models import Conversation, Message, MessageReadStatus
+from .models import Conversation, Message
+from .services import (
+    HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE, attach_inbox_details, inbox_conversations, inbox_totals,
+    get_or_create_direct_conversation, mark_conversation_read, message_history, message_payload,
+    record_physician_decision,
+)
+from .search import search_messages, search_users, user_role
 from dashboard.models import PatientForm
+from dashboard.search import filter_forms_by_name
 import json
 import re
 
 @login_required
 def inbox(request):
     """Display user's conversations"""
-    conversations = Conversation.objects.filter(
-        participants=request.user
-    ).annotate(
-        unread_count=Count(
-            'messages',
-            filter=Q(
-                messages__is_read=False
-            ) & ~Q(messages__sender=request.user)
-        )
-    ).order_by('-updated_at')
-    
-    # Add other participant info to each conversation
-    for conv in conversations:
-        conv.other_participant = conv.get_other_participant(request.user)
-    
-    # Paginate conversations
-    paginator = Paginator(conversations, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Add other participant info to paginated conversations
-    for conv in page_obj:
-        conv.other_participant = conv.get_other_participant(request.user)
+    # Other participant, last message and unread count come from subqueries, not per-row lookups
+    paginator = Paginator(inbox_conversations(request.user), 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.object_list = attach_inbox_details(page_obj.object_list)
     
     context = {
         'conversations': page_obj,
-        'total_unread': sum(conv.unread_count for conv in conversations)
+        'total_conversations': paginator.count,
+        **inbox_totals(request.user),
     }
     return render(request, 'messaging/inbox.html', context)
 
@@ -54,71 +44,40 @@ def conversation_detail(request, conversation_id):
     )
     
     # Mark messages as read
-    unread_messages = conversation.messages.filter(
-        ~Q(sender=request.user),
-        is_read=False
-    )
-    for message in unread_messages:
-        message.mark_as_read()
-        MessageReadStatus.objects.get_or_create(
-            message=message,
-            user=request.user
-        )
+    mark_conversation_read(conversation, request.user)
+    
+    # Render the latest messages; older history is fetched from message_history_api as the user scrolls up
+    recent_messages, has_older = message_history(conversation)
     
-    # Get messages with pagination
-    messages_list = conversation.messages.select_related('sender').order_by('created_at')
-    paginator = Paginator(messages_list, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Physicians record decisions on the form this conversation is about
+    decision_form = None
+    if is_screening_physician(request.user):
+        decision_form = PatientForm.objects.filter(
+            id__in=conversation.messages.filter(patient_form__isnull=False)
+            .order_by('-created_at', '-id')
+            .values('patient_form_id')[:1]
+        ).first()
     
     # Handle new message submission
     if request.method == 'POST':
         content = request.POST.get('content', '').strip()
-        if content:
-            # Check if this is a physician decision and automatically add patient case info
-            enhanced_content = content
-            if (hasattr(request.user, 'profile') and 
-                request.user.profile.role == 'screening_physician' and
-                any(keyword in content.upper() for keyword in ['ACCEPT', 'REJECT', 'APPROVED', 'DENIED', 'DECISION'])):
-                
-                # Find the most recent pending patient form
+        decision = request.POST.get('decision', '')
+        if decision:
+            patient_form = selected_patient_form(request.POST.get('form_id'))
+            if not is_screening_physician(request.user) or patient_form is None:
+                messages.error(request, 'Open the decision from the patient form it is about.')
+            else:
                 try:
-                    patient_form = PatientForm.objects.filter(status='pending').order_by('-uploaded_at').first()
-                    if patient_form:
-                        patient_display_name = patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'
-                        case_header = f"📋 PATIENT CASE: {patient_display_name.upper()}\n"
-                        case_header += f"📅 Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n\n"
-                        
-                        # Add case details
-                        patient_case_info = f"\n\n--- PATIENT CASE DETAILS ---\n"
-                        patient_case_info += f"Patient: {patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'}\n"
-                        patient_case_info += f"Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n"
-                        patient_case_info += f"Current Status: {patient_form.get_status_display()}\n"
-                        if patient_form.ai_decision:
-                            patient_case_info += f"AI Recommendation: {patient_form.get_ai_decision_display()}\n"
-                        patient_case_info += "--- END CASE DETAILS ---\n\n"
-                        
-                        # Format as physician decision
-                        if 'PHYSICIAN DECISION:' not in content.upper():
-                            enhanced_content = case_header + f"PHYSICIAN DECISION: {content.upper()}\n\n"
-                            enhanced_content += f"Form has been reviewed with decision: {content}" + patient_case_info
-                        else:
-                            enhanced_content = case_header + content + patient_case_info
-                            
-                        # Update patient form status
-                        if any(keyword in content.upper() for keyword in ['ACCEPT', 'APPROVED']):
-                            patient_form.status = 'approved'
-                            patient_form.save()
-                        elif any(keyword in content.upper() for keyword in ['REJECT', 'DENIED']):
-                            patient_form.status = 'rejected'
-                            patient_form.save()
-                except:
-                    pass
-            
+                    record_physician_decision(request.user, patient_form, decision, conversation, notes=content)
+                    messages.success(request, 'Decision sent!')
+                except ValueError as e:
+                    messages.error(request, str(e))
+            return redirect('messaging:conversation_detail', conversation_id=conversation.id)
+        if content:
             Message.objects.create(
                 conversation=conversation,
                 sender=request.user,
-                content=enhanced_content
+                content=content,
             )
             conversation.updated_at = timezone.now()
             conversation.save()
@@ -129,7 +88,9 @@ def conversation_detail(request, conversation_id):
     
     context = {
         'conversation': conversation,
-        'messages': page_obj,
+        'messages': recent_messages,
+        'has_older_messages': has_older,
+        'decision_form': decision_form,
         'other_participant': conversation.get_other_participant(request.user)
     }
     return render(request, 'messaging/conversation_detail.html', context)
@@ -141,156 +102,86 @@ def start_conversation(request):
         username = request.POST.get('username', '').strip()
         initial_message = request.POST.get('message', '').strip()
         physician_decision = request.POST.get('physician_decision', '').strip()
+        patient_form = selected_patient_form(request.POST.get('form_id'))
         
-        # Extract patient case information from the initial message if it contains patient form reference
-        patient_case_info = ""
-        patient_form = None
-        if initial_message and 'patient form:' in initial_message.lower():
-            import re
+        if not patient_form and initial_message and 'patient form:' in initial_message.lower():
+            # Older links only name the patient; link the message to the newest form with that name
             patient_match = re.search(r'patient form: (.+?)(?:\n|$)', initial_message)
             if patient_match:
-                patient_name = patient_match.group(1).strip()
-                # Try to find the actual patient form
-                try:
-                    patient_form = PatientForm.objects.filter(
-                        Q(patient_name__icontains=patient_name) | 
-                        Q(extracted_patient_name__icontains=patient_name)
-                    ).order_by('-uploaded_at').first()
-                    
-                    if patient_form:
-                        patient_case_info = f"\n\n--- PATIENT CASE DETAILS ---\n"
-                        patient_case_info += f"Patient: {patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'}\n"
-                        patient_case_info += f"Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n"
-                        patient_case_info += f"Current Status: {patient_form.get_status_display()}\n"
-                        if patient_form.ai_decision:
-                            patient_case_info += f"AI Recommendation: {patient_form.get_ai_decision_display()}\n"
-                        patient_case_info += "--- END CASE DETAILS ---\n\n"
-                except:
-                    pass
-
-        # Build the final message with decision if provided
-        final_message = ""
-        
-        # Build admin/physician message
-        if physician_decision:
-            # If no patient form found from message, try to find the most recent pending form
-            if not patient_form:
-                try:
-                    patient_form = PatientForm.objects.filter(status='pending').order_by('-uploaded_at').first()
-                    if patient_form:
-                        patient_case_info = f"\n\n--- PATIENT CASE DETAILS ---\n"
-                        patient_case_info += f"Patient: {patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'}\n"
-                        patient_case_info += f"Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n"
-                        patient_case_info += f"Current Status: {patient_form.get_status_display()}\n"
-                        if patient_form.ai_decision:
-                            patient_case_info += f"AI Recommendation: {patient_form.get_ai_decision_display()}\n"
-                        patient_case_info += "--- END CASE DETAILS ---\n\n"
-                except:
-                    pass
-            
-            # Create a header with patient case information if available
-            case_header = ""
-            if patient_form:
-                patient_display_name = patient_form.patient_name or patient_form.extracted_patient_name or 'Unknown Patient'
-                case_header = f"📋 PATIENT CASE: {patient_display_name.upper()}\n"
-                case_header += f"📅 Submitted: {patient_form.uploaded_at.strftime('%B %d, %Y at %I:%M %p')}\n\n"
-            
-            decision_messages = {
-                'accept': 'PHYSICIAN DECISION: ACCEPT\n\nForm has been reviewed and approved for processing.',
-                'reject': 'PHYSICIAN DECISION: REJECT\n\nForm requires attention or has issues that need to be addressed.',
-                'review': 'PHYSICIAN DECISION: NEEDS REVIEW\n\nForm requires additional review, keep patient status pending.'
-            }
-            final_message = case_header + decision_messages.get(physician_decision, '')
-            
-            # Add detailed patient case information if available
-            if patient_case_info:
-                final_message = final_message + patient_case_info
-            
-            if initial_message and not initial_message.startswith('PHYSICIAN DECISION:'):
-                final_message += f'\n\nAdditional Notes:\n{initial_message}'
-        else:
-            # Handle regular messages (no decision, no patient case selected)
-            final_message = initial_message
+                patient_form = filter_forms_by_name(
+                    PatientForm.objects.all(), patient_match.group(1).strip()
+                ).order_by('-uploaded_at').first()
         
+        context = {'recipient_username': username, 'pre_message': initial_message, 'decision_form': patient_form}
         if not username:
             messages.error(request, 'Please provide a username.')
-            return render(request, 'messaging/start_conversation.html')
+            return render(request, 'messaging/start_conversation.html', context)
         
         # Get the user to message
         try:
             recipient = User.objects.get(username=username)
         except User.DoesNotExist:
             messages.error(request, f'User "{username}" not found.')
-            return render(request, 'messaging/start_conversation.html')
+            return render(request, 'messaging/start_conversation.html', context)
         
         if recipient == request.user:
             messages.error(request, 'You cannot send a message to yourself.')
-            return render(request, 'messaging/start_conversation.html')
+            return render(request, 'messaging/start_conversation.html', context)
         
-        # Check if conversation already exists
-        existing_conversation = Conversation.objects.filter(
-            participants=request.user
-        ).filter(
-            participants=recipient
-        ).annotate(
-            participant_count=Count('participants')
-        ).filter(
-            participant_count=2
-        ).first()
+        if physician_decision:
+            # Decisions only apply to a form chosen explicitly, never one guessed from the text
+            if not is_screening_physician(request.user) or not request.POST.get('form_id') or not patient_form:
+                messages.error(request, 'Open the decision from the patient form it is about.')
+                return render(request, 'messaging/start_conversation.html', context)
         
-        if existing_conversation:
-            # Add message to existing conversation
-            if final_message:
-                Message.objects.create(
-                    conversation=existing_conversation,
-                    sender=request.user,
-                    content=final_message
-                )
-                existing_conversation.updated_at = timezone.now()
-                existing_conversation.save()
-                
-                # Update patient form status if physician decision is made
-                if physician_decision and hasattr(request.user, 'profile') and request.user.profile.role == 'screening_physician':
-                    update_patient_form_status(final_message, physician_decision, patient_form)
-                    
-            success_msg = 'Decision sent!' if physician_decision else 'Message sent!'
-            messages.success(request, success_msg)
-            return redirect('messaging:conversation_detail', conversation_id=existing_conversation.id)
+        # One indexed lookup on the pair key finds or creates the conversation
+        conversation, created = get_or_create_direct_conversation(request.user, recipient)
         
-        # Create new conversation
-        conversation = Conversation.objects.create()
-        conversation.participants.add(request.user, recipient)
+        if physician_decision:
+            try:
+                record_physician_decision(request.user, patient_form, physician_decision, conversation, notes=initial_message)
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('messaging:conversation_detail', conversation_id=conversation.id)
+            messages.success(request, 'Decision sent!')
+            return redirect('messaging:conversation_detail', conversation_id=conversation.id)
         
         # Add initial message if provided
-        if final_message:
+        if initial_message:
             Message.objects.create(
                 conversation=conversation,
                 sender=request.user,
-                content=final_message
+                content=initial_message,
+                patient_form=patient_form,
             )
+            if not created:
+                conversation.updated_at = timezone.now()
+                conversation.save()
         
-        # Update patient form status if physician decision is made
-        if physician_decision and hasattr(request.user, 'profile') and request.user.profile.role == 'screening_physician':
-            update_patient_form_status(final_message, physician_decision, patient_form)
-        
-        success_msg = 'Decision sent!' if physician_decision else 'Conversation started!'
-        messages.success(request, success_msg)
+        messages.success(request, 'Conversation started!' if created else 'Message sent!')
         return redirect('messaging:conversation_detail', conversation_id=conversation.id)
     
-    # Get all users except current user for autocomplete
-    users = User.objects.exclude(id=request.user.id).order_by('username')
-    
-    # Handle pre-filled recipient and message from URL parameters
-    recipient_username = request.GET.get('recipient', '')
-    pre_message = request.GET.get('message', '')
-    
+    # Handle pre-filled recipient, message and form from URL parameters
     context = {
-        'users': users,
-        'recipient_username': recipient_username,
-        'pre_message': pre_message,
+        'recipient_username': request.GET.get('recipient', ''),
+        'pre_message': request.GET.get('message', ''),
+        'decision_form': selected_patient_form(request.GET.get('form')),
     }
     return render(request, 'messaging/start_conversation.html', context)
 
+
+def selected_patient_form(form_id):
+    """Return the PatientForm a request explicitly selected by id, or None"""
+    if not form_id or not str(form_id).isdigit():
+        return None
+    return PatientForm.objects.filter(id=form_id).first()
+
+
+def is_screening_physician(user):
+    """Return True when user may record physician decisions"""
+    return hasattr(user, 'profile') and user.profile.role == 'screening_physician'
+
+
 @login_required
 def send_message_ajax(request):
     """Send a message via AJAX"""
@@ -317,6 +208,8 @@ def send_message_ajax(request):
             
             conversation.updated_at = timezone.now()
             conversation.save()
+            # Replying means everything before the reply has been seen
+            mark_conversation_read(conversation, request.user, message.id)
             
             return JsonResponse({
                 'success': True,
@@ -333,74 +226,82 @@ def send_message_ajax(request):
     
     return JsonResponse({'success': False, 'error': 'Invalid request method.'})
 
+@login_required
+def message_history_api(request, conversation_id):
+    """Return a conversation's messages before or after a message id as JSON"""
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    try:
+        before = int(request.GET['before']) if request.GET.get('before') else None
+        after = int(request.GET['after']) if request.GET.get('after') else None
+        limit = min(max(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), 1), MAX_HISTORY_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid history parameters.'}, status=400)
+    
+    try:
+        history, has_more = message_history(conversation, before=before, after=after, limit=limit)
+    except Message.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Message not found.'}, status=404)
+    
+    return JsonResponse({
+        'success': True,
+        'messages': [message_payload(message, request.user) for message in history],
+        'has_more': has_more,
+    })
+
+@login_required
+def message_search_api(request):
+    """Search the messages of the user's conversations, most relevant and recent first"""
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'success': True, 'results': []})
+    
+    results = []
+    for message, snippet in search_messages(request.user, query):
+        result = message_payload(message, request.user)
+        result.update({
+            'snippet': snippet,
+            'conversation_title': message.conversation.title or '',
+            'url': reverse('messaging:conversation_detail', args=[message.conversation_id]),
+        })
+        results.append(result)
+    return JsonResponse({'success': True, 'results': results})
+
+@login_required
+def mark_conversation_read_ajax(request, conversation_id):
+    """Mark a conversation as read via AJAX, up to the message the client has shown"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method.'})
+    
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    try:
+        data = json.loads(request.body or '{}')
+        up_to_message_id = data.get('up_to_message_id')
+        up_to_message_id = int(up_to_message_id) if up_to_message_id is not None else None
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid message id.'})
+    
+    marked = mark_conversation_read(conversation, request.user, up_to_message_id)
+    return JsonResponse({'success': True, 'marked': marked})
+
 @login_required
 def user_search_ajax(request):
-    """Search for users via AJAX for autocomplete"""
+    """Search for users via AJAX for autocomplete, best matches first"""
     query = request.GET.get('q', '').strip()
     if len(query) < 2:
         return JsonResponse({'users': []})
     
-    users = User.objects.filter(
-        Q(username__icontains=query) | Q(first_name__icontains=query) | Q(last_name__icontains=query)
-    ).exclude(id=request.user.id)[:10]
+    users = search_users(query, exclude=request.user, limit=10)
     
     user_data = [{
         'id': user.id,
         'username': user.username,
-        'full_name': user.get_full_name() or user.username
+        'full_name': user.get_full_name() or user.username,
+        'role': user_role(user),
     } for user in users]
     
     return JsonResponse({'users': user_data})
 
 
-def update_patient_form_status(message_content, physician_decision, patient_form=None):
-    """Update patient form status based on physician decision"""
-    try:
-        # Use provided patient form if available, otherwise try to find it from message content
-        if not patient_form:
-            # Extract patient name from message content that contains "patient form:"
-            patient_name_match = re.search(r'patient form:\s*([^,\n]+)', message_content, re.IGNORECASE)
-            
-            if patient_name_match:
-                patient_name = patient_name_match.group(1).strip()
-                
-                # Find the most recent patient form with this name
-                patient_forms = PatientForm.objects.filter(
-                    Q(patient_name__icontains=patient_name) | 
-                    Q(extracted_patient_name__icontains=patient_name)
-                ).filter(status='pending').order_by('-uploaded_at')
-                
-                if patient_forms.exists():
-                    patient_form = patient_forms.first()
-        
-        if patient_form:
-            # Map physician decision to form status
-            status_mapping = {
-                'accept': 'approved',
-                'reject': 'rejected',
-                'review': 'pending'  # Keep as pending for review
-            }
-            
-            new_status = status_mapping.get(physician_decision)
-            if new_status:
-                patient_form.status = new_status
-                patient_form.save()
-                    
-        # If no specific patient form mentioned, try to find the most recent pending form
-        elif physician_decision in ['accept', 'reject']:
-            recent_form = PatientForm.objects.filter(status='pending').order_by('-uploaded_at').first()
-            if recent_form:
-                status_mapping = {
-                    'accept': 'approved',
-                    'reject': 'rejected'
-                }
-                recent_form.status = status_mapping[physician_decision]
-                recent_form.save()
-                
-    except Exception as e:
-        # Log error but don't fail the message sending
-        print(f"Error updating patient form status: {e}")
-
 @login_required
 def delete_message(request, message_id):
     """Delete a message (only sender can delete their own messages)"""
@@ -4,10 +4,13 @@ set -o errexit
 echo "Running migrations..."
 python manage.py migrate
 
+echo "Checking hot query plans..."
+python manage.py check_query_plans
+
+echo "Keying one-to-one conversations..."
+python manage.py backfill_direct_keys
+
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
-echo "Enabling previous_status functionality..."
-python manage.py enable_previous_status
-
 echo "Deploy script completed successfully!"
\ No newline at end of file
@@ -0,0 +1,16 @@
+#!/bin/bash
+set -o errexit
+
+bash release.sh
+
+# The job worker needs this instance's SQLite database and media files, so it
+# runs next to gunicorn rather than as a separate service. This loop restarts
+# it whenever it exits; jobs it was running are requeued once they go stale.
+(
+    while true; do
+        python manage.py run_worker || echo "Worker exited with status $?, restarting in 5 seconds..."
+        sleep 5
+    done
+) &
+
+exec gunicorn ttsh.asgi:application -k uvicorn_worker.UvicornWorker --bind 0.0.0.0:$PORT
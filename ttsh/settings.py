@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -85,6 +86,18 @@ DATABASES = {
 }
 
 
+# Cache
+# The file-based cache is shared by every gunicorn worker on the host, so a version
+# bump in one worker invalidates the cached dashboard contexts in all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ttsh-cache')),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -137,6 +150,18 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Hash uploads as they stream in so identical files can share storage (see dashboard.blobs)
+FILE_UPLOAD_HANDLERS = [
+    'dashboard.uploadhandlers.HashingMemoryFileUploadHandler',
+    'dashboard.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# Resumable chunked uploads are assembled here; keeping it on the media volume makes completing one a rename
+CHUNKED_UPLOAD_DIR = MEDIA_ROOT / 'upload_sessions'
+
+# Background processing
+# Callable that analyzes an uploaded PatientForm; run by `manage.py run_worker`
+FORM_ANALYZER = 'dashboard.processing.basic_form_analyzer'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field